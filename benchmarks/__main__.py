@@ -0,0 +1,25 @@
+"""
+Run benchmarks from root of repository:
+
+    python -m benchmarks
+    python -m benchmarks format_by_fragments queue --scale 0.1 --json
+"""
+from benchmarks.cases import run_benchmarks
+from benchmarks.runner import dump_results, format_results
+
+import argparse
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description='Benchmarks of telegram_logger.'
+    )
+    parser.add_argument('names', nargs='*', help='Run benchmarks which names start with these prefixes.')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of number of operations.')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+    args = parser.parse_args()
+    results = run_benchmarks(args.names, args.scale)
+    print(dump_results(results) if args.json else format_results(results))
+
+
+main()
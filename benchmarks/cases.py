@@ -0,0 +1,202 @@
+"""
+Benchmarks of formatter, splitter, handlers and queue.
+Records are made by factories from tests.helpers.
+"""
+from telegram_logger.formatters import (
+    TelegramHtmlFormatter, TelegramMarkdownV2Formatter, TelegramMarkupFormatter
+)
+from telegram_logger.handlers import TelegramHandler, TelegramMessageHandler, TelegramStreamHandler
+
+from benchmarks.runner import Result, measure
+from tests.helpers import BaseTest, MockResponse, TestException
+
+from functools import partial
+import logging
+import os
+from typing import Any, Callable, Dict, List, Type
+from unittest.mock import patch
+
+
+TOKEN = 'benchmark-token'
+# Sizes of tracebacks
+TRACEBACK_SIZES = {
+    '4kb': 4 * 1024,
+    '64kb': 64 * 1024,
+    '1mb': 1024 * 1024,
+}
+# Number of chats for handlers
+MANY_CHATS = 100
+# Number of producer threads for queue
+PRODUCERS = 8
+# Formatters which are compared, html is benchmarked without prefix in name.
+# Uncached formatter renders repeated traceback every time.
+FORMATTERS = {
+    '': TelegramHtmlFormatter,
+    'markdown_v2.': TelegramMarkdownV2Formatter,
+    'uncached.': partial(TelegramHtmlFormatter, traceback_cache_size=0),
+}  # type: Dict[str, Callable[[], TelegramMarkupFormatter]]
+
+
+class RecordFactory(BaseTest):
+    """
+    Factory of sample records.
+    """
+    def __init__(self) -> None:
+        self.setup()
+
+    def make_short_record(self) -> logging.LogRecord:
+        return self.create_record({'msg': 'Short message <b>%s</b>', 'args': ('arg',), 'exc_info': None})
+
+    def make_traceback_record(self, size: int) -> logging.LogRecord:
+        """
+        Make record with traceback of about size chars.
+        :param size: Size of traceback.
+        """
+        exc_info = self.get_exc_info(make_exception_type(size))
+        return self.create_record({'msg': 'Error', 'exc_info': exc_info})
+
+
+def make_exception_type(size: int) -> Type[Exception]:
+    """
+    Make exception type with text of given size, text has lines and chars to escape.
+    :param size: Size of text.
+    """
+    line = 'File "<module>", line 1, in <lambda>: value & "other" > limit\n'
+    text = (line * (size // len(line) + 1))[:size]
+
+    class BigException(TestException):
+        def __str__(self) -> str:
+            return text
+
+    return BigException
+
+
+def reset_cache(formatter: TelegramMarkupFormatter, record: logging.LogRecord) -> None:
+    """
+    Drop results of formatting, so record is formatted again.
+    """
+    formatter._cache = None
+    record.exc_text = None
+
+
+def bench_format(name: str, record: logging.LogRecord, number: int,
+                 formatter_class: Callable[[], TelegramMarkupFormatter]=TelegramHtmlFormatter) -> Result:
+    formatter = formatter_class()
+
+    def operation() -> None:
+        reset_cache(formatter, record)
+        formatter.format(record)
+
+    return measure(name, operation, number)
+
+
+def bench_format_by_fragments(
+        name: str, record: logging.LogRecord, number: int,
+        formatter_class: Callable[[], TelegramMarkupFormatter]=TelegramHtmlFormatter) -> Result:
+    formatter = formatter_class()
+
+    def operation() -> None:
+        reset_cache(formatter, record)
+        formatter.format_by_fragments(record)
+
+    return measure(name, operation, number)
+
+
+def bench_stream_handler(name: str, record: logging.LogRecord, number: int) -> Result:
+    with open(os.devnull, 'w') as stream:
+        handler = TelegramStreamHandler(list(range(MANY_CHATS)), TOKEN, stream=stream)
+
+        def operation() -> None:
+            reset_cache(handler.formatter, record)  # type: ignore
+            handler.emit(record)
+
+        return measure(name, operation, number)
+
+
+def bench_message_handler(name: str, record: logging.LogRecord, number: int,
+                          max_workers: int=1) -> Result:
+    handler = TelegramMessageHandler(list(range(MANY_CHATS)), TOKEN, max_workers=max_workers)
+    response = MockResponse(status_code=200, json={'ok': True})
+    try:
+        # Plain function instead of mock, mock keeps arguments of all calls
+        with patch.object(handler.session, 'post', new=lambda url, **kwargs: response):
+
+            def operation() -> None:
+                reset_cache(handler.formatter, record)  # type: ignore
+                handler.emit(record)
+
+            return measure(name, operation, number)
+    finally:
+        handler.close()
+
+
+def bench_enqueue(name: str, record: logging.LogRecord, number: int, **kwargs: Any) -> Result:
+    handler = TelegramHandler([1], TOKEN, **kwargs)
+    # Records are taken from queue but not sent
+    handler.handler.send_messages = lambda messages: None  # type: ignore
+    try:
+        return measure(name, lambda: handler.handle(record), number, threads=PRODUCERS)
+    finally:
+        handler.close()
+
+
+def get_benchmarks(scale: float=1.0) -> Dict[str, Callable[[], Result]]:
+    """
+    Return benchmarks by names.
+    :optional scale: Multiplier of number of operations, use small value for quick check.
+    """
+    factory = RecordFactory()
+
+    def number(value: int) -> int:
+        return max(1, int(value * scale))
+
+    short = factory.make_short_record()
+    benchmarks = {}  # type: Dict[str, Callable[[], Result]]
+    records = [('short', short, number(20000))]
+    operations = {'4kb': 2000, '64kb': 200, '1mb': 20}
+    for size_name, size in TRACEBACK_SIZES.items():
+        records.append((f'traceback_{size_name}', factory.make_traceback_record(size),
+                        number(operations[size_name])))
+    format_benchmarks = (('format', bench_format), ('format_by_fragments', bench_format_by_fragments))
+    for record_name, record, count in records:
+        for formatter_name, formatter_class in FORMATTERS.items():
+            for prefix, bench in format_benchmarks:
+                name = f'{prefix}.{formatter_name}{record_name}'
+                benchmarks[name] = (lambda name=name, bench=bench, record=record, count=count,
+                                    formatter_class=formatter_class:
+                                    bench(name, record, count, formatter_class))
+    traceback = records[1][1]
+    benchmarks.update({
+        f'stream_handler.emit.{MANY_CHATS}_chats': lambda: bench_stream_handler(
+            f'stream_handler.emit.{MANY_CHATS}_chats', traceback, number(200)
+        ),
+        f'message_handler.emit.{MANY_CHATS}_chats': lambda: bench_message_handler(
+            f'message_handler.emit.{MANY_CHATS}_chats', traceback, number(100)
+        ),
+        f'message_handler.emit.{MANY_CHATS}_chats.8_workers': lambda: bench_message_handler(
+            f'message_handler.emit.{MANY_CHATS}_chats.8_workers', traceback, number(100), max_workers=8
+        ),
+        f'queue.enqueue.{PRODUCERS}_producers': lambda: bench_enqueue(
+            f'queue.enqueue.{PRODUCERS}_producers', short, number(20000)
+        ),
+        'queue.enqueue.traceback_4kb': lambda: bench_enqueue(
+            'queue.enqueue.traceback_4kb', traceback, number(2000)
+        ),
+        'queue.enqueue.traceback_4kb.snapshot': lambda: bench_enqueue(
+            'queue.enqueue.traceback_4kb.snapshot', traceback, number(2000), prepare_mode='snapshot'
+        ),
+    })
+    return benchmarks
+
+
+def run_benchmarks(names: List[str], scale: float=1.0) -> List[Result]:
+    """
+    Run benchmarks which names start with one of given names, all if names are empty.
+    :param names: Prefixes of names of benchmarks.
+    :optional scale: Multiplier of number of operations.
+    """
+    benchmarks = get_benchmarks(scale)
+    return [
+        bench() for name, bench in benchmarks.items()
+        if not names or any(name.startswith(prefix) for prefix in names)
+    ]
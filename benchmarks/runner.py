@@ -0,0 +1,120 @@
+"""
+Runner of benchmarks, it measures throughput, latency and peak memory of operation.
+"""
+import json
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+
+class Result(object):
+    """
+    Result of benchmark.
+    """
+    def __init__(self, name: str, latencies: List[float], elapsed: float, peak_memory: int) -> None:
+        """
+        Initialization.
+        :param name: Name of benchmark.
+        :param latencies: Time of each operation in seconds.
+        :param elapsed: Time of all operations in seconds.
+        :param peak_memory: Peak size of memory allocated by one operation in bytes.
+        """
+        self.name = name
+        self.ops = len(latencies)
+        self.ops_per_sec = self.ops / elapsed if elapsed else 0.0
+        latencies = sorted(latencies)
+        self.p50 = get_percentile(latencies, 50)
+        self.p99 = get_percentile(latencies, 99)
+        self.peak_memory = peak_memory
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'ops': self.ops,
+            'ops_per_sec': self.ops_per_sec,
+            'p50': self.p50,
+            'p99': self.p99,
+            'peak_memory': self.peak_memory,
+        }
+
+
+def get_percentile(values: List[float], percent: float) -> float:
+    """
+    Return percentile of sorted values.
+    :param values: Sorted values.
+    :param percent: Percentile from 0 to 100.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+def measure(name: str, operation: Callable[[], Any], number: int, threads: int=1,
+            memory_number: int=5) -> Result:
+    """
+    Call operation number times in each thread and measure it.
+    Peak memory is measured in separate run, because tracing slows down operations.
+    :param name: Name of benchmark.
+    :param operation: Function which is measured.
+    :param number: Number of calls in each thread.
+    :optional threads: Number of threads which call operation at the same time.
+    :optional memory_number: Number of calls for measuring peak memory.
+    """
+    # Warm up caches and lazy imports
+    operation()
+    latencies = []  # type: List[float]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker() -> None:
+        local_latencies = []
+        clock = time.perf_counter
+        barrier.wait()
+        for _ in range(number):
+            start = clock()
+            operation()
+            local_latencies.append(clock() - start)
+        latencies.extend(local_latencies)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        for _ in range(memory_number):
+            operation()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(name, latencies, elapsed, peak_memory)
+
+
+def format_results(results: List[Result]) -> str:
+    """
+    Return table of results.
+    :param results: Results of benchmarks.
+    """
+    lines = [
+        f'{"benchmark":<45} {"ops":>8} {"ops/s":>12} {"p50, us":>10} {"p99, us":>10} {"peak, KiB":>10}'
+    ]
+    for result in results:
+        lines.append(
+            f'{result.name:<45} {result.ops:>8} {result.ops_per_sec:>12.1f} {result.p50 * 1e6:>10.1f} '
+            f'{result.p99 * 1e6:>10.1f} {result.peak_memory / 1024:>10.1f}'
+        )
+    return '\n'.join(lines)
+
+
+def dump_results(results: List[Result]) -> str:
+    """
+    Return results as JSON to compare runs.
+    :param results: Results of benchmarks.
+    """
+    return json.dumps([result.as_dict() for result in results], indent=2)
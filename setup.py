@@ -10,7 +10,7 @@ NAME = 'pyTelegramLogger'
 DESCRIPTION = 'This package provides handlers to send logging messages to telegram chats.'
 URL = 'https://github.com/V-ampire/pyTelegramLogger'
 AUTHOR = 'V-ampire'
-REQUIRES_PYTHON = '>=3.6.0'
+REQUIRES_PYTHON = '>=3.7.0'
 VERSION = None
 PROJECT_SLUG = 'telegram_logger'
 
@@ -21,7 +21,8 @@ REQUIRED = [
 
 # What packages are optional?
 EXTRAS = {
-    'dev': ['factory-boy', 'pytest', 'mypy', 'environs'],
+    'async': ['aiohttp'],
+    'dev': ['factory-boy', 'pytest', 'mypy', 'environs', 'aiohttp'],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -96,13 +97,15 @@ setup(
     author_email=EMAIL,
     python_requires=REQUIRES_PYTHON,
     url=URL,
-    packages=find_packages(exclude=["tests", "*.tests", "*.tests.*", "tests.*", "functional_tests"]),
+    packages=find_packages(
+        exclude=["tests", "benchmarks", "*.tests", "*.tests.*", "tests.*", "functional_tests"]
+    ),
     # If your package is a single module, use this instead of 'packages':
     # py_modules=['mypackage'],
 
-    # entry_points={
-    #     'console_scripts': ['mycli=mymodule:cli'],
-    # },
+    entry_points={
+        'console_scripts': ['telegram_logger=telegram_logger.collector:main'],
+    },
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -113,7 +116,6 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: Implementation :: CPython',
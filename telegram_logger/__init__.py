@@ -1,16 +1,40 @@
 import logging
+from typing import Any
 
 from .handlers import TelegramHandler, TelegramMessageHandler, TelegramStreamHandler
-from .formatters import TelegramHtmlFormatter
+from .formatters import TelegramHtmlFormatter, TelegramMarkdownV2Formatter
 
 from .__version__ import __version__
 
 
-# configure root logger
-root_logger = logging.getLogger()
-formatter = logging.Formatter('telegram_logger : %(levelname)s: %(module)s: %(message)s')
-handler = logging.StreamHandler()
-handler.setLevel(logging.INFO)
-handler.setFormatter(formatter)
-root_logger.setLevel(logging.INFO)
-root_logger.addHandler(handler)
+# Handlers which are imported on first access, their modules import asyncio and socketserver
+LAZY_HANDLERS = {
+    'AsyncTelegramHandler': 'telegram_logger.async_handlers',
+    'CollectorHandler': 'telegram_logger.collector',
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = LAZY_HANDLERS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    return getattr(importlib.import_module(module_name), name)
+
+
+def configure_root_logger(level: int=logging.INFO) -> logging.Handler:
+    """
+    Add handler which prints records to stderr to root logger.
+    Call it in application which doesn't configure logging itself.
+    :optional level: Level of root logger and handler.
+
+    :return: Added handler.
+    """
+    root_logger = logging.getLogger()
+    formatter = logging.Formatter('telegram_logger : %(levelname)s: %(module)s: %(message)s')
+    handler = logging.StreamHandler()
+    handler.setLevel(level)
+    handler.setFormatter(formatter)
+    root_logger.setLevel(level)
+    root_logger.addHandler(handler)
+    return handler
@@ -0,0 +1,4 @@
+from telegram_logger.collector import main
+
+
+main()
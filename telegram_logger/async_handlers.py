@@ -0,0 +1,237 @@
+from telegram_logger.breaker import CircuitBreaker
+from telegram_logger.formatters import TelegramHtmlFormatter
+from telegram_logger.handlers import MessageParamsMixin
+
+import asyncio
+from collections import deque
+import logging
+from typing import Any, Awaitable, Deque, Generator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Done(object):
+    """
+    Awaitable which is already done.
+    """
+    def __await__(self) -> Generator[Any, None, None]:
+        yield from ()
+
+
+class AsyncTelegramHandler(MessageParamsMixin, logging.Handler):
+    """
+    Handler for asyncio applications.
+    Records are put in asyncio queue without blocking and sent to telegram
+    by background task on running event loop using aiohttp.
+    Records emitted when there is no running event loop are kept and sent
+    when handler is started on a loop, only the last MAX_PENDING of them are kept.
+    Requires aiohttp: pip install pyTelegramLogger[async]
+    """
+    # Default max number of connections to telegram
+    DEFAULT_POOL_SIZE = 10
+    # Max number of records which are kept while there is no event loop for sending
+    MAX_PENDING = 1000
+
+    def __init__(self, *args, pool_size: int=DEFAULT_POOL_SIZE,
+                 connect_timeout: Optional[float]=MessageParamsMixin.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: Optional[float]=MessageParamsMixin.DEFAULT_READ_TIMEOUT,
+                 breaker_failures: int=0, breaker_cooldown: float=60.0,
+                 fallback_handler: Optional[logging.Handler]=None, **kwargs) -> None:
+        """
+        Initialization.
+        :optional pool_size: Max number of connections to telegram.
+        :optional connect_timeout: Max time in seconds to connect to telegram or proxy.
+        If None, it is not limited.
+        :optional read_timeout: Max time in seconds to wait response from telegram.
+        If None, it is not limited.
+        Circuit breaker parameters:
+        :optional breaker_failures: Requests to telegram are stopped after this number of
+        failed requests in a row, i.e. network errors, timeouts or 5xx responses.
+        If 0, requests are never stopped.
+        :optional breaker_cooldown: Time in seconds while requests are stopped, then one record
+        is sent as probe. If it is sent, then requests are sent again.
+        :optional fallback_handler: Handler which gets records while requests are stopped.
+        If None, records are dropped.
+        """
+        super().__init__(*args, **kwargs)
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = None  # type: Optional[CircuitBreaker]
+        if breaker_failures > 0:
+            self.breaker = CircuitBreaker(breaker_failures, breaker_cooldown)
+        self.fallback_handler = fallback_handler
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._queue = None  # type: Optional[asyncio.Queue]
+        self._worker = None  # type: Optional[asyncio.Task]
+        self._session = None  # type: Any
+        # Records emitted without running event loop
+        self._pending = deque(maxlen=self.MAX_PENDING)  # type: Deque[logging.LogRecord]
+        # Set default formatter
+        self.setFormatter(TelegramHtmlFormatter())
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Start background task which sends records to telegram.
+        Records kept while there was no event loop are sent first.
+        :param loop: Event loop for sending.
+        """
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        while self._pending:
+            self._queue.put_nowait(self._pending.popleft())
+        self._worker = loop.create_task(self._send_forever())
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Put record in queue without blocking.
+        Records from other threads are passed to event loop thread safely.
+        If there is no event loop, record is kept till handler is started.
+        :param record: Instance of log record.
+        """
+        try:
+            try:
+                running_loop = asyncio.get_running_loop()  # type: Optional[asyncio.AbstractEventLoop]
+            except RuntimeError:
+                running_loop = None
+            if self._loop is None or self._loop.is_closed():
+                if running_loop is None:
+                    self._pending.append(record)
+                    return
+                self.start(running_loop)
+            if running_loop is self._loop:
+                self._queue.put_nowait(record)  # type: ignore
+            else:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, record)  # type: ignore
+        except Exception:
+            self.handleError(record)
+
+    async def _send_forever(self) -> None:
+        """
+        Take records from queue and send them to telegram.
+        """
+        queue = self._queue
+        assert queue is not None
+        while True:
+            record = await queue.get()
+            try:
+                await self.send_record(record)
+            except Exception:
+                self.handleError(record)
+            finally:
+                queue.task_done()
+
+    async def send_record(self, record: logging.LogRecord) -> None:
+        """
+        Send record to all chats at the same time, fragments for each chat are sent in order.
+        While circuit breaker is open record is passed to fallback handler.
+        :param record: Instance of log record.
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            if self.fallback_handler is not None:
+                self.fallback_handler.handle(record)
+            return
+        fragments = self.get_fragments(record)
+
+        async def send_to_chat(chat_id: str) -> None:
+            for message in fragments:
+                await self.send_message(chat_id, message)
+
+        await asyncio.gather(*(send_to_chat(chat_id) for chat_id in self.chat_ids))
+
+    async def get_session(self) -> Any:
+        """
+        Return aiohttp session, create it on first call.
+        """
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=self.connect_timeout, sock_read=self.read_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    @property
+    def proxy(self) -> Optional[str]:
+        """
+        Proxy for aiohttp, it supports just one proxy url.
+        """
+        if self.proxies:
+            return self.proxies.get('https') or self.proxies.get('http')
+        return None
+
+    async def send_message(self, chat_id: str, text: str, parse_mode: Optional[str]=None) -> None:
+        """
+        Send message to telegram chat.
+        :param chat_id: Telegram chat ID
+        :param text: Text of message.
+        :param parse_mode: Message format.
+        """
+        import aiohttp
+
+        breaker = self.breaker
+        if breaker is not None and breaker.is_open:
+            # Telegram is not available, the rest messages of record are not sent
+            return
+        payload = self.get_payload(chat_id, text, parse_mode)
+        session = await self.get_session()
+        try:
+            async with session.post(self.url, data=payload, headers=self.JSON_HEADERS,
+                                    proxy=self.proxy) as response:
+                if breaker is not None:
+                    if response.status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                if response.status != 200:
+                    logger.warning(f'Request to telegram got error with code: {response.status}')
+                    logger.warning(f'Response is: {await response.text()}')
+                    return
+                self._process_response(chat_id, await response.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+
+    def flush(self) -> Awaitable[None]:  # type: ignore
+        """
+        Return awaitable which is done when all queued records are sent.
+        It is safe to call flush without awaiting, like logging.shutdown does.
+        """
+        if self._queue is None or self._loop is None or self._loop.is_closed():
+            return _Done()
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return _Done()
+        if running_loop is not self._loop:
+            return _Done()
+        return self._loop.create_task(self._queue.join())
+
+    async def aclose(self) -> None:
+        """
+        Send queued records, then stop background task and close connections.
+        """
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop background task without waiting queued records.
+        Use aclose to send queued records before closing.
+        """
+        if self._worker is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._worker.cancel)
+        super().close()
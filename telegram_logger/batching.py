@@ -0,0 +1,119 @@
+import functools
+import threading
+from typing import Any, Callable, List, Optional
+
+
+class MessageBatcher(object):
+    """
+    Pack formatted records into as few messages as possible.
+    Fragment of record is never split, so each message keeps html tags balanced
+    if fragments have them balanced.
+    Batch is flushed when message size reaches max_size, when number of records reaches
+    max_records or when the first record in batch waits longer than linger seconds.
+    Result of sending is reported to records which are added with callback done.
+    """
+    # Separator between records in message
+    SEPARATOR = '\n\n'
+
+    def __init__(self, send: Callable[[List[str], Callable[[bool], None]], Any], max_records: int,
+                 linger: float, max_size: int) -> None:
+        """
+        Initialization.
+        :param send: Function which sends list of messages and calls given function
+        with True if they were sent, it can be called later, e.g. after retry.
+        :param max_records: Max number of records in batch.
+        :param linger: Max time in seconds which record waits in batch.
+        :param max_size: Max size of one message.
+        """
+        self.send = send
+        self.max_records = max_records
+        self.linger = linger
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self._parts = []  # type: List[str]
+        self._size = 0
+        self._records = 0
+        self._timer = None  # type: Optional[threading.Timer]
+        # Records in batch which wait result of sending: [done, sent so far, unfinished messages]
+        self._waiting = []  # type: List[List[Any]]
+
+    def add(self, fragments: List[str], done: Optional[Callable[[bool], None]]=None) -> None:
+        """
+        Add fragments of one record to batch.
+        :param fragments: Formatted fragments of record.
+        :optional done: Function which takes True if record was sent, it is called when
+        all messages with fragments of record are sent.
+        """
+        with self.lock:
+            entry = None  # type: Optional[List[Any]]
+            for fragment in fragments:
+                if self._parts and self._size + len(self.SEPARATOR) + len(fragment) > self.max_size:
+                    self._send(entry)
+                if self._parts:
+                    self._size += len(self.SEPARATOR)
+                self._parts.append(fragment)
+                self._size += len(fragment)
+                if entry is None and done is not None:
+                    entry = [done, True, 1]
+                    self._waiting.append(entry)
+            self._records += 1
+            if self._records >= self.max_records:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.linger, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if entry is None and done is not None:
+            done(True)
+
+    def _send(self, adding: Optional[List[Any]]=None) -> None:
+        """
+        Send collected parts as one message, records in it are reported when it is sent.
+        :optional adding: Entry of record which is being added, it waits the next message too.
+        """
+        waiting = self._waiting
+        self._waiting = []
+        if adding is not None:
+            # The rest fragments of record are sent in the next message
+            adding[2] += 1
+            self._waiting.append(adding)
+        self.send([self._pop_message()], functools.partial(self._report_all, waiting))
+
+    def _report_all(self, waiting: List[List[Any]], sent: bool) -> None:
+        """
+        Report result of message to records in it.
+        """
+        for entry in waiting:
+            self._report(entry, sent)
+
+    def _report(self, entry: List[Any], sent: bool) -> None:
+        """
+        Report result to record when all its messages are finished.
+        """
+        with self.lock:
+            entry[1] = entry[1] and sent
+            entry[2] -= 1
+            if entry[2]:
+                return
+        entry[0](entry[1])
+
+    def _pop_message(self) -> str:
+        """
+        Join collected parts to message and clear them.
+        """
+        message = self.SEPARATOR.join(self._parts)
+        self._parts = []
+        self._size = 0
+        return message
+
+    def flush(self) -> None:
+        """
+        Send collected records.
+        """
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._records = 0
+            if self._parts:
+                self._send()
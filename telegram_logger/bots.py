@@ -0,0 +1,151 @@
+from telegram_logger.ratelimit import RateLimiter
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import zlib
+
+
+# Strategies of choosing bot for message
+# The same bot sends all messages to chat, chats are spread by consistent hashing
+HASH = 'hash'
+# Bots send messages in turn
+ROUND_ROBIN = 'round_robin'
+
+BOT_STRATEGIES = (HASH, ROUND_ROBIN)
+
+
+def get_bot_label(token: str, index: int) -> str:
+    """
+    Return label of bot for logs and metrics, it is ID of bot which is the part of token
+    before colon, so secret part of token is not exposed.
+    :param token: Telegram token.
+    :param index: Index of token, it is label if token has no ID.
+    """
+    bot_id, colon, _ = token.partition(':')
+    return bot_id if colon and bot_id else str(index)
+
+
+class Bot(object):
+    """
+    Bot which sends messages, it keeps its own rate state and health.
+    """
+    def __init__(self, token: str, label: str, rate_limiter: Optional[RateLimiter]=None) -> None:
+        """
+        Initialization.
+        :param token: Telegram token.
+        :param label: Label of bot for logs and metrics.
+        :optional rate_limiter: Limiter of messages of bot.
+        """
+        self.token = token
+        self.label = label
+        self.rate_limiter = rate_limiter
+        # Number of failed requests in a row
+        self.failures = 0
+        # Bot is not chosen till this time by clock of pool
+        self.paused_until = 0.0
+
+
+class BotPool(object):
+    """
+    Several bots which are members of the same chats.
+    Each bot has its own telegram limits, so throughput grows with number of bots.
+    Bot is paused when telegram asks to retry later or when it fails several times in a row,
+    messages are sent by other bots meanwhile.
+    """
+    def __init__(self, tokens: List[str], strategy: str=HASH, max_failures: int=3,
+                 cooldown: float=30.0,
+                 rate_limiter_factory: Optional[Callable[[], RateLimiter]]=None,
+                 clock: Callable[[], float]=time.monotonic) -> None:
+        """
+        Initialization.
+        :param tokens: Telegram tokens.
+        :optional strategy: How to choose bot for message, one of BOT_STRATEGIES.
+        :optional max_failures: Bot is paused after this number of failed requests in a row.
+        :optional cooldown: Time in seconds while failed bot is paused.
+        :optional rate_limiter_factory: Function which makes limiter for each bot.
+        If None, rate is not limited.
+        :optional clock: Function which returns current time in seconds.
+        """
+        if not tokens:
+            raise ValueError('At least one token is required')
+        if strategy not in BOT_STRATEGIES:
+            raise ValueError(f'Unknown bot strategy {strategy}, use one of {BOT_STRATEGIES}')
+        self.bots = [
+            Bot(token, get_bot_label(token, index),
+                rate_limiter_factory() if rate_limiter_factory else None)
+            for index, token in enumerate(tokens)
+        ]
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self._next = 0
+        self.lock = threading.Lock()
+
+    def _is_available(self, bot: Bot, now: float) -> bool:
+        return bot.paused_until <= now
+
+    def choose(self, chat_id: str) -> Bot:
+        """
+        Return bot which sends the next message to chat.
+        Paused bots are skipped, if all bots are paused then the one which is resumed first
+        is returned.
+        :param chat_id: Telegram chat ID
+        """
+        bots = self.bots
+        if len(bots) == 1:
+            return bots[0]
+        now = self.clock()
+        if self.strategy == HASH:
+            # Rendezvous hashing, chat moves to other bot only while its bot is paused
+            key = str(chat_id).encode('utf-8')
+            ranked = sorted(
+                bots, key=lambda bot: zlib.crc32(bot.token.encode('utf-8') + key), reverse=True
+            )
+        else:
+            with self.lock:
+                start = self._next
+                self._next = (start + 1) % len(bots)
+            ranked = bots[start:] + bots[:start]
+        for bot in ranked:
+            if self._is_available(bot, now):
+                return bot
+        return min(ranked, key=lambda bot: bot.paused_until)
+
+    def has_available(self) -> bool:
+        """
+        Check if any bot is not paused.
+        """
+        now = self.clock()
+        return any(self._is_available(bot, now) for bot in self.bots)
+
+    def report_success(self, bot: Bot) -> None:
+        """
+        Reset failures of bot after successful request.
+        :param bot: Bot which sent request.
+        """
+        bot.failures = 0
+
+    def report_failure(self, bot: Bot, retry_after: Optional[float]=None) -> None:
+        """
+        Count failed request of bot and pause bot if it is needed.
+        :param bot: Bot which sent request.
+        :optional retry_after: Delay required by telegram, bot is paused for it.
+        """
+        with self.lock:
+            now = self.clock()
+            if retry_after is not None:
+                bot.paused_until = max(bot.paused_until, now + retry_after)
+                return
+            bot.failures += 1
+            if bot.failures >= self.max_failures:
+                bot.failures = 0
+                bot.paused_until = max(bot.paused_until, now + self.cooldown)
+
+    def get_health(self) -> Dict[str, bool]:
+        """
+        Return True for bots which are not paused, by labels of bots.
+        """
+        now = self.clock()
+        return {bot.label: self._is_available(bot, now) for bot in self.bots}
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Callable
+
+
+# States of circuit breaker
+# Requests are sent
+CLOSED = 'closed'
+# Requests are not sent till cool-down period is over
+OPEN = 'open'
+# One probe request is sent, the others wait its result
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker which stops requests to telegram after several failures in a row.
+    When cool-down period is over, one probe is allowed. If it succeeds then requests are
+    sent again, otherwise breaker is open for one more cool-down period.
+    """
+    # Min time in seconds between checks of breaker while waiting
+    MIN_WAIT = 0.01
+
+    def __init__(self, max_failures: int=5, cooldown: float=60.0,
+                 clock: Callable[[], float]=time.monotonic,
+                 sleep: Callable[[float], None]=time.sleep) -> None:
+        """
+        Initialization.
+        :optional max_failures: Breaker opens after this number of failed requests in a row.
+        :optional cooldown: Time in seconds while breaker is open.
+        :optional clock: Function which returns current time in seconds.
+        :optional sleep: Function which sleeps given number of seconds.
+        """
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self.state = CLOSED
+        # Number of failed requests in a row
+        self.failures = 0
+        self.opened_at = 0.0
+        # Number of times breaker was opened
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Check if request can be sent.
+        The first call after cool-down period switches breaker to half open and returns True,
+        this caller sends probe. If probe has no result during cool-down period,
+        e.g. record was added to batch, then another probe is allowed.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = self.clock()
+            if now - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.opened_at = now
+                return True
+            return False
+
+    def get_delay(self) -> float:
+        """
+        Return how many seconds are left till probe can be sent, 0 if breaker is closed.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(self.opened_at + self.cooldown - self.clock(), 0.0)
+
+    def wait(self) -> None:
+        """
+        Wait till request can be sent.
+        """
+        while not self.allow():
+            self.sleep(max(self.get_delay(), self.MIN_WAIT))
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Check if requests must not be sent, probe is allowed only by method allow.
+        """
+        return self.state == OPEN
+
+    def record_success(self) -> None:
+        """
+        Close breaker after successful request.
+        """
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """
+        Count failed request, open breaker if there are too many failures or probe failed.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.max_failures):
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self.opened += 1
@@ -0,0 +1,193 @@
+from telegram_logger.bots import BOT_STRATEGIES, HASH
+from telegram_logger.formatters import TelegramHtmlFormatter, TelegramFormatter
+from telegram_logger.handlers import TelegramHandler
+from telegram_logger.spool import serialize_record, deserialize_record
+
+import argparse
+import copy
+import logging
+from logging.handlers import SocketHandler
+import os
+import signal
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+import struct
+import sys
+from typing import Any, Dict, List, Optional
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+
+# Default path of collector socket
+DEFAULT_SOCKET_PATH = '/tmp/telegram_logger.sock'
+# Frame is size of payload in 4 bytes big-endian followed by payload
+FRAME_HEADER = struct.Struct('>L')
+# Max size of payload, bigger frames close connection
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+class CollectorHandler(SocketHandler):
+    """
+    Handler which sends records to collector process through Unix socket.
+    Records are formatted in process of application and collector sends fragments as is,
+    so collector shares connections, rate limits, suppressing of duplicates and batching
+    between all processes of host.
+    Socket is opened on first record, so handler can be created before fork.
+    """
+    def __init__(self, path: str=DEFAULT_SOCKET_PATH) -> None:
+        """
+        Initialization.
+        :optional path: Path to Unix socket of collector.
+        """
+        super().__init__(path, None)
+        # Set default formatter
+        self.setFormatter(TelegramHtmlFormatter())
+
+    def get_fragments(self, record: logging.LogRecord) -> List[str]:
+        """
+        Format record to messages for telegram.
+        :param record: Instance of log record.
+        """
+        formatter = self.formatter
+        if formatter and isinstance(formatter, TelegramFormatter):
+            return formatter.format_by_fragments(record)
+        return [self.format(record)]
+
+    def makePickle(self, record: logging.LogRecord) -> bytes:
+        """
+        Make frame with formatted record. JSON is used instead of pickle,
+        so collector never unpickles data from socket.
+        :param record: Instance of log record.
+        """
+        record = copy.copy(record)
+        record.telegram_fragments = self.get_fragments(record)
+        payload = serialize_record(record)
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class CollectorRequestHandler(StreamRequestHandler):
+    """
+    Read frames from one client and pass records to handler of collector.
+    """
+    def handle(self) -> None:
+        while True:
+            header = self.rfile.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            size = FRAME_HEADER.unpack(header)[0]
+            if size > MAX_FRAME_SIZE:
+                logger.warning(f'Frame of {size} bytes is too big, connection is closed')
+                return
+            payload = self.rfile.read(size)
+            if len(payload) < size:
+                return
+            try:
+                record = deserialize_record(payload)
+            except (ValueError, TypeError, zlib.error):
+                logger.warning('Invalid frame, connection is closed')
+                return
+            self.server.handler.handle(record)  # type: ignore
+
+
+class TelegramCollector(ThreadingUnixStreamServer):
+    """
+    Server which gets formatted records from all processes of host and sends them to telegram
+    with one handler.
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, handler: logging.Handler) -> None:
+        """
+        Initialization.
+        Stale socket file from previous run is removed.
+        :param path: Path to Unix socket.
+        :param handler: Handler which sends records, usually TelegramHandler.
+        """
+        self.handler = handler
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, CollectorRequestHandler)
+
+    def server_close(self) -> None:
+        """
+        Close socket and remove socket file.
+        """
+        super().server_close()
+        try:
+            os.unlink(self.server_address)  # type: ignore
+        except OSError:
+            pass
+
+
+def make_parser() -> argparse.ArgumentParser:
+    """
+    Return parser of command line arguments of collector.
+    """
+    parser = argparse.ArgumentParser(
+        prog='telegram_logger',
+        description='Collect log records from local processes and send them to telegram.',
+    )
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Path to Unix socket.')
+    parser.add_argument('--token', default=os.environ.get('TELEGRAM_LOGGER_TOKEN'),
+                        help='Telegram token or comma separated tokens of several bots, '
+                             'default is environment variable TELEGRAM_LOGGER_TOKEN.')
+    parser.add_argument('--chat-id', dest='chat_ids', action='append', required=True,
+                        help='Telegram chat ID, can be repeated.')
+    parser.add_argument('--max-workers', type=int, default=1,
+                        help='Number of threads which send messages to different chats.')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Max number of records packed in one message.')
+    parser.add_argument('--batch-linger', type=float, default=1.0,
+                        help='Max time in seconds which record waits in batch.')
+    parser.add_argument('--rate-limit', action='store_true', help='Wait to not exceed telegram limits.')
+    parser.add_argument('--bot-strategy', choices=BOT_STRATEGIES, default=HASH,
+                        help='How to choose bot for message if there are several tokens.')
+    parser.add_argument('--dedup-window', type=float, default=None,
+                        help='Time in seconds while repeated records are suppressed.')
+    parser.add_argument('--spool-path', default=None,
+                        help='Path to SQLite file where records are kept till they are sent.')
+    parser.add_argument('--exit-timeout', type=float, default=TelegramHandler.DEFAULT_EXIT_TIMEOUT,
+                        help='Time in seconds to send queued records when collector stops.')
+    return parser
+
+
+def get_handler_kwargs(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Return parameters of TelegramHandler from command line arguments.
+    :param args: Parsed arguments.
+    """
+    return {
+        'max_workers': args.max_workers,
+        'batch_size': args.batch_size,
+        'batch_linger': args.batch_linger,
+        'rate_limit': args.rate_limit,
+        'bot_strategy': args.bot_strategy,
+        'dedup_window': args.dedup_window,
+        'spool_path': args.spool_path,
+        'exit_timeout': args.exit_timeout,
+    }
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """
+    Run collector till it gets SIGINT or SIGTERM.
+    :optional argv: Command line arguments, default is sys.argv.
+    """
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error('token is required')
+    logging.basicConfig(level=logging.INFO, format='telegram_logger : %(levelname)s: %(message)s')
+    tokens = [token.strip() for token in args.token.split(',') if token.strip()]
+    handler = TelegramHandler(args.chat_ids, tokens, **get_handler_kwargs(args))
+    server = TelegramCollector(args.socket, handler)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    logger.info(f'Collector is listening on {args.socket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        handler.close(args.exit_timeout)
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class _Window(object):
+    """
+    Window of duplicates of one record.
+    """
+    __slots__ = ('end', 'count', 'summary')
+
+    def __init__(self, end: float, summary: Dict[str, Any]) -> None:
+        self.end = end
+        self.count = 0
+        # Attributes of the first record to make summary
+        self.summary = summary
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    Filter which suppresses repeated records.
+    The first record passes and opens window, the same records are suppressed until
+    window closes, then summary with number of repeats is passed to handler.
+    Records are the same if they have the same logger name, level, function, line,
+    message template and exception type.
+    Number of tracked records is limited by max_keys, when it is exceeded the oldest window
+    is closed early.
+    """
+    # Message of summary record
+    SUMMARY_MESSAGE = '%s\n\nThis message was repeated %d times in %s seconds'
+
+    def __init__(self, handler: logging.Handler, window: float=60.0, max_keys: int=1000,
+                 clock: Callable[[], float]=time.monotonic) -> None:
+        """
+        Initialization.
+        :param handler: Handler which gets summaries.
+        :optional window: Time in seconds while repeated records are suppressed.
+        :optional max_keys: Max number of tracked records.
+        :optional clock: Function which returns current time in seconds.
+        """
+        super().__init__()
+        self.handler = handler
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        # Windows are ordered by time of closing
+        self._windows = OrderedDict()  # type: OrderedDict[Hashable, _Window]
+        self._timer = None  # type: Optional[threading.Timer]
+        self.lock = threading.Lock()
+
+    def get_key(self, record: logging.LogRecord) -> Tuple[Any, ...]:
+        """
+        Return key of record, records with the same key are duplicates.
+        Record from spool or collector has rendered message and no exception,
+        their template and type are taken from attributes telegram_template and telegram_exc_type.
+        :param record: Log record instance.
+        """
+        exc_type = record.exc_info[0] if record.exc_info else getattr(record, 'telegram_exc_type', None)
+        template = getattr(record, 'telegram_template', record.msg)
+        return (record.name, record.levelno, record.funcName, record.lineno, str(template), exc_type)
+
+    def filter(self, record: logging.LogRecord) -> bool:  # type: ignore
+        """
+        Pass the first record and summaries, suppress duplicates.
+        :param record: Log record instance.
+        """
+        if getattr(record, 'telegram_summary', False):
+            return True
+        key = self.get_key(record)
+        with self.lock:
+            now = self.clock()
+            summaries = self._close_windows(now)
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= self.max_keys:
+                    summaries.extend(self._close_window(self._windows.popitem(last=False)[1]))
+                self._windows[key] = _Window(now + self.window, self._get_summary_attrs(record))
+            else:
+                window.count += 1
+                self._start_timer(window.end - now)
+        for summary in summaries:
+            self.handler.handle(summary)
+        return window is None
+
+    def _get_summary_attrs(self, record: logging.LogRecord) -> Dict[str, Any]:
+        """
+        Return attributes of record to make summary, without exception, arguments
+        and fragments formatted before.
+        """
+        attrs = dict(record.__dict__)
+        attrs.update(msg=record.getMessage(), args=None, exc_info=None, exc_text=None)
+        attrs.pop('telegram_fragments', None)
+        return attrs
+
+    def _close_window(self, window: _Window) -> List[logging.LogRecord]:
+        """
+        Return summary of window if there were duplicates.
+        """
+        if not window.count:
+            return []
+        attrs = dict(window.summary)
+        attrs['msg'] = self.SUMMARY_MESSAGE % (attrs['msg'], window.count, self.window)
+        attrs['telegram_summary'] = True
+        return [logging.makeLogRecord(attrs)]
+
+    def _close_windows(self, now: float) -> List[logging.LogRecord]:
+        """
+        Close windows which ended, call it with acquired lock.
+        :return: Summaries of closed windows.
+        """
+        summaries = []  # type: List[logging.LogRecord]
+        while self._windows:
+            window = next(iter(self._windows.values()))
+            if window.end > now:
+                break
+            self._windows.popitem(last=False)
+            summaries.extend(self._close_window(window))
+        return summaries
+
+    def _start_timer(self, delay: float) -> None:
+        """
+        Start timer which sends summaries if no more records come, call it with acquired lock.
+        """
+        if self._timer is None:
+            self._timer = threading.Timer(max(delay, 0), self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        """
+        Send summaries of closed windows and restart timer for the next window with duplicates.
+        """
+        with self.lock:
+            self._timer = None
+            now = self.clock()
+            summaries = self._close_windows(now)
+            for window in self._windows.values():
+                if window.count:
+                    self._start_timer(window.end - now)
+                    break
+        for summary in summaries:
+            self.handler.handle(summary)
+
+    def flush(self) -> None:
+        """
+        Close all windows and send summaries.
+        """
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            summaries = []  # type: List[logging.LogRecord]
+            while self._windows:
+                summaries.extend(self._close_window(self._windows.popitem(last=False)[1]))
+        for summary in summaries:
+            self.handler.handle(summary)
@@ -0,0 +1,59 @@
+"""
+Exporter of metrics for Prometheus, it uses http.server from standard library.
+"""
+from telegram_logger.metrics import Metrics, format_prometheus
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from typing import Any, List, cast
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Return metrics in Prometheus text format on GET /metrics.
+    """
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        server = cast(MetricsExporter, self.server)
+        body = format_prometheus(server.metrics_list, server.prefix).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class MetricsExporter(ThreadingHTTPServer):
+    """
+    HTTP server which exports metrics for Prometheus, it runs in daemon thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics_list: List[Metrics], port: int, host: str='127.0.0.1',
+                 prefix: str='telegram_logger') -> None:
+        """
+        Initialization, server is started.
+        :param metrics_list: Metrics of handlers.
+        :param port: Port to listen, if 0 then free port is chosen.
+        :optional host: Host to listen.
+        :optional prefix: Prefix of names of metrics.
+        """
+        self.metrics_list = metrics_list
+        self.prefix = prefix
+        super().__init__((host, port), MetricsRequestHandler)
+        self.thread = threading.Thread(
+            target=self.serve_forever, name='telegram_logger_metrics', daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop server.
+        """
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,281 @@
+"""
+Local stand-in of Telegram Bot API for load and failure testing without network.
+It implements sendMessage and sendDocument and can add latency, limit rate of chats,
+return server errors and drop connections.
+
+Run it from command line:
+
+    python -m telegram_logger.fake_api --port 8081 --latency 0.05 --error-rate 0.01
+
+and pass api_url='http://127.0.0.1:8081' to handler.
+"""
+from telegram_logger.ratelimit import TokenBucket, CHAT_RATE, CHAT_BURST
+
+import argparse
+from contextlib import contextmanager
+import email
+import email.policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import math
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
+from urllib.parse import parse_qsl
+
+
+logger = logging.getLogger(__name__)
+
+
+class FakeBotApiRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handle request to bot api method.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = cast(FakeBotApi, self.server)
+        server.count('requests')
+        if server.latency or server.jitter:
+            time.sleep(server.latency + server.jitter * server.random.random())
+        if server.random.random() < server.drop_rate:
+            server.count('dropped')
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if server.random.random() < server.error_rate:
+            server.count('errors')
+            self.send_json(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+            return
+        parts = self.path.split('?')[0].split('/')
+        bot, method = (parts[1], parts[2]) if len(parts) == 3 else ('', '')
+        if server.token is not None and bot != f'bot{server.token}':
+            self.send_json(401, {'ok': False, 'error_code': 401, 'description': 'Unauthorized'})
+            return
+        if method not in server.METHODS:
+            self.send_json(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        params = self.parse_body(body)
+        if 'chat_id' not in params:
+            self.send_json(400, {
+                'ok': False, 'error_code': 400, 'description': 'Bad Request: chat_id is empty'
+            })
+            return
+        retry_after = server.take_chat_token(str(params['chat_id']), bot)
+        if retry_after:
+            server.count('rate_limited')
+            self.send_json(429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {retry_after}',
+                'parameters': {'retry_after': retry_after},
+            })
+            return
+        self.send_json(200, {'ok': True, 'result': server.receive(method, params, bot[3:])})
+
+    def parse_body(self, body: bytes) -> Dict[str, Any]:
+        """
+        Return parameters of request from JSON, urlencoded or multipart body.
+        Files of multipart body are returned as (filename, content).
+        :param body: Body of request.
+        """
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body.decode('utf-8'))
+        if content_type.startswith('multipart/form-data'):
+            message = email.message_from_bytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body, policy=email.policy.HTTP
+            )
+            params = {}  # type: Dict[str, Any]
+            parts = message.iter_parts()  # type: Any
+            for part in parts:
+                name = part.get_param('name', header='content-disposition')
+                content = part.get_payload(decode=True)
+                filename = part.get_filename()
+                params[name] = (filename, content) if filename else content.decode('utf-8')
+            return params
+        return dict(parse_qsl(body.decode('utf-8')))
+
+    def send_json(self, status: int, data: Dict[str, Any]) -> None:
+        """
+        Send JSON response.
+        :param status: Status code.
+        :param data: Data of response.
+        """
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format, *args)
+
+
+class FakeBotApi(ThreadingHTTPServer):
+    """
+    Fake Telegram Bot API server which keeps received messages and documents.
+    """
+    daemon_threads = True
+    # Implemented methods of bot api
+    METHODS = ('sendMessage', 'sendDocument')
+
+    def __init__(self, host: str='127.0.0.1', port: int=0, token: Optional[str]=None,
+                 latency: float=0.0, jitter: float=0.0, chat_rate: Optional[float]=None,
+                 chat_burst: float=CHAT_BURST, error_rate: float=0.0, drop_rate: float=0.0,
+                 seed: Optional[int]=None) -> None:
+        """
+        Initialization.
+        :optional host: Host to listen.
+        :optional port: Port to listen, if 0 then free port is chosen.
+        :optional token: Expected token of bot, if None then any token is accepted.
+        :optional latency: Delay of each response in seconds.
+        :optional jitter: Max random delay which is added to latency.
+        :optional chat_rate: Messages per second for one chat from one bot, if exceeded then 429
+        with retry_after is returned. If None, rate is not limited.
+        :optional chat_burst: How many messages can be sent to one chat at once.
+        :optional error_rate: Probability of response with 500 status.
+        :optional drop_rate: Probability of closing connection without response.
+        :optional seed: Seed of random errors and delays.
+        """
+        self.token = token
+        self.latency = latency
+        self.jitter = jitter
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.chat_buckets = {}  # type: Dict[Tuple[str, str], TokenBucket]
+        # Received messages and documents, i.e. parameters of successful requests with method
+        # and token of bot
+        self.received = []  # type: List[Dict[str, Any]]
+        # Number of requests, rate limited, errors and dropped connections
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'dropped': 0}
+        self.lock = threading.Lock()
+        super().__init__((host, port), FakeBotApiRequestHandler)
+
+    @property
+    def api_url(self) -> str:
+        """
+        Url to pass to handler as api_url.
+        """
+        host, port = cast(Tuple[str, int], self.server_address[:2])
+        return f'http://{host}:{port}'
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+    def take_chat_token(self, chat_id: str, bot: str='') -> int:
+        """
+        Take token of chat, each bot has its own limit for chat like in telegram.
+        :param chat_id: Telegram chat ID
+        :optional bot: Bot part of path of request.
+        :return: 0 if message can be sent, else retry_after in whole seconds like telegram.
+        """
+        if self.chat_rate is None:
+            return 0
+        key = (bot, chat_id)
+        with self.lock:
+            bucket = self.chat_buckets.get(key)
+            if bucket is None:
+                bucket = self.chat_buckets[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        delay = bucket.try_take()
+        return math.ceil(delay) if delay else 0
+
+    def receive(self, method: str, params: Dict[str, Any], token: str='') -> Dict[str, Any]:
+        """
+        Keep received message and return result of method.
+        :param method: Name of method.
+        :param params: Parameters of request.
+        :optional token: Token of bot which sent request.
+        """
+        with self.lock:
+            self.received.append(dict(params, method=method, token=token))
+            message_id = len(self.received)
+        result = {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': params['chat_id']}}
+        if 'text' in params:
+            result['text'] = params['text']
+        return result
+
+    def get_texts(self, chat_id: Any=None) -> List[str]:
+        """
+        Return texts of received messages.
+        :optional chat_id: Return messages of this chat only.
+        """
+        with self.lock:
+            messages = [params for params in self.received if params['method'] == 'sendMessage']
+        return [
+            params['text'] for params in messages
+            if chat_id is None or str(params['chat_id']) == str(chat_id)
+        ]
+
+    def get_documents(self) -> List[Tuple[str, bytes]]:
+        """
+        Return received documents as (filename, content).
+        """
+        with self.lock:
+            return [params['document'] for params in self.received if params['method'] == 'sendDocument']
+
+
+@contextmanager
+def run_fake_api(**kwargs: Any) -> Iterator[FakeBotApi]:
+    """
+    Run fake api in background thread, it is stopped on exit.
+    :param kwargs: Parameters of FakeBotApi.
+    """
+    server = FakeBotApi(**kwargs)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.05}, name='fake_bot_api', daemon=True
+    )
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def main(argv: Optional[List[str]]=None) -> None:
+    """
+    Run fake api till it gets SIGINT.
+    :optional argv: Command line arguments, default is sys.argv.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m telegram_logger.fake_api', description='Fake Telegram Bot API for testing.'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Host to listen.')
+    parser.add_argument('--port', type=int, default=8081, help='Port to listen.')
+    parser.add_argument('--token', default=None, help='Expected token, any token by default.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay of response in seconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Max random delay added to latency.')
+    parser.add_argument('--chat-rate', type=float, default=None,
+                        help=f'Messages per second for one chat, e.g. {CHAT_RATE:.3f} like telegram.')
+    parser.add_argument('--chat-burst', type=float, default=CHAT_BURST,
+                        help='How many messages can be sent to one chat at once.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of 500 response.')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='Probability of dropped connection.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of random errors and delays.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='fake_api : %(levelname)s: %(message)s')
+    server = FakeBotApi(**vars(args))
+    logger.info(f'Fake bot api is listening on {server.api_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f'Stats: {server.stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,150 @@
+from collections import OrderedDict
+import hashlib
 import html
 import logging
-from typing import List, Optional
+import os
+import threading
+import traceback
+from types import TracebackType
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple, Type, Union
+import weakref
+
+
+ExcInfo = Union[
+    Tuple[Type[BaseException], BaseException, Optional[TracebackType]], Tuple[None, None, None]
+]
+
+
+def get_exception_key(exc_info: ExcInfo) -> Tuple[str, str, Tuple[str, ...]]:
+    """
+    Return fingerprint of exception, digest of paths of its frames and text of exceptions
+    of chain without tracebacks.
+    Fingerprint is computed from types of exceptions of chain and their frames as
+    (filename, function, line), so it is the same for repeated errors and doesn't depend
+    on text of exception. Only base name of file is used, so fingerprint doesn't depend
+    on where code is installed. Digest of paths tells apart files with the same name,
+    so rendered traceback can be cached by the key.
+    :param exc_info: Exception info as returned by sys.exc_info().
+    """
+    digest = hashlib.sha1()
+    paths = hashlib.sha1()
+    texts = []  # type: List[str]
+    _, exc, tb = exc_info
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        exc_type = type(exc)
+        digest.update(f'{exc_type.__module__}.{exc_type.__qualname__}\n'.encode('utf-8'))
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            frame = f'{os.path.basename(code.co_filename)}:{code.co_name}:{tb.tb_lineno}\n'
+            digest.update(frame.encode('utf-8', errors='surrogatepass'))
+            paths.update(f'{code.co_filename}\n'.encode('utf-8', errors='surrogatepass'))
+            tb = tb.tb_next
+        texts.extend(traceback.format_exception_only(exc_type, exc))
+        exc = exc.__cause__ or (None if exc.__suppress_context__ else exc.__context__)
+        if exc is not None:
+            tb = exc.__traceback__
+    return digest.hexdigest()[:10], paths.hexdigest(), tuple(texts)
+
+
+def get_exception_fingerprint(exc_info: ExcInfo) -> str:
+    """
+    Return stable fingerprint of exception, see get_exception_key.
+    :param exc_info: Exception info as returned by sys.exc_info().
+    """
+    return get_exception_key(exc_info)[0]
+
+
+class LRUCache(object):
+    """
+    Thread safe cache which keeps limited number of recently used values.
+    """
+    def __init__(self, maxsize: int) -> None:
+        """
+        Initialization.
+        :param maxsize: Max number of values, if <= 0 then nothing is kept.
+        """
+        self.maxsize = maxsize
+        self._values = OrderedDict()  # type: OrderedDict[Hashable, Any]
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Return value or None if there is no value for key.
+        :param key: Key of value.
+        """
+        with self.lock:
+            value = self._values.get(key)
+            if value is not None:
+                self._values.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Keep value, the least recently used value is removed if cache is full.
+        :param key: Key of value.
+        :param value: Value, not None.
+        """
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            if len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._values)
 
 
 class TelegramFormatter(logging.Formatter):
     """
     Base class for formatters for telegram.
+    Results of formatting are cached for the last record, so handlers which format
+    the same record for several chats or several handlers with the same formatter
+    don't repeat the work.
     """
     # Max message size for telegram message
     MAX_MESSAGE_SIZE = 4096
     # Parse mode
     PARSE_MODE = None  # type: Optional[str]
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._cache = None  # type: Optional[Tuple[weakref.ref, Dict[str, Any]]]
+
+    def _cached(self, record: logging.LogRecord, name: str,
+                func: Callable[[logging.LogRecord], Any]) -> Any:
+        """
+        Return result of func(record) cached for the last record.
+        :param record: log record instance
+        :param name: Name of result in cache.
+        :param func: Function which formats record.
+        """
+        cache = self._cache
+        if cache is None or cache[0]() is not record:
+            cache = (weakref.ref(record), {})
+            self._cache = cache
+        results = cache[1]
+        if name not in results:
+            results[name] = func(record)
+        return results[name]
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format log record, result is cached for the record.
+        :param record: log record instance
+        """
+        return self._cached(record, 'message', self.format_message)
+
+    def format_message(self, record: logging.LogRecord) -> str:
+        """
+        Format log record to text for message.
+        :param record: log record instance
+        """
+        return super().format(record)
+
     def format_by_fragments(self, record: logging.LogRecord, start: int=0) -> List[str]:
         """
         Define there how to send message if message length > MAX_MESSAGE_SIZE.
@@ -21,81 +154,345 @@ class TelegramFormatter(logging.Formatter):
         """
         raise NotImplementedError
 
+    def format_document(self, record: logging.LogRecord) -> Tuple[str, str]:
+        """
+        Define there how to send log record as message with document.
+        :param record: log record instance
 
-class TelegramHtmlFormatter(TelegramFormatter):
+        :return: Text of message and plain text of document.
+        """
+        raise NotImplementedError
+
+
+class TelegramMarkupFormatter(TelegramFormatter):
     """
-    Class to format log record in html format for message.
+    Base class for formatters which escape text for parse mode of telegram
+    and put traceback in block of code.
+    Message is split on fragments after escaping, so size of fragment is counted
+    as telegram counts it.
+    Rendered and escaped tracebacks are kept in LRU caches by fingerprint of exception,
+    so repeated errors are formatted once. Fingerprint is added to hashtag as #e<fingerprint>.
     """
-    START_CODE = "<pre>"
-    END_CODE = '</pre>'
-    PARSE_MODE = 'html'
+    START_CODE = ''
+    END_CODE = ''
+    # Max length of escape sequence or tag which must not be split
+    MAX_ESCAPE_SIZE = 16
+    # Fragment is not started if there is less room in message
+    MIN_FRAGMENT_SIZE = 32
+    # Number of cached tracebacks
+    TRACEBACK_CACHE_SIZE = 128
+    # Longer tracebacks are not cached
+    MAX_CACHED_TRACEBACK_SIZE = 64 * 1024
+
+    def __init__(self, *args, traceback_cache_size: int=TRACEBACK_CACHE_SIZE, **kwargs) -> None:
+        """
+        Initialization.
+        :optional traceback_cache_size: Number of cached tracebacks, if 0 then tracebacks
+        are not cached.
+        Other parameters are passed to logging.Formatter.
+        """
+        super().__init__(*args, **kwargs)
+        # Plain text of tracebacks by fingerprint and text of exception
+        self._traceback_cache = LRUCache(traceback_cache_size)
+        # Escaped blocks of code by plain text
+        self._code_cache = LRUCache(traceback_cache_size)
+
+    def formatException(self, ei: ExcInfo) -> str:  # type: ignore
+        """
+        Render exception, text is cached by fingerprint of exception and its text,
+        so source lines are not read again for repeated errors.
+        :param ei: Exception info as returned by sys.exc_info().
+        """
+        key = get_exception_key(ei)
+        text = self._traceback_cache.get(key)
+        if text is None:
+            text = super().formatException(ei)
+            if len(text) <= self.MAX_CACHED_TRACEBACK_SIZE:
+                self._traceback_cache.put(key, text)
+        return text
+
+    def get_fingerprint(self, record: logging.LogRecord) -> Optional[str]:
+        """
+        Return fingerprint of exception of record, it is cached for the record.
+        Fingerprint computed before, e.g. by RecordSnapshot, is taken from exc_fingerprint.
+        :param record: log record instance
+        """
+        fingerprint = getattr(record, 'exc_fingerprint', None)
+        exc_info = record.exc_info
+        if fingerprint is None and exc_info:
+            fingerprint = self._cached(
+                record, 'fingerprint', lambda record: get_exception_fingerprint(exc_info)
+            )
+        return fingerprint
+
+    def escape(self, text: str) -> str:
+        """
+        Escape text for parse mode.
+        :param text: Plain text.
+        """
+        raise NotImplementedError
+
+    def escape_code(self, text: str) -> str:
+        """
+        Escape text inside block of code.
+        :param text: Plain text of code.
+        """
+        return self.escape(text)
 
     def get_hashtag_for_record(self, record: logging.LogRecord) -> str:
         """
         Generate hashtag for log record.
         :param record: Log record.
 
-        :return: Hashtag with logger name, function name and time.
+        :return: Hashtag with logger name, function name and time, and hashtag with
+        fingerprint of exception if record has exception.
         """
-        return f"\n\n#{int(record.created)}.{record.name}.{record.funcName}"
+        tag = f"#{int(record.created)}.{record.name}.{record.funcName}"
+        fingerprint = self.get_fingerprint(record)
+        if fingerprint:
+            tag = f"{tag} #e{fingerprint}"
+        return f"\n\n{tag}"
 
     def _mark_code(self, code_text: str) -> str:
         """
-        Put text of code in block code tag
+        Put text of code in block code tag, escaped tracebacks are cached.
         :param code_text: Text of code for message.
         """
-        return f"{self.START_CODE}{html.escape(code_text)}{self.END_CODE}"
+        block = self._code_cache.get(code_text)
+        if block is None:
+            block = f"{self.START_CODE}{self.escape_code(code_text)}{self.END_CODE}"
+            if len(code_text) <= self.MAX_CACHED_TRACEBACK_SIZE:
+                self._code_cache.put(code_text, block)
+        return block
 
-    def format(self, record: logging.LogRecord) -> str:
+    def format_traceback(self, record: logging.LogRecord) -> str:
+        """
+        Return plain text of exception of log record, it is cached for the record.
+        Exception rendered before, e.g. by RecordSnapshot, is taken from exc_text.
+        :param record: log record instance
+        """
+        return self._cached(
+            record, 'traceback',
+            lambda record: (self.formatException(record.exc_info) if record.exc_info
+                            else record.exc_text or '')
+        )
+
+    def format_header(self, record: logging.LogRecord) -> str:
         """
-        Format log record to markdown text for message.
+        Format information about logging event to escaped text.
+        :param record: log record instance
+        """
+        raise NotImplementedError
+
+    def format_message(self, record: logging.LogRecord) -> str:
+        """
+        Format log record to escaped text for message.
         :param record: log record instance
         """
         description = ""
-        if record.exc_info:
-            description = self._mark_code(self.formatException(record.exc_info))
-        timestamp = self.formatTime(record)
+        if record.exc_info or record.exc_text:
+            description = self._mark_code(self.format_traceback(record))
+        return f"{self.format_header(record)}{description}"
 
-        return "<b>{levelname}</b>\n\n{timestamp} {module} {funcName}: {msg}\n\n{description}".format(
-            levelname=record.levelname,
-            timestamp=timestamp,
-            module=record.module,
-            funcName=record.funcName,
-            msg=html.escape(record.getMessage()),
-            description=description
-        )
+    def format_document(self, record: logging.LogRecord) -> Tuple[str, str]:
+        """
+        Format log record to message with information about logging event and document
+        with message and traceback. Too long message is cut to one fragment.
+        :param record: log record instance
+
+        :return: Text of message and plain text of document.
+        """
+        header = self.format_header(record).rstrip()
+        text = next(self.iter_fragments([(header, False)], self.get_hashtag_for_record(record)))
+        return text, f"{record.getMessage()}\n\n{self.format_traceback(record)}"
 
     def format_by_fragments(self, record: logging.LogRecord, start: int=0) -> List[str]:
         """
         Format and split formatted log record on fragments if text of record > MAX_MESSAGE_SIZE.
-        There are some assumptions for format of message that splits:
-        - there is just one block of code - traceback
-        - length of block of information about logging event less than MAX_MESSAGE_SIZE.
-        Append in each fragment hashtag based on current record.
+        Message is split on line boundaries, block of code is closed at the end of fragment
+        and opened again in the next one. Escape sequences and tags are never split.
+        Each fragment is filled up to MAX_MESSAGE_SIZE and has hashtag based on current record.
+        Fragments are cached for the record.
         :param record: log record instance
         :optional start: Start char for splitting
         """
-        message = self.format(record)
+        if start:
+            return self._split(record, start)
+        return list(self._cached(record, 'fragments', self._split))
+
+    def _split(self, record: logging.LogRecord, start: int=0) -> List[str]:
+        """
+        Split formatted log record on fragments.
+        :param record: log record instance
+        :optional start: Start char for splitting
+        """
+        message = self.format(record)[start:]
         if len(message) <= self.MAX_MESSAGE_SIZE:
             return [message]
-        # Else split on fragments
-        tag = self.get_hashtag_for_record(record)
-        end = message.find(self.START_CODE, start)
+        code_start = message.find(self.START_CODE)
+        code_end = message.rfind(self.END_CODE)
+        if code_start == -1 or code_end < code_start:
+            segments = [(message, False)]
+        else:
+            segments = [
+                (message[:code_start], False),
+                (message[code_start + len(self.START_CODE):code_end], True),
+                (message[code_end + len(self.END_CODE):], False),
+            ]
+        return list(self.iter_fragments(segments, self.get_hashtag_for_record(record)))
 
-        fragments = []
-        # Append block of information about logging event
-        fragments.append(f"{message[start:end]}{tag}")
+    def iter_fragments(self, segments: List[Tuple[str, bool]], tag: str) -> Iterator[str]:
+        """
+        Split formatted segments of message on fragments in one pass.
+        :param segments: List of (text, is_code), text is already escaped.
+        :param tag: Hashtag which is appended to each fragment.
+        """
+        limit = self.MAX_MESSAGE_SIZE - len(tag)
+        parts = []  # type: List[str]
+        size = 0
+        for text, is_code in segments:
+            opening, closing = (self.START_CODE, self.END_CODE) if is_code else ('', '')
+            full_room = limit - len(opening) - len(closing)
+            pos = 0
+            while pos < len(text):
+                room = full_room - size
+                end = self._find_cut(text, pos, pos + room) if room >= self.MIN_FRAGMENT_SIZE else pos
+                if end <= pos:
+                    # Line which is longer than the whole fragment is cut anyway, so fill this one
+                    long_line = text.find('\n', pos, pos + full_room) == -1
+                    if parts and not (long_line and room >= self.MIN_FRAGMENT_SIZE):
+                        yield ''.join(parts) + tag
+                        parts, size = [], 0
+                        continue
+                    end = self._find_safe_cut(text, pos, pos + max(room, 1))
+                part = f"{opening}{text[pos:end]}{closing}"
+                parts.append(part)
+                size += len(part)
+                pos = end
+        if parts:
+            yield ''.join(parts) + tag
 
-        start = end
-        end += self.MAX_MESSAGE_SIZE - len(tag) - len(self.END_CODE)
-        code_fragment = message[start:end]
+    def _find_cut(self, text: str, start: int, end: int) -> int:
+        """
+        Find the end of fragment of text, it is the end of the last line which fits.
+        :param text: Escaped text.
+        :param start: Start of fragment.
+        :param end: Max end of fragment.
 
-        while code_fragment:
-            code_fragment = code_fragment.strip(self.START_CODE).strip(self.END_CODE)
-            fragments.append(f"{self._mark_code(code_fragment)}{tag}")
+        :return: End of fragment, or start if even one line doesn't fit.
+        """
+        if end >= len(text):
+            return len(text)
+        line_end = text.rfind('\n', start, end)
+        if line_end == -1:
+            return start
+        return line_end + 1
 
-            start = end
-            end += self.MAX_MESSAGE_SIZE - len(tag) - len(self.START_CODE) - len(self.END_CODE)
-            code_fragment = message[start:end]
+    def _find_safe_cut(self, text: str, start: int, end: int) -> int:
+        """
+        Find the end of fragment of line which is longer than fragment,
+        formatters override it to not split escape sequences.
+        :param text: Escaped text.
+        :param start: Start of fragment.
+        :param end: Max end of fragment.
+        """
+        return min(end, len(text))
+
+
+class TelegramHtmlFormatter(TelegramMarkupFormatter):
+    """
+    Class to format log record in html format for message.
+    """
+    START_CODE = "<pre>"
+    END_CODE = '</pre>'
+    PARSE_MODE = 'html'
 
-        return fragments
+    def escape(self, text: str) -> str:
+        return html.escape(text)
+
+    def format_header(self, record: logging.LogRecord) -> str:
+        """
+        Format information about logging event to html text.
+        :param record: log record instance
+        """
+        timestamp = self.formatTime(record)
+        return "<b>{levelname}</b>\n\n{timestamp} {module} {funcName}: {msg}\n\n".format(
+            levelname=record.levelname,
+            timestamp=timestamp,
+            module=record.module,
+            funcName=record.funcName,
+            msg=html.escape(record.getMessage()),
+        )
+
+    def _find_safe_cut(self, text: str, start: int, end: int) -> int:
+        """
+        Find the end of fragment of line which is longer than fragment,
+        escape sequence or tag is not split.
+        :param text: Escaped text.
+        :param start: Start of fragment.
+        :param end: Max end of fragment.
+        """
+        if end >= len(text):
+            return len(text)
+        for opening, closing in (('&', ';'), ('<', '>')):
+            opened = text.rfind(opening, max(start, end - self.MAX_ESCAPE_SIZE), end)
+            if opened > start and text.find(closing, opened, end) == -1:
+                end = opened
+        return end
+
+
+class TelegramMarkdownV2Formatter(TelegramMarkupFormatter):
+    """
+    Class to format log record in MarkdownV2 format for message.
+    Text is escaped in one pass by translation table, escape sequence is never split.
+    """
+    START_CODE = '```\n'
+    END_CODE = '\n```'
+    PARSE_MODE = 'MarkdownV2'
+    # Chars which must be escaped in text, see https://core.telegram.org/bots/api#markdownv2-style
+    SPECIAL_CHARS = '\\_*[]()~`>#+-=|{}.!'
+    # Chars which must be escaped inside block of code
+    CODE_SPECIAL_CHARS = '\\`'
+    ESCAPE_TABLE = str.maketrans({char: '\\' + char for char in SPECIAL_CHARS})
+    CODE_ESCAPE_TABLE = str.maketrans({char: '\\' + char for char in CODE_SPECIAL_CHARS})
+
+    def escape(self, text: str) -> str:
+        return text.translate(self.ESCAPE_TABLE)
+
+    def escape_code(self, text: str) -> str:
+        return text.translate(self.CODE_ESCAPE_TABLE)
+
+    def get_hashtag_for_record(self, record: logging.LogRecord) -> str:
+        """
+        Generate hashtag for log record.
+        :param record: Log record.
+
+        :return: Escaped hashtags with logger name, function name, time and fingerprint.
+        """
+        return self.escape(super().get_hashtag_for_record(record))
+
+    def format_header(self, record: logging.LogRecord) -> str:
+        """
+        Format information about logging event to MarkdownV2 text.
+        :param record: log record instance
+        """
+        info = f"{self.formatTime(record)} {record.module} {record.funcName}: {record.getMessage()}"
+        return f"*{self.escape(record.levelname)}*\n\n{self.escape(info)}\n\n"
+
+    def _find_safe_cut(self, text: str, start: int, end: int) -> int:
+        """
+        Find the end of fragment of line which is longer than fragment,
+        backslash is not separated from escaped char.
+        :param text: Escaped text.
+        :param start: Start of fragment.
+        :param end: Max end of fragment.
+        """
+        if end >= len(text):
+            return len(text)
+        # Backslashes before cut are pairs of escaped backslash, odd one starts escape sequence
+        pos = end
+        while pos > start and text[pos - 1] == '\\':
+            pos -= 1
+        if (end - pos) % 2 and end - 1 > start:
+            end -= 1
+        return end
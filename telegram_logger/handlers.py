@@ -1,16 +1,63 @@
+from telegram_logger.batching import MessageBatcher
+from telegram_logger.bots import BotPool, HASH
+from telegram_logger.breaker import CircuitBreaker, CLOSED
+from telegram_logger.dedup import DuplicateFilter
 from telegram_logger.formatters import TelegramHtmlFormatter, TelegramFormatter
+from telegram_logger.metrics import Metrics
+from telegram_logger.queues import TelegramQueue, PriorityTelegramQueue, DROP_NEWEST
+from telegram_logger.ratelimit import (
+    RateLimiter, GLOBAL_RATE, GLOBAL_BURST, CHAT_RATE, CHAT_BURST
+)
+from telegram_logger.retry import Delivery, RetryPolicy, RetryScheduler
+from telegram_logger.snapshot import RecordSnapshot, PREPARE_MODES, PREPARE_RECORD, PREPARE_SNAPSHOT
+from telegram_logger.spool import SpoolQueue
 
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
+import functools
+import gzip
+import importlib
+import io
 import logging
 from logging.handlers import QueueHandler, QueueListener
 import json
-from queue import Queue
-import requests
-from typing import Optional, Dict, Any, List
+from queue import Empty, Full
+import threading
+import time
+from typing import Optional, Dict, Any, Callable, Iterator, List, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # requests is imported on first send, it takes noticeable time at startup
+    import requests
 
 
 logger = logging.getLogger(__name__)
 
 
+def dumps_json(obj: Any) -> str:
+    """
+    Default JSON encoder of request payloads, it makes compact JSON with unicode as is.
+    :param obj: Object to encode.
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def get_json_encoder(encoder: Union[str, Callable[[Any], Any], None]) -> Callable[[Any], Any]:
+    """
+    Return JSON encoder.
+    :param encoder: Function which encodes object to JSON str or bytes, or dotted path
+    to it, e.g. 'orjson.dumps'. If None, then default encoder is used.
+    """
+    if encoder is None:
+        return dumps_json
+    if isinstance(encoder, str):
+        module_name, _, name = encoder.rpartition('.')
+        return getattr(importlib.import_module(module_name), name)
+    return encoder
+
+
 class TelegramHandler(QueueHandler):
     """
     Handler that takes telegram params.
@@ -19,14 +66,30 @@ class TelegramHandler(QueueHandler):
     # Message for setting unexpected class as formatter
     FORMATTER_WARNING = 'Formatter class is not subclass of telegram_logger.TelegramFormatter, \
 its possible problems with sending long log message to telegram'
+    # Message about records which were dropped because queue was full
+    DROPPED_MESSAGE = '%d log records were dropped because queue was full'
+    # Message about records which were not sent before deadline of closing
+    NOT_SENT_MESSAGE = '{} log records were not sent to telegram before deadline'
+    # Default time to send queued records at exit of process
+    DEFAULT_EXIT_TIMEOUT = 10.0
 
-    def __init__(self, chat_ids: List[str], token: str, proxies: Optional[Dict[str, str]]=None,
+    def __init__(self, chat_ids: List[str], token: Union[str, List[str]],
+                 proxies: Optional[Dict[str, str]]=None,
                  disable_web_page_preview: bool=False, disable_notification: bool=False,
                  reply_to_message_id: Optional[int]=None,
-                 reply_markup: Optional[Dict[str, Any]]=None, **kwargs) -> None:
+                 reply_markup: Optional[Dict[str, Any]]=None,
+                 max_queue_size: int=-1, max_queue_bytes: int=0,
+                 overflow_policy: str=DROP_NEWEST, block_timeout: Optional[float]=None,
+                 priority: bool=False, priority_max_delay: Optional[float]=60.0,
+                 prepare_mode: str=PREPARE_RECORD,
+                 dedup_window: Optional[float]=None, dedup_max_keys: int=1000,
+                 spool_path: Optional[str]=None, spool_max_bytes: int=0,
+                 metrics_labels: Optional[Dict[str, str]]=None,
+                 fallback_handler: Optional[logging.Handler]=None,
+                 exit_timeout: Optional[float]=DEFAULT_EXIT_TIMEOUT, **kwargs) -> None:
         """
         Initialization.
-        :param token: Telegram token.
+        :param token: Telegram token or list of tokens of bots which are members of all chats.
         :optional proxies: Proxy for requests. Format proxies corresponds format proxies 
         in requests library.
         Parameters for message to telegram, see https://core.telegram.org/bots/api#sendmessage
@@ -37,9 +100,69 @@ its possible problems with sending long log message to telegram'
         :optional reply_markup: Additional interface options. 
         A JSON-serialized object for an inline keyboard, custom reply keyboard,
         instructions to remove reply keyboard or to force a reply from the user.
+        Queue parameters:
+        :optional max_queue_size: Max number of records in queue, if <= 0 then it is infinite.
+        :optional max_queue_bytes: Max approximate size of records in queue,
+        if <= 0 then it is not limited.
+        :optional overflow_policy: What to do when queue is full, one of
+        drop_newest, drop_oldest, drop_lowest_level, block.
+        :optional block_timeout: How long to wait free place in queue for policy block.
+        :optional priority: Send records with higher level first, records of the same level
+        are sent in order.
+        :optional priority_max_delay: Max time in seconds which record waits in priority queue
+        before it overtakes records with higher level. If None, lower levels wait while there
+        are higher ones.
+        :optional prepare_mode: What is put to queue: record as it is or its compact snapshot.
+        Snapshot is made in thread which logs, it keeps rendered message and traceback
+        instead of arguments, frames and extra attributes of record.
+        :optional dedup_window: Time in seconds while repeated records are suppressed,
+        then summary with number of repeats is sent. If None, records are not suppressed.
+        :optional dedup_max_keys: Max number of tracked records for suppressing.
+        Spool parameters:
+        :optional spool_path: Path to SQLite file where records are kept till they are sent.
+        Records are formatted before putting to spool, records left from previous run
+        are sent on start. If spool is used, queue parameters are ignored.
+        :optional spool_max_bytes: Max size of records in spool, the oldest records are dropped
+        when it is exceeded. If <= 0 then size is not limited.
+        :optional metrics_labels: Labels of metrics of handler for exporter, e.g. name of handler.
+        Shutdown parameters:
+        :optional fallback_handler: Handler which gets records that were not sent before
+        deadline of flush or close or while circuit breaker is open, e.g. handler which
+        writes to file. With spool records wait in spool while circuit breaker is open.
+        :optional exit_timeout: Time in seconds to send queued records at exit of process,
+        then the rest records are passed to spool or fallback handler.
+        If None, handler waits till all records are sent.
         """
-        self.queue = Queue(-1)  # type: Queue
+        if prepare_mode not in PREPARE_MODES:
+            raise ValueError(f'Unknown prepare mode {prepare_mode}, use one of {PREPARE_MODES}')
+        self.prepare_mode = prepare_mode
+        self.metrics = Metrics(metrics_labels)
+        queue_kwargs = {
+            'max_bytes': max_queue_bytes,
+            'overflow_policy': overflow_policy,
+            'block_timeout': block_timeout,
+            'notice_factory': self.make_dropped_notice,
+        }  # type: Dict[str, Any]
+        if spool_path:
+            self.queue = SpoolQueue(
+                spool_path, spool_max_bytes
+            )  # type: Union[TelegramQueue, SpoolQueue]
+        elif priority:
+            self.queue = PriorityTelegramQueue(
+                max_queue_size,
+                max_delay=priority_max_delay,
+                wait_observer=self.observe_queue_wait,
+                **queue_kwargs
+            )
+        else:
+            self.queue = TelegramQueue(max_queue_size, **queue_kwargs)
         super().__init__(self.queue)
+        self.metrics.set_counter_function('dropped', lambda: self.queue.dropped)
+        self.metrics.set_gauge('queue_depth', self.queue.qsize)
+        self.dedup_filter = None  # type: Optional[DuplicateFilter]
+        if dedup_window:
+            self.dedup_filter = DuplicateFilter(self, dedup_window, dedup_max_keys)
+            self.addFilter(self.dedup_filter)
         self.handler = TelegramMessageHandler(
             chat_ids,
             token,
@@ -48,12 +171,23 @@ its possible problems with sending long log message to telegram'
             disable_notification=disable_notification,
             reply_to_message_id=reply_to_message_id,
             reply_markup=reply_markup,
+            metrics=self.metrics,
+            fallback_handler=fallback_handler,
+            breaker_wait=bool(spool_path),
             **kwargs
         )
         # Set default formatter
         self.handler.setFormatter(TelegramHtmlFormatter())
+        self.fallback_handler = fallback_handler
+        self.exit_timeout = exit_timeout
+        # Handler is closed, records which were not sent are handed over if _handed_over
+        self._closed = False
+        self._handed_over = False
         self.listener = QueueListener(self.queue, self.handler)
         self.listener.start()
+        if exit_timeout is not None:
+            # It is called before logging.shutdown because atexit calls functions in reverse order
+            atexit.register(self.close_at_exit)
 
     def setFormatter(self, formatter: logging.Formatter) -> None:
         """
@@ -67,16 +201,168 @@ its possible problems with sending long log message to telegram'
     def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
         """
         Prepare record.
+        Record for spool is formatted here, so spool keeps fragments instead of record.
+        In snapshot mode compact snapshot of record is put to queue.
         """
+        if isinstance(self.queue, SpoolQueue):
+            record = copy.copy(record)
+            record.telegram_fragments = self.handler.get_fragments(record)
+        elif self.prepare_mode == PREPARE_SNAPSHOT:
+            return RecordSnapshot(record, self.handler.formatter)  # type: ignore
         return record
 
-    def close(self) -> None:
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put record to queue, if queue is full record is dropped according to overflow policy.
+        :param record: Instance of log record.
+        """
+        try:
+            self.queue.put(record)
+        except Full:
+            return
+        self.metrics.inc('enqueued')
+
+    def observe_queue_wait(self, levelno: int, wait: float) -> None:
+        """
+        Add time which record waited in priority queue to metrics.
+        :param levelno: Level of record.
+        :param wait: Time in seconds.
+        """
+        self.metrics.observe_queue_wait(logging.getLevelName(levelno), wait)
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of records dropped because queue was full.
+        """
+        return self.queue.dropped
+
+    def make_dropped_notice(self, count: int) -> logging.LogRecord:
         """
-        Wait till all records will be processed then stop listener.
+        Make record which notices about dropped records.
+        :param count: Number of dropped records.
+        """
+        return logger.makeRecord(
+            logger.name, logging.WARNING, __file__, 0, self.DROPPED_MESSAGE, (count,), None,
+            func='make_dropped_notice'
+        )
+
+    @property
+    def is_listening(self) -> bool:
+        """
+        Check if listener takes records from queue.
+        """
+        return self.listener._thread is not None  # type: ignore
+
+    def _wait_queue(self, deadline: Optional[float]) -> bool:
         """
-        self.listener.stop()
+        Wait till all records in queue are processed.
+        :param deadline: Time by time.monotonic to stop waiting, if None then wait forever.
+
+        :return: True if queue is processed.
+        """
+        queue = self.queue
+        with queue.all_tasks_done:
+            while queue.unfinished_tasks:
+                if deadline is None:
+                    queue.all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                queue.all_tasks_done.wait(remaining)
+        return True
+
+    def flush(self, timeout: Optional[float]=None) -> bool:  # type: ignore
+        """
+        Wait till queued records are sent, then send batch.
+        Flush of closed handler does nothing.
+        :optional timeout: Max time to wait in seconds, if None then wait forever.
+
+        :return: True if all records are sent before deadline.
+        """
+        if self._closed:
+            return not self._handed_over
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.dedup_filter is not None:
+            self.dedup_filter.flush()
+        if not self.is_listening:
+            return not self.queue.qsize()
+        if not self._wait_queue(deadline):
+            return False
+        return self.handler.flush(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def close(self, timeout: Optional[float]=None) -> None:
+        """
+        Wait till all records are processed then stop listener.
+        If records are not sent before deadline, they are left in spool or passed to
+        fallback handler, and listener thread is left to finish current request.
+        Handler can be closed by application or at exit and then by logging.shutdown,
+        the next calls do nothing, so they do not wait for request left to listener.
+        :optional timeout: Max time to wait in seconds, if None then wait forever.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        atexit.unregister(self.close_at_exit)
+        if self.dedup_filter is not None:
+            self.dedup_filter.flush()
+        stopped = True
+        if self.is_listening and deadline is None:
+            self.listener.stop()
+        elif self.is_listening:
+            thread = self.listener._thread  # type: Optional[threading.Thread]
+            assert thread is not None and deadline is not None
+            self.listener.enqueue_sentinel()
+            thread.join(max(deadline - time.monotonic(), 0))
+            self.listener._thread = None  # type: ignore
+            stopped = not thread.is_alive()
+            if stopped:
+                # Requests which wait retry are not waited after deadline
+                stopped = self.handler.flush(max(deadline - time.monotonic(), 0))
+        if stopped:
+            self.handler.close()
+            if isinstance(self.queue, SpoolQueue):
+                self.queue.close()
+        else:
+            self._handed_over = True
+            self.hand_over_queue()
+            self.handler.close(wait=False)
         super().close()
 
+    def close_at_exit(self) -> None:
+        """
+        Close handler with exit_timeout at exit of process.
+        """
+        self.close(self.exit_timeout)
+
+    def hand_over_queue(self) -> None:
+        """
+        Pass records which are not sent to fallback handler.
+        Spool keeps records itself, they are sent when handler is created again.
+        """
+        if isinstance(self.queue, SpoolQueue):
+            logger.warning(self.NOT_SENT_MESSAGE.format(self.queue.qsize()) + ', they are left in spool')
+            return
+        records = []  # type: List[logging.LogRecord]
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except Empty:
+                break
+            self.queue.task_done()
+            if record is not None:
+                records.append(record)
+        # Listener stops when it finishes current record
+        self.listener.enqueue_sentinel()
+        if not records:
+            return
+        logger.warning(self.NOT_SENT_MESSAGE.format(len(records)))
+        if self.fallback_handler is not None:
+            for record in records:
+                self.fallback_handler.handle(record)
+
 
 class MessageParamsMixin(object):
     """
@@ -85,17 +371,32 @@ class MessageParamsMixin(object):
     # Warning message if formatter for handler has not parse mode
     PARSE_MODE_WARNING = f'Formatter for handler has not attribute PARSE_MODE, \
         its possible problems with sending message to telegram in correct format'
+    # Headers of request with JSON payload
+    JSON_HEADERS = {'Content-Type': 'application/json'}
+    # Base url of telegram bot api
+    DEFAULT_API_URL = 'https://api.telegram.org'
+    # Default timeouts of requests to telegram in seconds
+    DEFAULT_CONNECT_TIMEOUT = 5.0
+    DEFAULT_READ_TIMEOUT = 30.0
+    # Attributes which are used in precomputed payloads and urls, changing them resets cache
+    PAYLOAD_ATTRS = frozenset((
+        'token', 'api_url', 'formatter', 'disable_web_page_preview', 'disable_notification',
+        'reply_to_message_id', 'reply_markup', 'json_encoder',
+    ))
 
-    def __init__(self, chat_ids: List[str], token: str,
+    def __init__(self, chat_ids: List[str], token: Union[str, List[str]],
                  proxies: Optional[Dict[str, str]]=None,
                  disable_web_page_preview: bool=False,
                  disable_notification: bool=False,
                  reply_to_message_id: Optional[int]=None,
-                 reply_markup: Optional[Dict[str, Any]]=None, **kwargs) -> None:
+                 reply_markup: Optional[Dict[str, Any]]=None,
+                 json_encoder: Union[str, Callable[[Any], Any], None]=None,
+                 api_url: str=DEFAULT_API_URL, **kwargs) -> None:
         """
         Initialization.
         :param chat_ids: List of telegram chats IDs for getting log messages.
-        :param token: Telegram token.
+        :param token: Telegram token or list of tokens of bots which are members of all chats.
+        Attribute token is the first one, handlers which support several bots use all of them.
         :optional proxies: Proxy for requests. Format proxies corresponds format proxies 
         in requests library.
         Parameters for message to telegram, see https://core.telegram.org/bots/api#sendmessage
@@ -106,16 +407,39 @@ class MessageParamsMixin(object):
         :optional reply_markup: Additional interface options. 
         A JSON-serialized object for an inline keyboard, custom reply keyboard,
         instructions to remove reply keyboard or to force a reply from the user.
+        :optional json_encoder: Function which encodes object to JSON str or bytes,
+        or dotted path to it, e.g. 'orjson.dumps'.
+        :optional api_url: Base url of telegram bot api, e.g. url of local fake api for testing.
         """
+        self.reset_payloads()
         # https://github.com/python/mypy/issues/5887
         super().__init__(**kwargs)  # type: ignore
-        self.token = token
+        self.tokens = [token] if isinstance(token, str) else list(token)
+        if not self.tokens:
+            raise ValueError('At least one token is required')
+        self.token = self.tokens[0]
         self.chat_ids = chat_ids
         self.proxies = proxies
         self.disable_web_page_preview = disable_web_page_preview
         self.disable_notification = disable_notification
         self.reply_to_message_id = reply_to_message_id
         self.reply_markup = reply_markup
+        self.json_encoder = get_json_encoder(json_encoder)
+        self.api_url = api_url.rstrip('/')
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in self.PAYLOAD_ATTRS:
+            self.reset_payloads()
+
+    def reset_payloads(self) -> None:
+        """
+        Reset precomputed payloads and urls.
+        It is called when formatter or options of message are changed.
+        """
+        # Payloads without text for (chat_id, parse_mode)
+        self._payload_prefixes = {}  # type: Dict[Tuple[Any, Optional[str]], bytes]
+        self._urls = {}  # type: Dict[Tuple[str, str], str]
 
     @property
     def parse_mode(self) -> Optional[str]:
@@ -147,74 +471,690 @@ class MessageParamsMixin(object):
             params['disable_notification'] = self.disable_notification
         return params
 
+    def get_url(self, method: str, token: Optional[str]=None) -> str:
+        """
+        Return url of telegram bot api method.
+        :param method: Name of method.
+        :optional token: Token of bot, default is attribute token.
+        """
+        key = (method, token or self.token)
+        url = self._urls.get(key)
+        if url is None:
+            url = self._urls[key] = f'{self.api_url}/bot{key[1]}/{method}'
+        return url
+
     @property
     def url(self) -> str:
-        return f'https://api.telegram.org/bot{self.token}/sendMessage'
+        return self.get_url('sendMessage')
 
     def get_reply_markup(self) -> Optional[Dict[str, Any]]:
         """
         Override this if you need to generate reply_markup.
+        Overridden method is called for each message, so payload is not precomputed.
         """
         return self.reply_markup
 
+    def encode_json(self, obj: Any) -> bytes:
+        """
+        Encode object to JSON bytes.
+        :param obj: Object to encode.
+        """
+        data = self.json_encoder(obj)
+        if isinstance(data, str):
+            # Lone surrogates, e.g. from undecodable file names, can't be encoded to UTF-8
+            return data.encode('utf-8', errors='replace')
+        return data
+
+    def _make_payload_prefix(self, chat_id: str, parse_mode: Optional[str]) -> bytes:
+        """
+        Encode static part of payload, it ends where text of message starts.
+        """
+        params = self._get_message_params()
+        params.update({
+            'chat_id': chat_id,
+            'parse_mode': parse_mode or self.parse_mode,
+        })
+        return self.encode_json(params)[:-1] + b',"text":'
+
+    def get_payload(self, chat_id: str, text: str, parse_mode: Optional[str]=None) -> bytes:
+        """
+        Return JSON payload of sendMessage request.
+        Static part is encoded once per chat, only text is encoded for each message.
+        :param chat_id: Telegram chat ID
+        :param text: Text of message.
+        :optional parse_mode: Message format, default is parse mode of formatter.
+        """
+        if type(self).get_reply_markup is not MessageParamsMixin.get_reply_markup:
+            prefix = self._make_payload_prefix(chat_id, parse_mode)
+        else:
+            key = (chat_id, parse_mode)
+            prefix = self._payload_prefixes.get(key)  # type: ignore
+            if prefix is None:
+                prefix = self._payload_prefixes[key] = self._make_payload_prefix(chat_id, parse_mode)
+        return prefix + self.encode_json(text) + b'}'
+
+    def get_fragments(self, record: logging.LogRecord) -> List[str]:
+        """
+        Format record to messages for telegram once for all chats.
+        If formatter is subclass of TelegramFormatter then split message by fragments.
+        Record which was formatted before, e.g. in spool, has fragments in attribute
+        telegram_fragments.
+        :param record: Instance of log record.
+        """
+        fragments = getattr(record, 'telegram_fragments', None)
+        if fragments is not None:
+            return fragments
+        formatter = self.formatter  # type: ignore
+        if formatter and isinstance(formatter, TelegramFormatter):
+            return formatter.format_by_fragments(record)
+        return [self.format(record)]  # type: ignore
+
+    def _process_response(self, chat_id: str, response: Dict[str, Any]) -> None:
+        """
+        Check response from telegram and log warning if response got error.
+        :param chat_id: Telegram chat ID for sending log message.
+        :param response: Response as dict from telegram.
+        """
+        try:
+            if not response['ok']:
+                logger.warning(f'Fail to send log message to chat {chat_id}: {response["description"]}')
+        except KeyError:
+            logger.warning(f'Unexpected response from telegram: {response}')
+
 
 class TelegramMessageHandler(MessageParamsMixin, logging.Handler):
     """
     Handler that send log message to telegram admins chats.
     """
-    def __init__(self, *args, **kwargs):
+    # Default max number of keep-alive connections to telegram
+    DEFAULT_POOL_SIZE = 10
+
+    def __init__(self, *args, pool_size: int=DEFAULT_POOL_SIZE, connection_retries: int=0,
+                 max_workers: int=1, batch_size: int=1, batch_linger: float=1.0,
+                 rate_limit: bool=False, global_rate: float=GLOBAL_RATE,
+                 global_burst: float=GLOBAL_BURST, chat_rate: float=CHAT_RATE,
+                 chat_burst: float=CHAT_BURST, retries: int=3, retry_backoff: float=0.5,
+                 retry_max_backoff: float=30.0, document_threshold_fragments: int=0,
+                 document_compress: bool=False, bot_strategy: str=HASH, bot_max_failures: int=3,
+                 bot_cooldown: float=30.0,
+                 connect_timeout: Optional[float]=MessageParamsMixin.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: Optional[float]=MessageParamsMixin.DEFAULT_READ_TIMEOUT,
+                 breaker_failures: int=0, breaker_cooldown: float=60.0, breaker_wait: bool=False,
+                 fallback_handler: Optional[logging.Handler]=None,
+                 metrics: Optional[Metrics]=None, **kwargs) -> None:
+        """
+        Initialization.
+        :optional pool_size: Max number of keep-alive connections to telegram.
+        :optional connection_retries: How many times to retry failed connection to telegram.
+        Only connection errors are retried, so message will not be sent twice.
+        :optional max_workers: Number of threads which send message to different chats
+        at the same time. Fragments for one chat are always sent in order.
+        If max_workers is 1 then message is sent to chats one by one.
+        :optional batch_size: Max number of records packed in one message.
+        If batch_size is 1 then each record is sent separately.
+        :optional batch_linger: Max time in seconds which record waits in batch.
+        :optional rate_limit: Wait before sending to not exceed telegram limits.
+        Limits are applied to each bot separately.
+        :optional global_rate: Messages per second for bot.
+        :optional global_burst: How many messages bot can send at once.
+        :optional chat_rate: Messages per second for one chat.
+        :optional chat_burst: How many messages can be sent to one chat at once.
+        :optional retries: Max number of retries for message, 429, 5xx responses and
+        network errors are retried. Retries of sent records wait in lane of chat in
+        retry scheduler, so they don't delay other chats, the following messages to the chat
+        wait in lane behind them. Direct calls of send_message retry in calling thread.
+        :optional retry_backoff: Delay before the first retry in seconds, next delays are doubled.
+        :optional retry_max_backoff: Max delay before retry in seconds.
+        :optional document_threshold_fragments: If record is split on more fragments,
+        then information about event is sent as message and traceback as document.
+        If 0, record is always sent as messages.
+        :optional document_compress: Compress document with gzip.
+        Parameters for several tokens:
+        :optional bot_strategy: How to choose bot for message: hash, then each chat gets
+        messages from the same bot, or round_robin, then bots send messages in turn.
+        :optional bot_max_failures: Bot is paused after this number of failed requests in a row,
+        messages are sent by other bots meanwhile. Bot is also paused when telegram
+        asks to retry later.
+        :optional bot_cooldown: Time in seconds while failed bot is paused.
+        :optional connect_timeout: Max time in seconds to connect to telegram or proxy.
+        If None, it is not limited.
+        :optional read_timeout: Max time in seconds to wait response from telegram.
+        If None, it is not limited.
+        Circuit breaker parameters:
+        :optional breaker_failures: Requests to telegram are stopped after this number of
+        failed requests in a row, i.e. network errors, timeouts or 5xx responses.
+        If 0, requests are never stopped.
+        :optional breaker_cooldown: Time in seconds while requests are stopped, then one record
+        is sent as probe. If it is sent, then requests are sent again.
+        :optional breaker_wait: Wait while requests are stopped instead of passing records
+        to fallback handler, e.g. when records are kept in spool.
+        :optional fallback_handler: Handler which gets records while requests are stopped.
+        If None, records are dropped.
+        :optional metrics: Metrics to update, e.g. metrics of TelegramHandler.
+        """
         super().__init__(*args, **kwargs)
+        self.pool_size = pool_size
+        self.connection_retries = connection_retries
+        self._session = None  # type: Optional[requests.Session]
+        self._session_lock = threading.Lock()
+        self.executor = None  # type: Optional[ThreadPoolExecutor]
+        if max_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='telegram_logger')
+        self.batcher = None  # type: Optional[MessageBatcher]
+        if batch_size > 1:
+            self.batcher = MessageBatcher(
+                self.send_batch, batch_size, batch_linger, TelegramFormatter.MAX_MESSAGE_SIZE
+            )
+        rate_limiter_factory = None  # type: Optional[Callable[[], RateLimiter]]
+        if rate_limit:
+            rate_limiter_factory = functools.partial(
+                RateLimiter, global_rate, global_burst, chat_rate, chat_burst
+            )
+        self.bot_pool = BotPool(
+            self.tokens, bot_strategy, bot_max_failures, bot_cooldown, rate_limiter_factory
+        )
+        self.retry_policy = RetryPolicy(retries, retry_backoff, retry_max_backoff)
+        self.retry_scheduler = RetryScheduler()
+        # Delivery of record or batch which is being sent by current thread
+        self._local = threading.local()
+        self.document_threshold_fragments = document_threshold_fragments
+        self.document_compress = document_compress
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = None  # type: Optional[CircuitBreaker]
+        if breaker_failures > 0:
+            self.breaker = CircuitBreaker(breaker_failures, breaker_cooldown)
+        self.breaker_wait = breaker_wait
+        self.fallback_handler = fallback_handler
+        self.metrics = metrics if metrics is not None else Metrics()
+        if self.breaker is not None:
+            breaker = self.breaker
+            self.metrics.set_gauge('breaker_open', lambda: int(breaker.state != CLOSED))
+        if len(self.tokens) > 1:
+            self.metrics.set_bot_health(self.bot_pool.get_health)
+        self.metrics.set_gauge('retry_waiting', self.retry_scheduler.qsize)
         # Set default formatter
         self.setFormatter(TelegramHtmlFormatter())
 
-    def send_message(self, chat_id: str, text: str, parse_mode: Optional[str]=None) -> None:
+    @property
+    def rate_limiter(self) -> Optional[RateLimiter]:
+        """
+        Rate limiter of the first bot.
+        """
+        return self.bot_pool.bots[0].rate_limiter
+
+    @property
+    def retried(self) -> int:
+        """
+        Number of retried requests.
+        """
+        return self.metrics.get('retried')
+
+    @property
+    def failed(self) -> int:
+        """
+        Number of messages and documents which were not sent.
+        """
+        return self.metrics.get('failed')
+
+    @property
+    def session(self) -> 'requests.Session':
+        """
+        Session which keeps connections to telegram alive, it is created on first use.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
+
+    def create_session(self) -> 'requests.Session':
+        """
+        Create session which keeps connections to telegram alive between messages.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(total=self.connection_retries, read=0, redirect=0),
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if self.proxies:
+            session.proxies.update(self.proxies)
+        return session
+
+    def send_message(self, chat_id: str, text: str, parse_mode: Optional[str]=None) -> bool:
         """
         Send message to telegram chat.
         :param chat_id: Telegram chat ID
         :param text: Text of message.
         :param parse_mode: Message format.
+
+        :return: False if message should be sent again later.
         """
-        if not parse_mode:
-            parse_mode = self.parse_mode
-        params = self._get_message_params()
-        params.update({
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': parse_mode,
-        })
-        response = requests.post(self.url, json=params, proxies=self.proxies)
+        return self._send(
+            chat_id, 'sendMessage', data=self.get_payload(chat_id, text, parse_mode),
+            headers=self.JSON_HEADERS
+        )
+
+    def send_document(self, chat_id: str, document: Any, filename: str,
+                      caption: Optional[str]=None) -> bool:
+        """
+        Send document to telegram chat.
+        :param chat_id: Telegram chat ID
+        :param document: Content of document, bytes-like object.
+        :param filename: Name of document.
+        :optional caption: Caption of document.
+
+        :return: False if document should be sent again later.
+        """
+        data = {'chat_id': chat_id}  # type: Dict[str, Any]
+        if caption:
+            data['caption'] = caption
+        if self.disable_notification:
+            data['disable_notification'] = self.disable_notification
+        files = {'document': (filename, document)}
+        return self._send(chat_id, 'sendDocument', data=data, files=files)
+
+    def _send(self, chat_id: str, method: str, **kwargs: Any) -> bool:
+        """
+        Post request to telegram and check response.
+        If record is being delivered, request which should be retried is put in lane
+        of chat in retry scheduler instead of waiting, as well as the following requests
+        to the chat while it has requests in lane.
+        :param chat_id: Telegram chat ID
+        :param method: Name of telegram bot api method.
+        :param kwargs: Parameters of request for session.
+
+        :return: False if telegram is not available or asks to retry and retries are over,
+        so request should be sent again later. Request rejected by telegram, e.g. with 400,
+        would be rejected again, so True is returned for it. Request put in lane is
+        considered sent, its result is reported to delivery.
+        """
+        delivery = getattr(self._local, 'delivery', None)  # type: Optional[Delivery]
+        if delivery is None:
+            return self._check_response(chat_id, self.post(chat_id, method, **kwargs))
+        later = functools.partial(self._attempt_later, delivery, chat_id, method, kwargs)
+        if self.retry_scheduler.is_waiting(chat_id):
+            # Messages to chat are sent in order
+            delivery.defer()
+            self.retry_scheduler.schedule(chat_id, later)
+            return True
+        response, delay = self.attempt(chat_id, method, 0, **kwargs)
+        if delay is None:
+            return self._check_response(chat_id, response)
+        delivery.defer()
+        self.retry_scheduler.schedule(chat_id, later, 1, delay)
+        return True
+
+    def _attempt_later(self, delivery: Delivery, chat_id: str, method: str,
+                       kwargs: Dict[str, Any], number: int) -> Optional[float]:
+        """
+        Make attempt of request from lane of retry scheduler.
+        :param delivery: Delivery which gets result of request.
+        :param chat_id: Telegram chat ID
+        :param method: Name of telegram bot api method.
+        :param kwargs: Parameters of request for session.
+        :param number: Number of attempt starting from 0.
+
+        :return: Delay in seconds before the next attempt or None if request is finished.
+        """
+        sent = False
+        try:
+            response, delay = self.attempt(chat_id, method, number, **kwargs)
+            if delay is not None:
+                return delay
+            sent = self._check_response(chat_id, response)
+        except Exception as exc:
+            logger.warning(f'Fail to send log message to chat {chat_id}: {exc}')
+        delivery.finish(sent)
+        return None
+
+    def _check_response(self, chat_id: str, response: Optional['requests.Response']) -> bool:
+        """
+        Check the last response of request.
+        :param chat_id: Telegram chat ID
+        :param response: The last response or None if telegram is not available.
+
+        :return: False if request should be sent again later.
+        """
+        if response is None:
+            return False
         if not response.ok:
             logger.warning(f'Request to telegram got error with code: {response.status_code}')
             logger.warning(f'Response is: {response.text}')
-            return
-        return self._process_response(chat_id, response.json())
+            return not self.retry_policy.should_retry(response.status_code)
+        self._process_response(chat_id, response.json())
+        return True
+
+    def post(self, chat_id: str, method: str, **kwargs: Any) -> Optional['requests.Response']:
+        """
+        Post request to telegram, retry it according to retry policy in calling thread.
+        :param chat_id: Telegram chat ID
+        :param method: Name of telegram bot api method.
+        :param kwargs: Parameters of request for session.
+
+        :return: The last response or None if telegram is not available.
+        """
+        number = 0
+        while True:
+            response, delay = self.attempt(chat_id, method, number, **kwargs)
+            if delay is None:
+                return response
+            self.retry_policy.sleep(delay)
+            number += 1
+
+    def attempt(self, chat_id: str, method: str, number: int,
+                **kwargs: Any) -> Tuple[Optional['requests.Response'], Optional[float]]:
+        """
+        Post request to telegram once.
+        Bot is chosen for each attempt, so retry can be sent by other bot.
+        :param chat_id: Telegram chat ID
+        :param method: Name of telegram bot api method.
+        :param number: Number of attempt starting from 0.
+        :param kwargs: Parameters of request for session.
+
+        :return: Response or None if telegram is not available, and delay in seconds
+        before retry or None if request should not be retried.
+        """
+        import requests
+
+        policy = self.retry_policy
+        metrics = self.metrics
+        pool = self.bot_pool
+        breaker = self.breaker
+        if breaker is not None and breaker.is_open:
+            # Telegram is not available, so listener is not blocked by requests and retries
+            metrics.inc('failed')
+            return None, None
+        bot = pool.choose(chat_id)
+        # Metrics of bots are kept only if there are several bots
+        bot_label = bot.label if len(pool.bots) > 1 else None
+        if bot.rate_limiter is not None:
+            bot.rate_limiter.acquire(chat_id)
+        start = time.perf_counter()
+        try:
+            # Proxies are passed explicitly, otherwise proxies from environment override them
+            response = self.session.post(
+                self.get_url(method, bot.token), timeout=self.timeout, proxies=self.proxies, **kwargs
+            )
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            metrics.observe('http_seconds', time.perf_counter() - start)
+            pool.report_failure(bot)
+            if breaker is not None:
+                breaker.record_failure()
+            if number >= policy.max_retries:
+                logger.warning(f'Fail to send log message to chat {chat_id}: {exc}')
+                metrics.inc('failed', bot=bot_label)
+                return None, None
+            metrics.inc('retried', bot=bot_label)
+            return None, policy.get_delay(number)
+        metrics.observe('http_seconds', time.perf_counter() - start)
+        if breaker is not None:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        if response.ok:
+            pool.report_success(bot)
+            metrics.inc('sent', bot=bot_label)
+            return response, None
+        retry_after = self._get_retry_after(response)
+        if response.status_code == policy.TOO_MANY_REQUESTS:
+            pool.report_failure(bot, retry_after)
+        elif response.status_code == 401 or response.status_code >= 500:
+            pool.report_failure(bot)
+        if number >= policy.max_retries or not policy.should_retry(response.status_code):
+            metrics.inc('failed', bot=bot_label)
+            return response, None
+        if retry_after is not None and pool.has_available():
+            # Other bot sends retry without waiting
+            retry_after = None
+        metrics.inc('retried', bot=bot_label)
+        return response, policy.get_delay(number, retry_after)
+
+    def _get_retry_after(self, response: 'requests.Response') -> Optional[float]:
+        """
+        Return delay which telegram requires before retry.
+        :param response: Response with error.
+        """
+        try:
+            return response.json()['parameters']['retry_after']
+        except (ValueError, KeyError, TypeError):
+            return None
 
     def emit(self, record: logging.LogRecord) -> None:
         """
         Send message to telegram chats.
         If formatter is subclass of TelegramFormatter them emit message
-        by fragments.
+        by fragments. In batch mode record is added to batch.
+        If there are too many fragments record is sent as document.
+        While circuit breaker is open record is passed to fallback handler or waits.
+        Requests which should be retried wait in lanes of retry scheduler, record from spool
+        is settled when all its requests are finished.
         :param record: Instance of log record.
         """
-        for chat_id in self.chat_ids:
-            if self.formatter and isinstance(self.formatter, TelegramFormatter):
-                for message in self.formatter.format_by_fragments(record):
-                    self.send_message(chat_id, message)
+        settle = getattr(record, 'telegram_settle', None)
+        if settle is not None:
+            # Spool keeps record till all its requests are finished
+            record.telegram_pending = True  # type: ignore
+        delivery = Delivery(settle)
+        sent = True
+        try:
+            breaker = self.breaker
+            if breaker is not None and not breaker.allow():
+                if not self.breaker_wait:
+                    self.reject(record)
+                    return
+                breaker.wait()
+            fragments = self.get_fragments(record)
+            self.metrics.observe('fragments_per_record', len(fragments))
+            with self.delivering(delivery):
+                sent = self.send_record(record, fragments)
+            # Batched record is counted when it is added to batch
+            self.metrics.observe('enqueue_to_send_seconds', max(time.time() - record.created, 0))
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+            return
+        finally:
+            delivery.finish(sent)
+        if not sent and hasattr(record, 'telegram_fragments'):
+            # Record formatted before, e.g. in spool, is kept there to be sent again
+            record.telegram_failed = True  # type: ignore
+
+    def reject(self, record: logging.LogRecord) -> None:
+        """
+        Pass record which is not sent because circuit breaker is open to fallback handler.
+        :param record: Instance of log record.
+        """
+        self.metrics.inc('rejected')
+        if self.fallback_handler is not None:
+            self.fallback_handler.handle(record)
+
+    def send_record(self, record: logging.LogRecord, fragments: List[str]) -> bool:
+        """
+        Send record as messages or document, or add it to batch.
+        :param record: Instance of log record.
+        :param fragments: Formatted messages of record.
+
+        :return: False if record was not sent to some chat and should be sent again later.
+        Record added to batch is considered sent, its delivery is finished when batch is sent.
+        """
+        threshold = self.document_threshold_fragments
+        if threshold and len(fragments) > threshold and (record.exc_info or record.exc_text):
+            try:
+                text, document = self.formatter.format_document(record)  # type: ignore
+            except (AttributeError, NotImplementedError):
+                pass
+            else:
+                if self.batcher is not None:
+                    self.batcher.flush()
+                return self.send_documents(text, document, self.get_document_filename(record))
+        if self.batcher is not None:
+            delivery = getattr(self._local, 'delivery', None)  # type: Optional[Delivery]
+            if delivery is None:
+                self.batcher.add(fragments)
             else:
-                message = self.format(record)
-                self.send_message(chat_id, message)
+                delivery.defer()
+                self.batcher.add(fragments, delivery.finish)
+            return True
+        return self.send_messages(fragments)
 
-    def _process_response(self, chat_id: str, response: Dict[str, Any]) -> None:
+    @contextmanager
+    def delivering(self, delivery: Optional[Delivery]) -> Iterator[None]:
         """
-        Check response from telegram and log warning if response got error.
-        :param chat_id: Telegram chat ID for sending log message.
-        :param response: Response as dict from telegram.
+        Deliver record or batch in current thread: requests which should be retried
+        are put in lanes of retry scheduler and report their results to delivery.
+        :param delivery: Delivery of record or batch.
         """
+        previous = getattr(self._local, 'delivery', None)
+        self._local.delivery = delivery
         try:
-            if not response['ok']:
-                logger.warning(f'Fail to send log message to chat {chat_id}: {response["description"]}')
-        except KeyError:
-            logger.warning(f'Unexpected response from telegram: {response}')
+            yield
+        finally:
+            self._local.delivery = previous
+
+    def _call_delivering(self, delivery: Optional[Delivery], func: Callable[..., bool],
+                         *args: Any) -> bool:
+        with self.delivering(delivery):
+            return func(*args)
+
+    def for_each_chat(self, func: Callable[..., bool], *args: Any) -> bool:
+        """
+        Call func(chat_id, *args) for every chat.
+        If handler has workers then chats are processed at the same time.
+        Errors are raised after all chats are processed.
+        :param func: Function which sends something to chat.
+
+        :return: True if func returned True for all chats.
+        """
+        if self.executor is None:
+            return all([func(chat_id, *args) for chat_id in self.chat_ids])
+        delivery = getattr(self._local, 'delivery', None)
+        futures = [
+            self.executor.submit(self._call_delivering, delivery, func, chat_id, *args)
+            for chat_id in self.chat_ids
+        ]
+        # Wait all chats, then raise first error if any
+        for future in futures:
+            future.exception()
+        return all([future.result() for future in futures])
+
+    def get_document_filename(self, record: logging.LogRecord) -> str:
+        """
+        Return name of document for log record.
+        :param record: Instance of log record.
+        """
+        filename = f'{record.name}.{int(record.created)}.txt'
+        if self.document_compress:
+            filename += '.gz'
+        return filename
+
+    def send_documents(self, text: str, document: str, filename: str) -> bool:
+        """
+        Send message and document to all chats.
+        Document is encoded once in memory buffer and shared by all chats and requests
+        which wait retry without copying.
+        :param text: Text of message.
+        :param document: Plain text of document.
+        :param filename: Name of document.
+
+        :return: False if message or document was not sent to some chat.
+        """
+        buffer = io.BytesIO()
+        if self.document_compress:
+            with gzip.GzipFile(filename=filename[:-3], mode='wb', fileobj=buffer) as file:
+                file.write(document.encode('utf-8', errors='replace'))
+        else:
+            buffer.write(document.encode('utf-8', errors='replace'))
+        return self.for_each_chat(self.send_document_to_chat, text, buffer.getbuffer(), filename)
+
+    def send_document_to_chat(self, chat_id: str, text: str, content: Any, filename: str) -> bool:
+        """
+        Send message and then document to one telegram chat.
+        :param chat_id: Telegram chat ID
+        :param text: Text of message.
+        :param content: Content of document.
+        :param filename: Name of document.
+
+        :return: False if message or document should be sent again later.
+        """
+        sent = self.send_message(chat_id, text)
+        return self.send_document(chat_id, content, filename) and sent
+
+    def send_messages(self, messages: List[str]) -> bool:
+        """
+        Send messages to all chats.
+        :param messages: Texts of messages.
+
+        :return: False if some message was not sent to some chat.
+        """
+        return self.for_each_chat(self.send_messages_to_chat, messages)
+
+    def send_messages_to_chat(self, chat_id: str, messages: List[str]) -> bool:
+        """
+        Send messages to one telegram chat in order.
+        :param chat_id: Telegram chat ID
+        :param messages: Texts of messages.
+
+        :return: False if some message should be sent again later.
+        """
+        sent = True
+        for message in messages:
+            sent = self.send_message(chat_id, message) and sent
+        return sent
+
+    def send_batch(self, messages: List[str], done: Callable[[bool], None]) -> None:
+        """
+        Send batch of records to all chats.
+        :param messages: Texts of messages.
+        :param done: Function which takes True if messages were sent, it is called when
+        all requests are finished, including requests which wait retry.
+        """
+        delivery = Delivery(done)
+        sent = False
+        try:
+            with self.delivering(delivery):
+                sent = self.send_messages(messages)
+        finally:
+            delivery.finish(sent)
+
+    def flush(self, timeout: Optional[float]=None) -> bool:  # type: ignore
+        """
+        Send batch of records and wait till requests which wait retry are finished.
+        :optional timeout: Max time to wait in seconds, if None then wait forever.
+
+        :return: True if all requests are finished before deadline.
+        """
+        if self.batcher is not None:
+            self.batcher.flush()
+        return self.retry_scheduler.join(timeout)
+
+    def close(self, wait: bool=True) -> None:
+        """
+        Send batch, wait sending messages and close connections to telegram.
+        :optional wait: If False, then batch is not sent and running requests are not
+        waited, connections are left to them, requests which wait retry are not sent.
+        """
+        if not wait:
+            self.retry_scheduler.stop()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            super().close()
+            return
+        self.flush()
+        self.retry_scheduler.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self._session is not None:
+            self._session.close()
+        super().close()
 
 
 class TelegramStreamHandler(MessageParamsMixin, logging.StreamHandler):
@@ -258,14 +1198,9 @@ class TelegramStreamHandler(MessageParamsMixin, logging.StreamHandler):
         """
         try:
             stream = self.stream
+            fragments = self.get_fragments(record)
             for chat_id in self.chat_ids:
-                if self.formatter and isinstance(self.formatter, TelegramFormatter):
-                    for message in self.formatter.format_by_fragments(record):
-                        data = self.get_send_message_data(chat_id, message)
-                        msg = json.dumps(data, ensure_ascii=False)
-                        stream.write(msg + self.terminator)
-                else:
-                    message = self.format(record)
+                for message in fragments:
                     data = self.get_send_message_data(chat_id, message)
                     msg = json.dumps(data, ensure_ascii=False)
                     stream.write(msg + self.terminator)
@@ -0,0 +1,262 @@
+from bisect import bisect_left
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+# Buckets of latency histograms in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Buckets of histogram of fragments per record
+FRAGMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
+# Descriptions of metrics for exporter
+DESCRIPTIONS = {
+    'enqueued': 'Records put to queue.',
+    'sent': 'Messages and documents sent to telegram.',
+    'failed': 'Messages and documents which were not sent.',
+    'retried': 'Retried requests to telegram.',
+    'dropped': 'Records dropped because queue was full.',
+    'rejected': 'Records which were not sent because circuit breaker was open.',
+    'queue_depth': 'Records waiting in queue.',
+    'retry_waiting': 'Requests which wait retry.',
+    'breaker_open': 'Circuit breaker stops requests to telegram.',
+    'fragments_per_record': 'Number of messages which record is split on.',
+    'enqueue_to_send_seconds': 'Time from creation of record till it is sent.',
+    'http_seconds': 'Time of request to telegram.',
+    'queue_wait_seconds': 'Time which record waited in priority queue by level.',
+    'bot_sent': 'Messages and documents sent by bot.',
+    'bot_failed': 'Messages and documents which bot failed to send.',
+    'bot_retried': 'Retried requests of bot.',
+    'bot_healthy': 'Bot is not paused after failures or rate limiting.',
+}
+
+
+class Histogram(object):
+    """
+    Histogram with fixed buckets like in Prometheus.
+    """
+    def __init__(self, buckets: Sequence[float]) -> None:
+        """
+        Initialization.
+        :param buckets: Sorted upper bounds of buckets, bucket +Inf is added.
+        """
+        self.buckets = tuple(buckets)
+        # Number of values in each bucket, the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Add value, call it with acquired lock of metrics.
+        :param value: Observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return cumulative counts of buckets, sum and count.
+        """
+        buckets = {}  # type: Dict[str, int]
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            buckets['+Inf' if bound == float('inf') else repr(bound)] = total
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    Counters, gauges and histograms of handler.
+    Counters and gauges can be computed by functions, e.g. depth of queue.
+    """
+    COUNTERS = ('enqueued', 'sent', 'failed', 'retried', 'dropped', 'rejected')
+    HISTOGRAMS = ('fragments_per_record', 'enqueue_to_send_seconds', 'http_seconds')
+    # Counters which are kept for each bot too
+    BOT_COUNTERS = ('sent', 'failed', 'retried')
+
+    def __init__(self, labels: Optional[Dict[str, str]]=None,
+                 latency_buckets: Sequence[float]=LATENCY_BUCKETS) -> None:
+        """
+        Initialization.
+        :optional labels: Labels of metrics for exporter, e.g. name of handler.
+        :optional latency_buckets: Buckets of latency histograms in seconds.
+        """
+        self.labels = labels or {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)  # type: Dict[str, int]
+        # Counters and gauges which are computed by functions
+        self.counter_functions = {}  # type: Dict[str, Callable[[], int]]
+        self.gauges = {}  # type: Dict[str, Callable[[], float]]
+        self.histograms = {
+            'fragments_per_record': Histogram(FRAGMENT_BUCKETS),
+            'enqueue_to_send_seconds': Histogram(latency_buckets),
+            'http_seconds': Histogram(latency_buckets),
+        }
+        self.latency_buckets = latency_buckets
+        # Histograms of waiting in priority queue by level name
+        self.queue_wait = {}  # type: Dict[str, Histogram]
+        # Counters of bots by labels of bots
+        self.bots = {}  # type: Dict[str, Dict[str, int]]
+        self.bot_health = None  # type: Optional[Callable[[], Dict[str, bool]]]
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: int=1, bot: Optional[str]=None) -> None:
+        """
+        Increase counter.
+        :param name: Name of counter.
+        :optional value: Increment.
+        :optional bot: Label of bot, if it is set then counter of bot is increased too.
+        """
+        with self.lock:
+            self.counters[name] += value
+            if bot is not None:
+                counters = self.bots.get(bot)
+                if counters is None:
+                    counters = self.bots[bot] = dict.fromkeys(self.BOT_COUNTERS, 0)
+                counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Add value to histogram.
+        :param name: Name of histogram.
+        :param value: Observed value.
+        """
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def observe_queue_wait(self, level: str, value: float) -> None:
+        """
+        Add time which record of level waited in queue.
+        :param level: Name of level.
+        :param value: Time in seconds.
+        """
+        with self.lock:
+            histogram = self.queue_wait.get(level)
+            if histogram is None:
+                histogram = self.queue_wait[level] = Histogram(self.latency_buckets)
+            histogram.observe(value)
+
+    def set_counter_function(self, name: str, func: Callable[[], int]) -> None:
+        """
+        Compute counter by function instead of increasing it.
+        :param name: Name of counter.
+        :param func: Function which returns value of counter.
+        """
+        self.counter_functions[name] = func
+
+    def set_bot_health(self, func: Callable[[], Dict[str, bool]]) -> None:
+        """
+        Set function which returns health of bots by their labels.
+        :param func: Function which returns True for healthy bots.
+        """
+        self.bot_health = func
+
+    def set_gauge(self, name: str, func: Callable[[], float]) -> None:
+        """
+        Add gauge which value is returned by function.
+        :param name: Name of gauge.
+        :param func: Function which returns current value.
+        """
+        self.gauges[name] = func
+
+    def get(self, name: str) -> int:
+        """
+        Return value of counter.
+        :param name: Name of counter.
+        """
+        func = self.counter_functions.get(name)
+        if func is not None:
+            return func()
+        return self.counters[name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return current values of all metrics.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            queue_wait = {level: histogram.snapshot() for level, histogram in self.queue_wait.items()}
+            bots = {bot: dict(counters) for bot, counters in self.bots.items()}
+        if self.bot_health is not None:
+            for bot, healthy in self.bot_health().items():
+                bots.setdefault(bot, dict.fromkeys(self.BOT_COUNTERS, 0))['healthy'] = healthy
+        for name, func in self.counter_functions.items():
+            counters[name] = func()
+        return {
+            'counters': counters,
+            'gauges': {name: func() for name, func in self.gauges.items()},
+            'histograms': histograms,
+            'queue_wait_seconds': queue_wait,
+            'bots': bots,
+        }
+
+
+def _format_labels(labels: Dict[str, str], **extra: str) -> str:
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return f'{{{pairs}}}'
+
+
+def format_prometheus(metrics_list: List[Metrics], prefix: str='telegram_logger') -> str:
+    """
+    Return metrics in Prometheus text format.
+    Metrics of several handlers should have different labels.
+    :param metrics_list: Metrics of handlers.
+    :optional prefix: Prefix of names of metrics.
+    """
+    snapshots = [(metrics.labels, metrics.snapshot()) for metrics in metrics_list]
+    lines = []  # type: List[str]
+
+    def add_header(name: str, description: str, kind: str) -> None:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    def add_histogram(name: str, labels: Dict[str, str], data: Dict[str, Any]) -> None:
+        for bound, count in data['buckets'].items():
+            lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {data["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {data["count"]}')
+
+    for counter in Metrics.COUNTERS:
+        name = f'{prefix}_{counter}_total'
+        add_header(name, DESCRIPTIONS[counter], 'counter')
+        for labels, snapshot in snapshots:
+            lines.append(f'{name}{_format_labels(labels)} {snapshot["counters"][counter]}')
+    gauges = sorted({gauge for _, snapshot in snapshots for gauge in snapshot['gauges']})
+    for gauge in gauges:
+        name = f'{prefix}_{gauge}'
+        add_header(name, DESCRIPTIONS.get(gauge, gauge), 'gauge')
+        for labels, snapshot in snapshots:
+            if gauge in snapshot['gauges']:
+                lines.append(f'{name}{_format_labels(labels)} {snapshot["gauges"][gauge]}')
+    for histogram in Metrics.HISTOGRAMS:
+        name = f'{prefix}_{histogram}'
+        add_header(name, DESCRIPTIONS[histogram], 'histogram')
+        for labels, snapshot in snapshots:
+            add_histogram(name, labels, snapshot['histograms'][histogram])
+    if any(snapshot['queue_wait_seconds'] for _, snapshot in snapshots):
+        name = f'{prefix}_queue_wait_seconds'
+        add_header(name, DESCRIPTIONS['queue_wait_seconds'], 'histogram')
+        for labels, snapshot in snapshots:
+            for level, data in sorted(snapshot['queue_wait_seconds'].items()):
+                add_histogram(name, dict(labels, level=level), data)
+    if any(snapshot['bots'] for _, snapshot in snapshots):
+        for counter in Metrics.BOT_COUNTERS:
+            name = f'{prefix}_bot_{counter}_total'
+            add_header(name, DESCRIPTIONS[f'bot_{counter}'], 'counter')
+            for labels, snapshot in snapshots:
+                for bot, counters in sorted(snapshot['bots'].items()):
+                    lines.append(f'{name}{_format_labels(labels, bot=bot)} {counters[counter]}')
+        name = f'{prefix}_bot_healthy'
+        add_header(name, DESCRIPTIONS['bot_healthy'], 'gauge')
+        for labels, snapshot in snapshots:
+            for bot, counters in sorted(snapshot['bots'].items()):
+                if 'healthy' in counters:
+                    lines.append(f'{name}{_format_labels(labels, bot=bot)} {int(counters["healthy"])}')
+    return '\n'.join(lines) + '\n'
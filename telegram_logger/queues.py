@@ -0,0 +1,351 @@
+from collections import deque
+import logging
+from queue import Queue, Full
+import sys
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+# Overflow policies
+# Drop record which is being put to full queue
+DROP_NEWEST = 'drop_newest'
+# Drop the oldest record in queue
+DROP_OLDEST = 'drop_oldest'
+# Drop the oldest record with the lowest level in queue or record which is being put
+DROP_LOWEST_LEVEL = 'drop_lowest_level'
+# Wait free place in queue for block_timeout seconds, then drop record which is being put
+BLOCK = 'block'
+
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, DROP_LOWEST_LEVEL, BLOCK)
+
+# Approximate size of traceback frame with its local variables
+FRAME_SIZE = 1024
+
+
+def get_record_size(record: Any) -> int:
+    """
+    Estimate size of log record in memory.
+    :param record: Log record instance.
+
+    :return: Size in bytes.
+    """
+    if record is None:
+        return 0
+    size = sys.getsizeof(record)
+    for value in getattr(record, '__dict__', {}).values():
+        size += sys.getsizeof(value)
+    exc_info = getattr(record, 'exc_info', None)
+    if exc_info and exc_info[2] is not None:
+        tb = exc_info[2]
+        while tb is not None:
+            size += FRAME_SIZE
+            tb = tb.tb_next
+    return size
+
+
+class TelegramQueue(Queue):
+    """
+    Queue of log records limited by number of records and by their size in bytes.
+    When queue is full records are dropped according to overflow policy.
+    Count of dropped records is kept in attribute dropped. When queue has free place again
+    after records were dropped it puts notice about dropped records made by notice_factory.
+    Place appears when record is put or taken, so notice is not lost if nothing is logged
+    after records were dropped.
+    Sentinel None of QueueListener is counted apart from records, it takes no place and
+    is never dropped, it is given after all records.
+    """
+    def __init__(self, maxsize: int=0, max_bytes: int=0, overflow_policy: str=DROP_NEWEST,
+                 block_timeout: Optional[float]=None,
+                 notice_factory: Optional[Callable[[int], Any]]=None) -> None:
+        """
+        Initialization.
+        :optional maxsize: Max number of records in queue. If maxsize <= 0, queue size is infinite.
+        :optional max_bytes: Max size of records in queue in bytes. If max_bytes <= 0,
+        size is not limited.
+        :optional overflow_policy: What to do when queue is full, one of OVERFLOW_POLICIES.
+        :optional block_timeout: How long to wait free place for policy BLOCK.
+        If None then wait forever.
+        :optional notice_factory: Function which takes number of dropped records
+        and returns record to notice about them.
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f'Unknown overflow policy {overflow_policy}, use one of {OVERFLOW_POLICIES}'
+            )
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.notice_factory = notice_factory
+        # Number of all dropped records
+        self.dropped = 0
+        # Number of dropped records which are not noticed yet
+        self._unnoticed = 0
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self.queue = deque()  # type: Deque[Tuple[int, Any]]
+        self._sentinels = 0
+        self.bytes = 0
+
+    def _qsize(self) -> int:
+        return len(self.queue) + self._sentinels
+
+    def _put(self, item: Tuple[int, Any]) -> None:
+        if item[1] is None:
+            self._sentinels += 1
+            return
+        self.queue.append(item)
+        self.bytes += item[0]
+
+    def _get(self) -> Any:
+        if not self.queue:
+            self._sentinels -= 1
+            return None
+        size, record = self.queue.popleft()
+        self.bytes -= size
+        return record
+
+    def _is_full(self, size: int) -> bool:
+        """
+        Check is there place for record of given size.
+        Record larger than max_bytes is accepted by empty queue. Sentinels take no place.
+        """
+        qsize = self._qsize() - self._sentinels
+        if 0 < self.maxsize <= qsize:
+            return True
+        return 0 < self.max_bytes < self.bytes + size and qsize > 0
+
+    def _add(self, record: Any, size: int) -> None:
+        """
+        Add record to queue, call it with acquired mutex.
+        """
+        self._put((size, record))
+        self.unfinished_tasks += 1
+        self.not_empty.notify()
+
+    def _remove(self, index: Any) -> int:
+        """
+        Remove record from queue.
+        :param index: Index of record in queue.
+        :return: Size of removed record.
+        """
+        size, _ = self.queue[index]
+        del self.queue[index]
+        return size
+
+    def _drop(self, index: Any) -> None:
+        """
+        Drop record from queue, call it with acquired mutex.
+        :param index: Index of record in queue.
+        """
+        self.bytes -= self._remove(index)
+        self._count_dropped()
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
+
+    def _count_dropped(self) -> None:
+        self.dropped += 1
+        self._unnoticed += 1
+
+    def _add_notice(self) -> None:
+        """
+        Put notice about dropped records if there is place for it, call it with acquired mutex.
+        """
+        if self._unnoticed and self.notice_factory is not None:
+            notice = self.notice_factory(self._unnoticed)
+            notice_size = get_record_size(notice)
+            if not self._is_full(notice_size):
+                self._unnoticed = 0
+                self._add(notice, notice_size)
+
+    def _find_oldest(self) -> Any:
+        """
+        Return index of the oldest record.
+        """
+        return 0
+
+    def _find_lowest_level(self) -> Tuple[Any, int]:
+        """
+        Return index and level of the oldest record with the lowest level.
+        """
+        lowest_index, lowest_level = 0, sys.maxsize
+        for index, (_, record) in enumerate(self.queue):
+            levelno = getattr(record, 'levelno', logging.NOTSET)
+            if levelno < lowest_level:
+                lowest_index, lowest_level = index, levelno
+        return lowest_index, lowest_level
+
+    def _make_room(self, record: Any, size: int) -> bool:
+        """
+        Free place for record according to overflow policy, call it with acquired mutex.
+        :return: True if there is place for record now.
+        """
+        if self.overflow_policy == BLOCK:
+            if self.block_timeout is None:
+                while self._is_full(size):
+                    self.not_full.wait()
+                return True
+            deadline = time.monotonic() + self.block_timeout
+            while self._is_full(size):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.not_full.wait(remaining)
+            return True
+        if self.overflow_policy == DROP_OLDEST:
+            while self._is_full(size):
+                index = self._find_oldest()
+                if index is None:
+                    return False
+                self._drop(index)
+            return True
+        if self.overflow_policy == DROP_LOWEST_LEVEL:
+            levelno = getattr(record, 'levelno', logging.NOTSET)
+            while self._is_full(size):
+                index, lowest_level = self._find_lowest_level()
+                if levelno < lowest_level:
+                    return False
+                self._drop(index)
+            return True
+        return False
+
+    def put(self, item: Any, block: bool=True, timeout: Optional[float]=None) -> None:
+        """
+        Put record into queue. Queue always behaves according to overflow policy,
+        so arguments block and timeout are ignored.
+        None is put as is, QueueListener uses it as sentinel to stop.
+        :raise Full: If record was dropped.
+        """
+        with self.not_full:
+            if item is None:
+                self._add(item, 0)
+                return
+            size = get_record_size(item)
+            if self._is_full(size) and not self._make_room(item, size):
+                self._count_dropped()
+                raise Full
+            self._add(item, size)
+            self._add_notice()
+
+    def get(self, block: bool=True, timeout: Optional[float]=None) -> Any:
+        """
+        Remove and return record from queue.
+        Taken record frees place, so notice about dropped records is put.
+        If sentinel None is taken while there are dropped records which are not noticed,
+        notice is returned and sentinel is put back, so listener handles notice before stop.
+        """
+        record = super().get(block, timeout)
+        with self.mutex:
+            if record is not None:
+                self._add_notice()
+            elif self._unnoticed and self.notice_factory is not None:
+                notice = self.notice_factory(self._unnoticed)
+                self._unnoticed = 0
+                self._add(None, 0)
+                return notice
+        return record
+
+
+class PriorityTelegramQueue(TelegramQueue):
+    """
+    Queue which gives records with higher level first, records of the same level
+    are given in order they were put.
+    To not starve lower levels, record which waits longer than max_delay is given before
+    records with higher level.
+    Sentinel None is given after all records.
+    """
+    def __init__(self, *args, max_delay: Optional[float]=60.0,
+                 wait_observer: Optional[Callable[[int, float], None]]=None,
+                 clock: Callable[[], float]=time.monotonic, **kwargs) -> None:
+        """
+        Initialization.
+        :optional max_delay: Max time in seconds which record waits before it overtakes
+        records with higher level. If None, lower levels wait while there are higher ones.
+        :optional wait_observer: Function which takes level and time in seconds which
+        record waited in queue, it is called with acquired mutex of queue.
+        :optional clock: Function which returns current time in seconds.
+        Other parameters are the same as for TelegramQueue.
+        """
+        self.max_delay = max_delay
+        self.wait_observer = wait_observer
+        self.clock = clock
+        super().__init__(*args, **kwargs)
+
+    def _init(self, maxsize: int) -> None:
+        # Records of each level: (number, size, record, time of putting)
+        self.levels = {}  # type: Dict[int, Deque[Tuple[int, int, Any, float]]]
+        # Levels from the highest one
+        self._order = []  # type: List[int]
+        self._count = 0
+        self._number = 0
+        self._sentinels = 0
+        self.bytes = 0
+
+    def _qsize(self) -> int:
+        return self._count + self._sentinels
+
+    def _put(self, item: Tuple[int, Any]) -> None:
+        size, record = item
+        if record is None:
+            self._sentinels += 1
+            return
+        levelno = getattr(record, 'levelno', logging.NOTSET)
+        records = self.levels.get(levelno)
+        if records is None:
+            records = self.levels[levelno] = deque()
+            self._order = sorted(self.levels, reverse=True)
+        records.append((self._number, size, record, self.clock()))
+        self._number += 1
+        self._count += 1
+        self.bytes += size
+
+    def _choose_level(self, now: float) -> Optional[int]:
+        """
+        Return level of the next record: level of the oldest record which waits too long,
+        otherwise the highest level.
+        """
+        chosen = None  # type: Optional[int]
+        if self.max_delay is not None:
+            oldest = None  # type: Optional[int]
+            for levelno in self._order:
+                records = self.levels[levelno]
+                if records and now - records[0][3] > self.max_delay:
+                    if oldest is None or records[0][0] < oldest:
+                        chosen, oldest = levelno, records[0][0]
+        if chosen is None:
+            for levelno in self._order:
+                if self.levels[levelno]:
+                    return levelno
+        return chosen
+
+    def _get(self) -> Any:
+        now = self.clock()
+        levelno = self._choose_level(now)
+        if levelno is None:
+            self._sentinels -= 1
+            return None
+        _, size, record, put_time = self.levels[levelno].popleft()
+        self._count -= 1
+        self.bytes -= size
+        if self.wait_observer is not None:
+            self.wait_observer(levelno, now - put_time)
+        return record
+
+    def _remove(self, index: Tuple[int, int]) -> int:
+        levelno, position = index
+        records = self.levels[levelno]
+        size = records[position][1]
+        del records[position]
+        self._count -= 1
+        return size
+
+    def _find_oldest(self) -> Optional[Tuple[int, int]]:
+        heads = [(records[0][0], levelno) for levelno, records in self.levels.items() if records]
+        return (min(heads)[1], 0) if heads else None
+
+    def _find_lowest_level(self) -> Tuple[Any, int]:
+        for levelno in reversed(self._order):
+            if self.levels[levelno]:
+                return (levelno, 0), levelno
+        return None, sys.maxsize
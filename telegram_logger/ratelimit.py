@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Callable, Dict
+
+
+# Telegram limits, see https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+# About 30 messages per second for bot
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+# About 20 messages per minute for group
+CHAT_RATE = 20 / 60
+CHAT_BURST = 20
+
+
+class TokenBucket(object):
+    """
+    Token bucket, each message takes one token.
+    Tokens are added with constant rate up to capacity.
+    """
+    def __init__(self, rate: float, capacity: float,
+                 clock: Callable[[], float]=time.monotonic,
+                 sleep: Callable[[float], None]=time.sleep) -> None:
+        """
+        Initialization.
+        :param rate: How many tokens are added per second.
+        :param capacity: Max number of tokens, i.e. how many messages can be sent at once.
+        :optional clock: Function which returns current time in seconds.
+        :optional sleep: Function which sleeps given number of seconds.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """
+        Add tokens for time since last update, call it with acquired lock.
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Take token, if there is no token then reserve the next one.
+        :return: How many seconds to wait before sending.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def try_take(self) -> float:
+        """
+        Take token if there is one, otherwise nothing is taken.
+        :return: 0 if token is taken, else how many seconds to wait the next token.
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """
+        Take token, wait if there is no token.
+        """
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+
+class RateLimiter(object):
+    """
+    Limit rate of messages for bot and for each chat.
+    Message waits free token instead of being rejected by telegram.
+    """
+    def __init__(self, global_rate: float=GLOBAL_RATE, global_burst: float=GLOBAL_BURST,
+                 chat_rate: float=CHAT_RATE, chat_burst: float=CHAT_BURST,
+                 clock: Callable[[], float]=time.monotonic,
+                 sleep: Callable[[float], None]=time.sleep) -> None:
+        """
+        Initialization.
+        :optional global_rate: Messages per second for bot.
+        :optional global_burst: How many messages bot can send at once.
+        :optional chat_rate: Messages per second for one chat.
+        :optional chat_burst: How many messages can be sent to one chat at once.
+        :optional clock: Function which returns current time in seconds.
+        :optional sleep: Function which sleeps given number of seconds.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock=clock, sleep=sleep)
+        self.chat_buckets = {}  # type: Dict[str, TokenBucket]
+        self.lock = threading.Lock()
+
+    def get_chat_bucket(self, chat_id: str) -> TokenBucket:
+        """
+        Return bucket of chat, create it for new chat.
+        :param chat_id: Telegram chat ID
+        """
+        with self.lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, clock=self.clock, sleep=self.sleep)
+                self.chat_buckets[chat_id] = bucket
+            return bucket
+
+    def acquire(self, chat_id: str) -> None:
+        """
+        Wait till message can be sent to chat.
+        Chat token is taken first, so waiting for busy chat doesn't hold bot token.
+        :param chat_id: Telegram chat ID
+        """
+        self.get_chat_bucket(chat_id).acquire()
+        self.global_bucket.acquire()
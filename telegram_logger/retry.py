@@ -0,0 +1,214 @@
+from collections import deque
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+class RetryPolicy(object):
+    """
+    Policy for retrying failed requests to telegram with exponential backoff and jitter.
+    Too many requests (429) and server errors (5xx) are retried,
+    other client errors such as 400 or 403 are never retried.
+    """
+    # Status code of too many requests
+    TOO_MANY_REQUESTS = 429
+
+    def __init__(self, max_retries: int=3, backoff_factor: float=0.5, max_backoff: float=30.0,
+                 jitter: bool=True, sleep: Callable[[float], None]=time.sleep,
+                 random: Callable[[], float]=random.random) -> None:
+        """
+        Initialization.
+        :optional max_retries: Max number of retries for one message.
+        :optional backoff_factor: Delay before the first retry in seconds,
+        next delays are doubled.
+        :optional max_backoff: Max delay before retry in seconds.
+        :optional jitter: Randomize delay from half to full value to spread retries.
+        :optional sleep: Function which sleeps given number of seconds.
+        :optional random: Function which returns random number in [0, 1).
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.sleep = sleep
+        self.random = random
+
+    def should_retry(self, status_code: int) -> bool:
+        """
+        Check if request with response status should be retried.
+        :param status_code: Response status code.
+        """
+        return status_code == self.TOO_MANY_REQUESTS or 500 <= status_code < 600
+
+    def get_delay(self, attempt: int, retry_after: Optional[float]=None) -> float:
+        """
+        Return delay before retry.
+        :param attempt: Number of failed attempt starting from 0.
+        :optional retry_after: Delay required by telegram, it is used as is.
+        """
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** attempt)
+        if self.jitter:
+            delay = delay / 2 + delay / 2 * self.random()
+        return delay
+
+
+class Delivery(object):
+    """
+    Result of sending record or batch to all chats.
+    Requests which wait retry in RetryScheduler are done later, so result is reported
+    to function done when the sending itself and all deferred requests are finished.
+    """
+    def __init__(self, done: Optional[Callable[[bool], None]]=None) -> None:
+        """
+        Initialization.
+        :optional done: Function which takes True if all requests were sent.
+        """
+        self.done = done
+        self.sent = True
+        # Sending itself and deferred requests which are not finished
+        self._unfinished = 1
+        self.lock = threading.Lock()
+
+    def defer(self) -> None:
+        """
+        Count request which is finished later.
+        """
+        with self.lock:
+            self._unfinished += 1
+
+    def finish(self, sent: bool) -> None:
+        """
+        Finish sending or deferred request, report result when all of them are finished.
+        :param sent: False if request was not sent and should be sent again later.
+        """
+        with self.lock:
+            self.sent = self.sent and bool(sent)
+            self._unfinished -= 1
+            if self._unfinished:
+                return
+        if self.done is not None:
+            self.done(self.sent)
+
+
+class RetryScheduler(object):
+    """
+    Requests which wait before retry, each chat has its own lane of them.
+    Background thread makes attempt when its delay is over, so waiting doesn't block
+    other chats. Requests of one chat are made in order: while chat has request in lane,
+    the following requests to this chat are put in lane behind it.
+    """
+    def __init__(self, clock: Callable[[], float]=time.monotonic) -> None:
+        """
+        Initialization.
+        :optional clock: Function which returns current time in seconds.
+        """
+        self.clock = clock
+        # Requests of each chat: [time of attempt, number of attempt, function]
+        self.lanes = {}  # type: Dict[Any, Deque[List[Any]]]
+        self.condition = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+        self._stopped = False
+
+    def is_waiting(self, chat_id: Any) -> bool:
+        """
+        Check if chat has requests in lane.
+        :param chat_id: Telegram chat ID.
+        """
+        with self.condition:
+            return chat_id in self.lanes
+
+    def qsize(self) -> int:
+        """
+        Return number of requests in lanes.
+        """
+        with self.condition:
+            return sum(len(lane) for lane in self.lanes.values())
+
+    def schedule(self, chat_id: Any, attempt: Callable[[int], Optional[float]], number: int=0,
+                 delay: float=0.0) -> None:
+        """
+        Put request to lane of chat.
+        :param chat_id: Telegram chat ID.
+        :param attempt: Function which takes number of attempt, makes it and returns
+        delay in seconds before the next attempt or None if request is finished.
+        :optional number: Number of the next attempt.
+        :optional delay: Time in seconds before the next attempt.
+        """
+        with self.condition:
+            self.lanes.setdefault(chat_id, deque()).append([self.clock() + delay, number, attempt])
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='telegram_logger_retry', daemon=True
+                )
+                self._thread.start()
+            self.condition.notify_all()
+
+    def _wait_ready(self) -> List[Any]:
+        """
+        Wait till some requests can be attempted, call it with acquired condition.
+        :return: Chat IDs and requests, empty list if scheduler is stopped.
+        """
+        while not self._stopped:
+            now = self.clock()
+            ready = [(chat_id, lane[0]) for chat_id, lane in self.lanes.items() if lane[0][0] <= now]
+            if ready:
+                return ready
+            heads = [lane[0][0] for lane in self.lanes.values()]
+            self.condition.wait(min(heads) - now if heads else None)
+        return []
+
+    def _run(self) -> None:
+        """
+        Make attempts of requests when they are ready.
+        """
+        while True:
+            with self.condition:
+                ready = self._wait_ready()
+            if not ready:
+                return
+            for chat_id, request in ready:
+                try:
+                    delay = request[2](request[1])
+                except Exception:
+                    # Attempt reports its errors itself, lane must not stop
+                    delay = None
+                with self.condition:
+                    if delay is None:
+                        lane = self.lanes[chat_id]
+                        lane.popleft()
+                        if not lane:
+                            del self.lanes[chat_id]
+                        self.condition.notify_all()
+                    else:
+                        request[0] = self.clock() + delay
+                        request[1] += 1
+
+    def join(self, timeout: Optional[float]=None) -> bool:
+        """
+        Wait till all requests are finished.
+        :optional timeout: Max time to wait in seconds, if None then wait forever.
+
+        :return: True if all requests are finished.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.lanes and not self._stopped:
+                if deadline is None:
+                    self.condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return not self.lanes
+
+    def stop(self) -> None:
+        """
+        Stop background thread, requests left in lanes are not made.
+        """
+        with self.condition:
+            self._stopped = True
+            self.condition.notify_all()
@@ -0,0 +1,72 @@
+from telegram_logger.formatters import get_exception_fingerprint
+
+import logging
+from typing import Any, Dict, Optional
+
+
+# Prepare modes of TelegramHandler
+# Put log record to queue as it is
+PREPARE_RECORD = 'record'
+# Put compact snapshot of log record to queue
+PREPARE_SNAPSHOT = 'snapshot'
+
+PREPARE_MODES = (PREPARE_RECORD, PREPARE_SNAPSHOT)
+
+# Attributes of log record which are copied to snapshot as they are
+COPIED_ATTRS = (
+    'name', 'levelno', 'levelname', 'pathname', 'filename', 'module', 'lineno', 'funcName',
+    'created', 'msecs', 'relativeCreated', 'thread', 'threadName', 'process', 'processName',
+    'stack_info',
+)
+
+
+class RecordSnapshot(object):
+    """
+    Compact copy of log record for queue.
+    It keeps only attributes which formatters use: message is rendered with arguments and
+    exception is rendered to exc_text, so traceback with frames and their local variables,
+    arguments and extra attributes of record are not kept alive while record waits in queue.
+    It can be formatted like log record, but exc_info is always None,
+    fingerprint of exception is kept in exc_fingerprint.
+    """
+    __slots__ = COPIED_ATTRS + (
+        'msg', 'args', 'exc_info', 'exc_text', 'exc_fingerprint', 'taskName', 'message', 'asctime',
+        '__weakref__',
+    )
+
+    def __init__(self, record: logging.LogRecord, formatter: Optional[logging.Formatter]=None) -> None:
+        """
+        Initialization.
+        :param record: Log record instance.
+        :optional formatter: Formatter which renders exception, default is logging.Formatter.
+        """
+        for attr in COPIED_ATTRS:
+            setattr(self, attr, getattr(record, attr, None))
+        self.msg = record.getMessage()
+        self.args = None
+        self.exc_info = None
+        self.exc_text = record.exc_text
+        self.exc_fingerprint = None  # type: Optional[str]
+        if record.exc_info:
+            if not self.exc_text:
+                self.exc_text = (formatter or _default_formatter).formatException(record.exc_info)
+            self.exc_fingerprint = get_exception_fingerprint(record.exc_info)
+        self.taskName = getattr(record, 'taskName', None)
+
+    def getMessage(self) -> str:
+        return self.msg
+
+    @property
+    def __dict__(self) -> Dict[str, Any]:  # type: ignore
+        """
+        Attributes of snapshot for format strings like %(module)s.
+        """
+        return {attr: getattr(self, attr) for attr in self.__slots__[:-1] if hasattr(self, attr)}
+
+    def __repr__(self) -> str:
+        return '<RecordSnapshot: %(name)s, %(levelno)s, %(pathname)s, %(lineno)s, "%(msg)s">' % (
+            self.__dict__
+        )
+
+
+_default_formatter = logging.Formatter()
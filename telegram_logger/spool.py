@@ -0,0 +1,209 @@
+from collections import deque
+import functools
+import json
+import logging
+from queue import Queue
+from typing import Any, Deque, Dict, Optional, Tuple
+import zlib
+
+
+# Attributes of log record which are kept in spool
+SPOOLED_ATTRS = ('name', 'levelno', 'levelname', 'created', 'module', 'funcName', 'lineno')
+
+
+def serialize_record(record: logging.LogRecord) -> bytes:
+    """
+    Serialize formatted log record to compact bytes.
+    Record must have attribute telegram_fragments with formatted fragments.
+    Message is rendered with arguments, so template of message and type of exception
+    are kept in attributes telegram_template and telegram_exc_type to find duplicates.
+    :param record: Log record instance.
+    """
+    data = {attr: getattr(record, attr, None) for attr in SPOOLED_ATTRS}  # type: Dict[str, Any]
+    data['msg'] = record.getMessage()
+    data['telegram_template'] = getattr(record, 'telegram_template', str(record.msg))
+    exc_type = getattr(record, 'telegram_exc_type', None)
+    if record.exc_info and record.exc_info[0] is not None:
+        exc_type = f'{record.exc_info[0].__module__}.{record.exc_info[0].__qualname__}'
+    data['telegram_exc_type'] = exc_type
+    data['telegram_fragments'] = record.telegram_fragments  # type: ignore
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(payload.encode('utf-8', errors='replace'))
+
+
+def deserialize_record(payload: bytes) -> logging.LogRecord:
+    """
+    Make log record from serialized bytes.
+    :param payload: Serialized record.
+    """
+    return logging.makeLogRecord(json.loads(zlib.decompress(payload).decode('utf-8')))
+
+
+class SpoolQueue(Queue):
+    """
+    Queue which keeps formatted log records in local SQLite file.
+    Records survive restart of process and are sent when listener starts again.
+    Record is removed from file when it is processed, i.e. when task_done is called,
+    unless handler marked it with attribute telegram_failed. Such record is left in file
+    and is taken again when some record is sent or when listener starts again.
+    Handler which sends record later, e.g. in batch, marks it with attribute telegram_pending
+    and calls its attribute telegram_settle with result of sending.
+    Size of file is limited by max_bytes, the oldest records are dropped when it is exceeded.
+    """
+    def __init__(self, path: str, max_bytes: int=0) -> None:
+        """
+        Initialization.
+        :param path: Path to SQLite file.
+        :optional max_bytes: Max size of records in file. If max_bytes <= 0, size is not limited.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        # Number of records dropped because spool was full
+        self.dropped = 0
+        super().__init__()
+        # Records left from previous run must be processed too
+        self.unfinished_tasks = self._count
+
+    def _init(self, maxsize: int) -> None:
+        import sqlite3
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, size INTEGER NOT NULL, payload BLOB NOT NULL)'
+        )
+        count, size = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM records'
+        ).fetchone()
+        # Number of records which are not taken yet
+        self._count = count
+        # Size of all records in file
+        self.bytes = size
+        # Id of the last taken record
+        self._last_id = 0
+        # Taken records which are not processed yet, (id, size, record), id is None for sentinel
+        self._taken = deque()  # type: Deque[Tuple[Optional[int], int, Optional[logging.LogRecord]]]
+        # Records which were not sent and wait till some record is sent, (id, size)
+        self._kept = deque()  # type: Deque[Tuple[int, int]]
+        # Kept records which are taken again before new ones, (id, size)
+        self._retry = deque()  # type: Deque[Tuple[int, int]]
+        self._sentinels = 0
+
+    def _qsize(self) -> int:
+        return self._count + self._sentinels
+
+    def _put(self, item: Optional[logging.LogRecord]) -> None:
+        if item is None:
+            # QueueListener uses None as sentinel to stop, it is not kept in file
+            self._sentinels += 1
+            return
+        payload = serialize_record(item)
+        self.connection.execute(
+            'INSERT INTO records (size, payload) VALUES (?, ?)', (len(payload), payload)
+        )
+        self._count += 1
+        self.bytes += len(payload)
+        self._trim()
+
+    def _trim(self) -> None:
+        """
+        Drop records which were not sent, then the oldest records which are not taken
+        while size of file exceeds max_bytes. The last record is kept.
+        """
+        while 0 < self.max_bytes < self.bytes:
+            if self._kept:
+                record_id, size = self._kept.popleft()
+            elif self._count > 1:
+                if self._retry:
+                    record_id, size = self._retry.popleft()
+                else:
+                    record_id, size = self.connection.execute(
+                        'SELECT id, size FROM records WHERE id > ? ORDER BY id LIMIT 1',
+                        (self._last_id,)
+                    ).fetchone()
+                self._count -= 1
+                self.unfinished_tasks -= 1
+            else:
+                break
+            self.connection.execute('DELETE FROM records WHERE id = ?', (record_id,))
+            self.bytes -= size
+            self.dropped += 1
+
+    def _get(self) -> Optional[logging.LogRecord]:
+        row = None
+        if self._retry:
+            row = self.connection.execute(
+                'SELECT id, size, payload FROM records WHERE id = ?', (self._retry.popleft()[0],)
+            ).fetchone()
+        elif self._count:
+            row = self.connection.execute(
+                'SELECT id, size, payload FROM records WHERE id > ? ORDER BY id LIMIT 1',
+                (self._last_id,)
+            ).fetchone()
+            if row is not None:
+                self._last_id = row[0]
+        if row is None:
+            self._sentinels -= 1
+            self._taken.append((None, 0, None))
+            return None
+        record_id, size, payload = row
+        self._count -= 1
+        record = deserialize_record(payload)
+        record.telegram_settle = functools.partial(self.settle, record_id, size)  # type: ignore
+        self._taken.append((record_id, size, record))
+        return record
+
+    def task_done(self) -> None:
+        """
+        Remove the oldest taken record from file if it was sent, otherwise keep it
+        till some record is sent. Record which handler sends later is settled by handler.
+        """
+        with self.all_tasks_done:
+            if self._taken:
+                record_id, size, record = self._taken.popleft()
+                if record_id is not None and not getattr(record, 'telegram_pending', False):
+                    self._settle(record_id, size, not getattr(record, 'telegram_failed', False))
+        super().task_done()
+
+    def settle(self, record_id: int, size: int, sent: bool) -> None:
+        """
+        Remove record from file if it was sent, otherwise keep it till some record is sent.
+        :param record_id: Id of record in file.
+        :param size: Size of record in file.
+        :param sent: True if record was sent.
+        """
+        with self.mutex:
+            self._settle(record_id, size, sent)
+
+    def _settle(self, record_id: int, size: int, sent: bool) -> None:
+        """
+        Remove or keep record, call it with acquired mutex.
+        """
+        if not sent:
+            self._kept.append((record_id, size))
+            return
+        self.connection.execute('DELETE FROM records WHERE id = ?', (record_id,))
+        self.bytes -= size
+        if self._kept:
+            # Telegram is available again, so records which were not sent are taken again
+            self._retry.extend(self._kept)
+            self._count += len(self._kept)
+            self.unfinished_tasks += len(self._kept)
+            self._kept.clear()
+            self.not_empty.notify()
+
+    @property
+    def kept(self) -> int:
+        """
+        Number of records which were not sent and wait in file till some record is sent.
+        """
+        return len(self._kept)
+
+    def close(self) -> None:
+        """
+        Close SQLite file.
+        """
+        with self.mutex:
+            self.connection.close()
@@ -1,3 +1,4 @@
+from telegram_logger.fake_api import run_fake_api
 from telegram_logger.formatters import TelegramHtmlFormatter
 
 from faker import Faker
@@ -33,4 +34,13 @@ def message_splits_on_3_fragments():
         timestamp = fake.iso8601(),
         msg = 'Sample error',
         description = f"{start_code}{description}{end_code}"
-    )
\ No newline at end of file
+    )
+
+
+@pytest.fixture()
+def fake_api():
+    """
+    Local fake Telegram Bot API, change its attributes to add latency, errors and limits.
+    """
+    with run_fake_api() as server:
+        yield server
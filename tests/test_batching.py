@@ -0,0 +1,80 @@
+from telegram_logger.batching import MessageBatcher
+
+import threading
+
+
+class TestMessageBatcher:
+
+    def setup_method(self, method):
+        self.sent = []
+        self.batcher = MessageBatcher(self.send, max_records=10, linger=60, max_size=30)
+
+    def send(self, messages, done):
+        self.sent.extend(messages)
+        done(True)
+
+    def teardown_method(self, method):
+        self.batcher.flush()
+
+    def test_pack_records_to_one_message(self):
+        self.batcher.add(['first'])
+        self.batcher.add(['second'])
+        assert self.sent == []
+        self.batcher.flush()
+        assert self.sent == ['first' + MessageBatcher.SEPARATOR + 'second']
+
+    def test_flush_by_size(self):
+        self.batcher.add(['a' * 20])
+        self.batcher.add(['b' * 20])
+        assert self.sent == ['a' * 20]
+        self.batcher.flush()
+        assert self.sent == ['a' * 20, 'b' * 20]
+
+    def test_message_size_limit(self):
+        self.batcher.add(['a' * 14])
+        self.batcher.add(['b' * 14])
+        self.batcher.add(['c' * 14])
+        self.batcher.flush()
+        assert all(len(message) <= self.batcher.max_size for message in self.sent)
+        assert len(self.sent) == 2
+
+    def test_fragments_are_not_split(self):
+        fragments = ['<pre>' + 'a' * 15 + '</pre>', '<pre>' + 'b' * 15 + '</pre>']
+        self.batcher.add(['info'])
+        self.batcher.add(fragments)
+        self.batcher.flush()
+        assert self.sent == ['info', fragments[0], fragments[1]]
+
+    def test_flush_by_count(self):
+        batcher = MessageBatcher(self.send, max_records=2, linger=60, max_size=100)
+        batcher.add(['first'])
+        batcher.add(['second'])
+        assert len(self.sent) == 1
+        assert batcher._timer is None
+
+    def test_flush_by_linger(self):
+        event = threading.Event()
+
+        def send(messages, done):
+            self.sent.extend(messages)
+            event.set()
+
+        batcher = MessageBatcher(send, max_records=10, linger=0.01, max_size=100)
+        batcher.add(['first'])
+        assert event.wait(5)
+        assert self.sent == ['first']
+
+    def test_report_result_when_record_is_sent(self):
+        results = []
+        batcher = MessageBatcher(
+            lambda messages, done: done(False), max_records=10, linger=60, max_size=30
+        )
+        batcher.add(['a' * 20], lambda sent: results.append(('a', sent)))
+        # Fragment of b doesn't fit, so message with a is sent, b waits its second fragment
+        batcher.add(['b' * 20, 'c' * 20], lambda sent: results.append(('b', sent)))
+        assert results == [('a', False)]
+        batcher.send = lambda messages, done: done(True)
+        batcher.add(['d'], lambda sent: results.append(('d', sent)))
+        batcher.flush()
+        # The first fragment of b was not sent
+        assert results == [('a', False), ('b', False), ('d', True)]
@@ -0,0 +1,25 @@
+from benchmarks.cases import get_benchmarks, run_benchmarks
+from benchmarks.runner import format_results, get_percentile, measure
+
+
+def test_percentile():
+    values = [float(value) for value in range(100)]
+    assert get_percentile(values, 50) == 50
+    assert get_percentile(values, 99) == 99
+    assert get_percentile([], 50) == 0
+
+
+def test_measure():
+    result = measure('noop', lambda: None, 10, threads=2)
+    assert result.ops == 20
+    assert result.ops_per_sec > 0
+    assert result.p50 <= result.p99
+
+
+def test_benchmarks_run():
+    names = ['format_by_fragments.traceback_4kb', 'queue']
+    results = run_benchmarks(names, scale=0.001)
+    assert [result.name for result in results] == [
+        name for name in get_benchmarks() if name.startswith(tuple(names))
+    ]
+    assert 'queue.enqueue' in format_results(results)
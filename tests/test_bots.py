@@ -0,0 +1,112 @@
+from telegram_logger.bots import BotPool, get_bot_label, HASH, ROUND_ROBIN
+from telegram_logger.handlers import TelegramMessageHandler
+from telegram_logger.metrics import format_prometheus
+from tests.helpers import MockResponse
+
+import logging
+import pytest
+from unittest.mock import Mock, patch
+
+
+TOKENS = ['101:first-secret', '102:second-secret', '103:third-secret']
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bot_label_hides_secret():
+    assert get_bot_label('101:secret', 0) == '101'
+    assert get_bot_label('secret', 2) == '2'
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        BotPool(TOKENS, strategy='random')
+
+
+def test_hash_keeps_chat_on_one_bot():
+    pool = BotPool(TOKENS, strategy=HASH)
+    for chat_id in range(20):
+        assert len({pool.choose(chat_id).token for _ in range(5)}) == 1
+    # Chats are spread over bots
+    assert len({pool.choose(chat_id).token for chat_id in range(20)}) == len(TOKENS)
+
+
+def test_hash_moves_chat_only_from_paused_bot():
+    clock = FakeClock()
+    pool = BotPool(TOKENS, strategy=HASH, clock=clock)
+    before = {chat_id: pool.choose(chat_id) for chat_id in range(20)}
+    paused = pool.bots[0]
+    pool.report_failure(paused, retry_after=10)
+    for chat_id, bot in before.items():
+        if bot is paused:
+            assert pool.choose(chat_id) is not paused
+        else:
+            assert pool.choose(chat_id) is bot
+    clock.now = 10
+    assert {chat_id: pool.choose(chat_id) for chat_id in range(20)} == before
+
+
+def test_round_robin():
+    pool = BotPool(TOKENS, strategy=ROUND_ROBIN)
+    assert [pool.choose(1).token for _ in range(4)] == TOKENS + TOKENS[:1]
+
+
+def test_bot_is_paused_after_failures():
+    clock = FakeClock()
+    pool = BotPool(TOKENS, strategy=ROUND_ROBIN, max_failures=2, cooldown=30, clock=clock)
+    bot = pool.bots[0]
+    pool.report_failure(bot)
+    assert pool.get_health()['101'] is True
+    pool.report_failure(bot)
+    assert pool.get_health() == {'101': False, '102': True, '103': True}
+    assert bot not in [pool.choose(1) for _ in range(3)]
+    clock.now = 30
+    assert pool.get_health()['101'] is True
+
+
+def test_all_bots_are_paused():
+    clock = FakeClock()
+    pool = BotPool(TOKENS[:2], clock=clock)
+    pool.report_failure(pool.bots[0], retry_after=5)
+    pool.report_failure(pool.bots[1], retry_after=3)
+    assert not pool.has_available()
+    assert pool.choose(1) is pool.bots[1]
+
+
+def test_handler_spreads_messages_over_bots(fake_api):
+    handler = TelegramMessageHandler(
+        list(range(6)), TOKENS, api_url=fake_api.api_url, bot_strategy=ROUND_ROBIN
+    )
+    handler.emit(logging.makeLogRecord({'msg': 'alert'}))
+    handler.close()
+    tokens = [params['token'] for params in fake_api.received]
+    assert sorted(tokens) == sorted(TOKENS * 2)
+    snapshot = handler.metrics.snapshot()
+    assert snapshot['bots']['101'] == {'sent': 2, 'failed': 0, 'retried': 0, 'healthy': True}
+    text = format_prometheus([handler.metrics])
+    assert 'telegram_logger_bot_sent_total{bot="102"} 2' in text
+    assert 'telegram_logger_bot_healthy{bot="103"} 1' in text
+    assert 'secret' not in text
+
+
+def test_handler_retries_with_other_bot():
+    handler = TelegramMessageHandler([1], TOKENS[:2], retries=1)
+    handler.retry_policy.sleep = Mock()
+    too_many = MockResponse(status_code=429, json={'ok': False, 'parameters': {'retry_after': 7}})
+    ok = MockResponse(status_code=200, json={'ok': True})
+    with patch.object(handler.session, 'post', side_effect=[too_many, ok]) as mock_post:
+        handler.send_message(1, 'lorem')
+    urls = [call.args[0] for call in mock_post.call_args_list]
+    assert urls[0] != urls[1]
+    # Other bot is not limited, so retry doesn't wait retry_after
+    assert handler.retry_policy.sleep.call_args.args[0] < 7
+    assert handler.bot_pool.get_health() == {
+        bot.label: bot.token not in urls[0] for bot in handler.bot_pool.bots
+    }
@@ -0,0 +1,151 @@
+from telegram_logger.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from telegram_logger.handlers import TelegramHandler, TelegramMessageHandler
+from tests.helpers import MockResponse, RecordingHandler
+
+import logging
+import time
+from unittest.mock import patch
+
+
+TOKEN = 'test-token'
+
+
+class FakeClock(object):
+    """
+    Clock which moves forward only when sleep is called.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_breaker(max_failures=2, cooldown=10):
+    clock = FakeClock()
+    return CircuitBreaker(max_failures, cooldown, clock=clock, sleep=clock.sleep), clock
+
+
+def test_breaker_opens_after_failures():
+    breaker, clock = make_breaker()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.get_delay() == 10
+
+
+def test_success_resets_failures():
+    breaker, clock = make_breaker()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_probe_after_cooldown():
+    breaker, clock = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe is sent
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_breaker():
+    breaker, clock = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.opened == 2
+    assert breaker.get_delay() == 10
+
+
+def test_wait():
+    breaker, clock = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.wait()
+    assert clock.sleeps == [10]
+    assert breaker.state == HALF_OPEN
+
+
+def make_handler(**kwargs):
+    handler = TelegramMessageHandler(
+        [1, 2], TOKEN, retries=0, breaker_failures=2, breaker_cooldown=60, **kwargs
+    )
+    clock = FakeClock()
+    handler.breaker.clock = clock
+    return handler, clock
+
+
+def test_handler_routes_records_to_fallback():
+    fallback = RecordingHandler()
+    handler, clock = make_handler(fallback_handler=fallback)
+    error = MockResponse(status_code=502, text='Bad Gateway')
+    with patch.object(handler.session, 'post', return_value=error) as mock_post:
+        handler.emit(logging.makeLogRecord({'msg': 'first'}))
+        assert handler.breaker.state == OPEN
+        handler.emit(logging.makeLogRecord({'msg': 'second'}))
+    assert mock_post.call_count == 2
+    assert [record.msg for record in fallback.records] == ['second']
+    assert handler.metrics.get('rejected') == 1
+    assert handler.metrics.snapshot()['gauges']['breaker_open'] == 1
+
+
+def test_handler_probes_after_cooldown():
+    handler, clock = make_handler()
+    error = MockResponse(status_code=502, text='Bad Gateway')
+    ok = MockResponse(status_code=200, json={'ok': True})
+    with patch.object(handler.session, 'post', side_effect=[error, error, ok, ok]) as mock_post:
+        handler.emit(logging.makeLogRecord({'msg': 'first'}))
+        clock.now = 60
+        handler.emit(logging.makeLogRecord({'msg': 'second'}))
+    assert mock_post.call_count == 4
+    assert handler.breaker.state == CLOSED
+
+
+def test_open_breaker_stops_requests_of_record():
+    handler, clock = make_handler()
+    handler.breaker.max_failures = 1
+    error = MockResponse(status_code=502, text='Bad Gateway')
+    with patch.object(handler.session, 'post', return_value=error) as mock_post:
+        handler.emit(logging.makeLogRecord({'msg': 'first'}))
+    # The second chat is not requested when breaker is open
+    assert mock_post.call_count == 1
+    assert handler.failed == 2
+
+
+def test_request_timeout(fake_api):
+    fake_api.latency = 1.0
+    handler = TelegramMessageHandler([1], TOKEN, api_url=fake_api.api_url, retries=0, read_timeout=0.1)
+    started = time.monotonic()
+    handler.send_message(1, 'lorem')
+    assert time.monotonic() - started < 0.9
+    assert handler.failed == 1
+    handler.close()
+
+
+def test_telegram_handler_passes_fallback_handler():
+    fallback = RecordingHandler()
+    handler = TelegramHandler(
+        [1], TOKEN, fallback_handler=fallback, breaker_failures=3, exit_timeout=None
+    )
+    assert handler.handler.fallback_handler is fallback
+    assert handler.handler.breaker.max_failures == 3
+    assert not handler.handler.breaker_wait
+    handler.close()
@@ -0,0 +1,86 @@
+from telegram_logger.collector import (
+    CollectorHandler, TelegramCollector, FRAME_HEADER, MAX_FRAME_SIZE, make_parser, get_handler_kwargs
+)
+from tests.helpers import RecordingHandler
+
+import logging
+import os
+import pytest
+import socket
+import threading
+import time
+
+
+@pytest.fixture()
+def collector(tmp_path):
+    path = str(tmp_path / 'collector.sock')
+    server = TelegramCollector(path, RecordingHandler())
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def wait_records(handler, count):
+    deadline = time.monotonic() + 5
+    while len(handler.records) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return handler.records
+
+
+def test_send_fragments_to_collector(collector):
+    handler = CollectorHandler(collector.server_address)
+    record = logging.makeLogRecord({'msg': 'Error %s', 'args': ('<b>',), 'levelno': logging.ERROR})
+    expected_fragments = handler.get_fragments(record)
+    handler.handle(record)
+    handler.handle(record)
+    handler.close()
+    records = wait_records(collector.handler, 2)
+    assert len(records) == 2
+    assert records[0].telegram_fragments == expected_fragments
+    assert records[0].getMessage() == 'Error <b>'
+    assert records[0].levelno == logging.ERROR
+    assert not hasattr(record, 'telegram_fragments')
+
+
+def test_too_big_frame_closes_connection(collector):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(collector.server_address)
+    client.sendall(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1))
+    client.settimeout(5)
+    assert client.recv(1) == b''
+    client.close()
+    assert collector.handler.records == []
+
+
+def test_invalid_frame_closes_connection(collector):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(collector.server_address)
+    payload = b'not compressed'
+    client.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+    client.settimeout(5)
+    assert client.recv(1) == b''
+    client.close()
+    assert collector.handler.records == []
+
+
+def test_remove_socket_file(tmp_path):
+    path = str(tmp_path / 'collector.sock')
+    open(path, 'w').close()
+    server = TelegramCollector(path, RecordingHandler())
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+def test_parse_args():
+    args = make_parser().parse_args([
+        '--token', 'test-token', '--chat-id', '1', '--chat-id', '2', '--rate-limit',
+        '--dedup-window', '60',
+    ])
+    assert args.chat_ids == ['1', '2']
+    kwargs = get_handler_kwargs(args)
+    assert kwargs['rate_limit'] is True
+    assert kwargs['dedup_window'] == 60
+    assert kwargs['spool_path'] is None
+    assert kwargs['exit_timeout'] == 10
@@ -0,0 +1,103 @@
+from telegram_logger.dedup import DuplicateFilter
+from telegram_logger.spool import serialize_record, deserialize_record
+
+from tests.helpers import RecordingHandler, BaseTest
+
+import logging
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDuplicateFilter(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.clock = FakeClock()
+        self.handler = RecordingHandler()
+        self.filter = DuplicateFilter(self.handler, window=10, max_keys=2, clock=self.clock)
+        self.handler.addFilter(self.filter)
+
+    def teardown_method(self, method):
+        self.filter.flush()
+
+    def make_record(self, msg='Error %s', args=(1,), lineno=10):
+        return self.create_record({'msg': msg, 'args': args, 'lineno': lineno,
+                                   'levelno': logging.ERROR, 'levelname': 'ERROR'})
+
+    def test_pass_first_record(self):
+        assert self.filter.filter(self.make_record())
+
+    def test_suppress_duplicates(self):
+        assert self.filter.filter(self.make_record(args=(1,)))
+        assert not self.filter.filter(self.make_record(args=(2,)))
+        assert not self.filter.filter(self.make_record(args=(3,)))
+
+    def test_pass_different_records(self):
+        assert self.filter.filter(self.make_record(lineno=10))
+        assert self.filter.filter(self.make_record(lineno=11))
+        assert self.filter.filter(self.make_record(msg='Other error %s'))
+
+    def test_summary_when_window_closes(self):
+        self.filter.filter(self.make_record(args=(1,)))
+        self.filter.filter(self.make_record(args=(2,)))
+        self.filter.filter(self.make_record(args=(3,)))
+        self.clock.now = 10
+        assert self.filter.filter(self.make_record(args=(4,)))
+        assert len(self.handler.records) == 1
+        summary = self.handler.records[0]
+        assert summary.getMessage() == DuplicateFilter.SUMMARY_MESSAGE % ('Error 1', 2, 10)
+        assert summary.exc_info is None
+        assert summary.levelno == logging.ERROR
+
+    def test_no_summary_without_duplicates(self):
+        self.filter.filter(self.make_record())
+        self.clock.now = 10
+        self.filter.filter(self.make_record())
+        assert self.handler.records == []
+
+    def test_evict_oldest_window(self):
+        self.filter.filter(self.make_record(lineno=1))
+        self.filter.filter(self.make_record(lineno=1))
+        self.filter.filter(self.make_record(lineno=2))
+        self.filter.filter(self.make_record(lineno=3))
+        assert len(self.filter._windows) == 2
+        assert len(self.handler.records) == 1
+        assert self.handler.records[0].lineno == 1
+
+    def test_summary_by_timer(self):
+        self.filter.filter(self.make_record())
+        self.filter.filter(self.make_record())
+        assert self.filter._timer is not None
+        self.filter._timer.cancel()
+        self.clock.now = 10
+        self.filter._on_timer()
+        assert len(self.handler.records) == 1
+        assert self.filter._timer is None
+
+    def test_flush(self):
+        self.filter.filter(self.make_record())
+        self.filter.filter(self.make_record())
+        self.filter.flush()
+        assert len(self.handler.records) == 1
+        assert self.filter._windows == {}
+
+    def test_suppress_duplicates_from_collector(self):
+        def transfer(record):
+            record.telegram_fragments = [record.getMessage()]
+            return deserialize_record(serialize_record(record))
+
+        first = transfer(self.make_record(args=(1,)))
+        assert first.exc_info is None
+        assert self.filter.get_key(first) == self.filter.get_key(transfer(self.make_record(args=(2,))))
+        assert self.filter.filter(first)
+        assert not self.filter.filter(transfer(self.make_record(args=(2,))))
+        other = self.make_record(args=(3,))
+        other.exc_info = self.get_exc_info(ValueError)
+        assert self.filter.filter(transfer(other))
@@ -0,0 +1,89 @@
+from telegram_logger.handlers import TelegramHandler, TelegramMessageHandler
+
+import logging
+import requests
+import time
+
+
+TOKEN = 'test-token'
+chat_ids = [1, 2]
+
+
+def make_handler(fake_api, **kwargs):
+    return TelegramMessageHandler(chat_ids, TOKEN, api_url=fake_api.api_url, **kwargs)
+
+
+def test_send_message(fake_api):
+    handler = make_handler(fake_api)
+    handler.send_message(1, 'Ошибка <b>')
+    handler.close()
+    assert fake_api.get_texts(1) == ['Ошибка <b>']
+    assert fake_api.received[0]['parse_mode'] == 'html'
+
+
+def test_send_document(fake_api):
+    handler = make_handler(fake_api)
+    handler.send_document(1, b'traceback', 'error.txt', caption='Error')
+    handler.close()
+    assert fake_api.get_documents() == [('error.txt', b'traceback')]
+    assert fake_api.received[0]['caption'] == 'Error'
+
+
+def test_telegram_handler(fake_api):
+    handler = TelegramHandler(chat_ids, TOKEN, api_url=fake_api.api_url, max_workers=2)
+    handler.handle(logging.makeLogRecord({'msg': 'Error'}))
+    handler.close()
+    assert len(fake_api.get_texts(1)) == 1
+    assert len(fake_api.get_texts(2)) == 1
+
+
+def test_wrong_token(fake_api, caplog):
+    fake_api.token = 'other-token'
+    handler = make_handler(fake_api)
+    handler.send_message(1, 'lorem')
+    handler.close()
+    assert '401' in caplog.text
+    assert fake_api.received == []
+
+
+def test_rate_limit(fake_api):
+    fake_api.chat_rate = 0.1
+    fake_api.chat_burst = 1
+    url = f'{fake_api.api_url}/bot{TOKEN}/sendMessage'
+    assert requests.post(url, json={'chat_id': 1, 'text': 'first'}).status_code == 200
+    response = requests.post(url, json={'chat_id': 1, 'text': 'second'})
+    assert response.status_code == 429
+    assert response.json()['parameters']['retry_after'] == 10
+    # Other chat has its own limit
+    assert requests.post(url, json={'chat_id': 2, 'text': 'first'}).status_code == 200
+    assert fake_api.stats['rate_limited'] == 1
+
+
+def test_retry_server_errors(fake_api):
+    fake_api.error_rate = 1.0
+    handler = make_handler(fake_api, retries=2)
+    handler.retry_policy.sleep = lambda delay: None
+    handler.send_message(1, 'lorem')
+    handler.close()
+    assert fake_api.stats['errors'] == 3
+    assert handler.retried == 2
+    assert handler.failed == 1
+
+
+def test_dropped_connection(fake_api, caplog):
+    fake_api.drop_rate = 1.0
+    handler = make_handler(fake_api, retries=0)
+    handler.send_message(1, 'lorem')
+    handler.close()
+    assert fake_api.stats['dropped'] == 1
+    assert handler.failed == 1
+    assert 'Fail to send log message to chat 1' in caplog.text
+
+
+def test_latency(fake_api):
+    fake_api.latency = 0.05
+    handler = make_handler(fake_api)
+    start = time.monotonic()
+    handler.send_message(1, 'lorem')
+    handler.close()
+    assert time.monotonic() - start >= 0.05
@@ -1,10 +1,17 @@
-from telegram_logger.formatters import TelegramHtmlFormatter
+from telegram_logger.formatters import (
+    TelegramHtmlFormatter, TelegramMarkdownV2Formatter, LRUCache, get_exception_fingerprint
+)
 
 from tests.helpers import BaseTest
 
 import logging
 from faker import Faker
+import html
+import os
 import pytest
+import re
+import sys
+import time
 from unittest.mock import patch, Mock
 
 
@@ -79,20 +86,328 @@ class TestTelegramHtmlFormatter(BaseTest):
 
 
     @patch('telegram_logger.formatters.TelegramHtmlFormatter.format')
-    def test_format_by_fragments_message_more_max_size(self, mock_format, 
+    def test_format_by_fragments_message_more_max_size(self, mock_format,
                                                 message_splits_on_3_fragments):
         mock_format.return_value = message_splits_on_3_fragments
         fragments = self.formatter.format_by_fragments(self.record)
-        start_code = message_splits_on_3_fragments.find(self.formatter.START_CODE)
         tag = self.formatter.get_hashtag_for_record(self.record)
 
-        assert len(fragments) == 3
-        assert fragments[0] == message_splits_on_3_fragments[0:start_code] + tag
-        assert len(fragments[1]) <= self.formatter.MAX_MESSAGE_SIZE
-        assert len(fragments[2]) <= self.formatter.MAX_MESSAGE_SIZE
+        assert len(fragments) == 2
+        assert fragments[0].startswith(message_splits_on_3_fragments[0:100])
+        for fragment in fragments:
+            assert len(fragment) <= self.formatter.MAX_MESSAGE_SIZE
+            assert fragment.endswith(self.formatter.END_CODE + tag)
         assert fragments[1].startswith(self.formatter.START_CODE)
-        assert fragments[1].endswith(self.formatter.END_CODE + tag)
-        assert fragments[2].startswith(self.formatter.START_CODE)
-        assert fragments[2].endswith(self.formatter.END_CODE + tag)
-      
-        
+
+
+class TestTelegramFormatterCache(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.formatter = TelegramHtmlFormatter()
+
+    def test_format_record_once(self):
+        record = self.create_record()
+        format_exception = self.formatter.formatException
+        with patch.object(self.formatter, 'formatException', wraps=format_exception) as mock_exc:
+            message = self.formatter.format(record)
+            assert self.formatter.format(record) == message
+            self.formatter.format_by_fragments(record)
+            assert mock_exc.call_count == 1
+
+    def test_format_other_record(self):
+        record = self.create_record({'msg': 'first'})
+        other = self.create_record({'msg': 'second'})
+        assert 'first' in self.formatter.format(record)
+        assert 'second' in self.formatter.format(other)
+
+    def test_cached_fragments_are_copied(self):
+        record = self.create_record()
+        fragments = self.formatter.format_by_fragments(record)
+        fragments.append('changed')
+        assert self.formatter.format_by_fragments(record) != fragments
+
+
+class TestTelegramHtmlFormatterSplitting(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.formatter = TelegramHtmlFormatter()
+
+    def get_fragments(self, code, msg='Error'):
+        record = self.create_record({'msg': msg})
+        with patch.object(self.formatter, 'formatException', return_value=code):
+            fragments = self.formatter.format_by_fragments(record)
+            message = self.formatter.format(record)
+        return fragments, message, self.formatter.get_hashtag_for_record(record)
+
+    def join_fragments(self, fragments, tag):
+        joined = ''.join(fragment[:-len(tag)] for fragment in fragments)
+        return joined.replace(self.formatter.END_CODE + self.formatter.START_CODE, '')
+
+    def get_code(self, lines, line='  File "module.py", line 1, in <module> & "quoted" <tag>'):
+        return '\n'.join(f'{line} {index}' for index in range(lines))
+
+    def test_fragments_keep_message(self):
+        fragments, message, tag = self.get_fragments(self.get_code(1000))
+        assert len(fragments) > 1
+        assert self.join_fragments(fragments, tag) == message
+
+    def test_fragments_size(self):
+        fragments, message, tag = self.get_fragments(self.get_code(1000))
+        for fragment in fragments:
+            assert len(fragment) <= self.formatter.MAX_MESSAGE_SIZE
+            assert fragment.endswith(tag)
+
+    def test_fragments_are_filled(self):
+        fragments, message, tag = self.get_fragments(self.get_code(1000))
+        # Each fragment except the last is filled except of part of one line
+        for fragment in fragments[:-1]:
+            assert len(fragment) > self.formatter.MAX_MESSAGE_SIZE - 200
+
+    def test_split_on_lines(self):
+        fragments, message, tag = self.get_fragments(self.get_code(1000))
+        for fragment in fragments[:-1]:
+            assert fragment.endswith('\n' + self.formatter.END_CODE + tag)
+        for fragment in fragments[1:]:
+            assert fragment.startswith(self.formatter.START_CODE + '  File')
+
+    def test_escape_sequences_are_not_split(self):
+        code = '&' * 20000
+        fragments, message, tag = self.get_fragments(code)
+        code_parts = [
+            fragment[:-len(tag)].split(self.formatter.START_CODE)[-1][:-len(self.formatter.END_CODE)]
+            for fragment in fragments
+        ]
+        assert len(fragments) == len(message) // (self.formatter.MAX_MESSAGE_SIZE - len(tag) - 20) + 1
+        for part in code_parts:
+            assert part.endswith('&amp;')
+        assert ''.join(html.unescape(part) for part in code_parts) == code
+
+    def test_code_chars_are_kept(self):
+        code = '<pre>pre\n' * 2000
+        fragments, message, tag = self.get_fragments(code)
+        assert self.join_fragments(fragments, tag) == message
+
+    def test_header_longer_than_max_size(self):
+        msg = 'Long message & more ' * 1000
+        fragments, message, tag = self.get_fragments(self.get_code(100), msg=msg)
+        assert len(fragments) > 2
+        for fragment in fragments:
+            assert len(fragment) <= self.formatter.MAX_MESSAGE_SIZE
+        assert self.join_fragments(fragments, tag) == message
+
+    def test_number_of_fragments_is_linear(self):
+        small, small_message, tag = self.get_fragments(self.get_code(1000))
+        large, large_message, tag = self.get_fragments(self.get_code(10000))
+        useful_size = self.formatter.MAX_MESSAGE_SIZE - len(tag) - 200
+        assert len(large) <= len(large_message) // useful_size + 1
+        assert len(large) <= 11 * len(small)
+
+    def test_time_is_linear(self):
+        def measure(lines):
+            code = self.get_code(lines)
+            best = None
+            for _ in range(3):
+                record = self.create_record()
+                with patch.object(self.formatter, 'formatException', return_value=code):
+                    started = time.perf_counter()
+                    self.formatter.format_by_fragments(record)
+                    elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        # Quadratic splitting would be about 64 times slower
+        assert measure(80000) < 25 * measure(10000)
+
+
+class TestTelegramHtmlFormatterDocument(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.formatter = TelegramHtmlFormatter()
+
+    def test_format_document(self):
+        record = self.create_record()
+        text, document = self.formatter.format_document(record)
+        assert self.formatter.START_CODE not in text
+        assert text.endswith(self.formatter.get_hashtag_for_record(record))
+        assert self.formatter.formatException(record.exc_info) in document
+        assert record.getMessage() in document
+
+    def test_format_document_long_message(self):
+        record = self.create_record({'msg': 'Long message ' * 1000})
+        text, document = self.formatter.format_document(record)
+        assert len(text) <= self.formatter.MAX_MESSAGE_SIZE
+        assert record.getMessage() in document
+
+
+def unescape_markdown(text):
+    return re.sub(r'\\(.)', r'\1', text, flags=re.DOTALL)
+
+
+def count_trailing_backslashes(text):
+    return len(text) - len(text.rstrip('\\'))
+
+
+class TestTelegramMarkdownV2Formatter(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.formatter = TelegramMarkdownV2Formatter()
+
+    def get_fragments(self, code, msg='Error'):
+        record = self.create_record({'msg': msg})
+        with patch.object(self.formatter, 'formatException', return_value=code):
+            fragments = self.formatter.format_by_fragments(record)
+            message = self.formatter.format(record)
+        return fragments, message, self.formatter.get_hashtag_for_record(record)
+
+    def join_fragments(self, fragments, tag):
+        joined = ''.join(fragment[:-len(tag)] for fragment in fragments)
+        return joined.replace(self.formatter.END_CODE + self.formatter.START_CODE, '')
+
+    def test_escape(self):
+        assert self.formatter.escape('a_b*c [d](e) 1.5! \\') == 'a\\_b\\*c \\[d\\]\\(e\\) 1\\.5\\! \\\\'
+        assert self.formatter.escape_code('x = `y` \\ 1.5') == 'x = \\`y\\` \\\\ 1.5'
+
+    def test_format(self):
+        record = self.create_record({'msg': 'Error in a.b_c'})
+        message = self.formatter.format(record)
+        assert message.startswith(f'*{self.formatter.escape(record.levelname)}*')
+        assert 'Error in a\\.b\\_c' in message
+        code = message[message.index(self.formatter.START_CODE):]
+        assert code.endswith(self.formatter.END_CODE)
+        assert unescape_markdown(code[len(self.formatter.START_CODE):-len(self.formatter.END_CODE)]) == \
+            self.formatter.formatException(record.exc_info)
+
+    def test_hashtag_is_escaped(self):
+        record = self.create_record({'name': 'app.module', 'exc_info': None})
+        tag = self.formatter.get_hashtag_for_record(record)
+        func_name = self.formatter.escape(record.funcName)
+        assert tag == f'\n\n\\#{int(record.created)}\\.app\\.module\\.{func_name}'
+
+    def test_fragments_keep_message(self):
+        code = '\n'.join(
+            f'  File "module.py", line {index}, in <module>: `x` \\ y_z' for index in range(1000)
+        )
+        fragments, message, tag = self.get_fragments(code)
+        assert len(fragments) > 1
+        for fragment in fragments:
+            assert len(fragment) <= self.formatter.MAX_MESSAGE_SIZE
+            assert fragment.endswith(tag)
+        for fragment in fragments[:-1]:
+            assert len(fragment) > self.formatter.MAX_MESSAGE_SIZE - 200
+        assert self.join_fragments(fragments, tag) == message
+
+    def test_escape_sequences_are_not_split(self):
+        code = '\\' * 20000
+        fragments, message, tag = self.get_fragments(code, msg='.' * 10000)
+        for fragment in fragments:
+            body = fragment[:-len(tag)]
+            if body.endswith(self.formatter.END_CODE):
+                body = body[:-len(self.formatter.END_CODE)]
+            assert count_trailing_backslashes(body) % 2 == 0
+        assert self.join_fragments(fragments, tag) == message
+
+    def test_format_document(self):
+        record = self.create_record({'msg': 'Long message. ' * 1000})
+        text, document = self.formatter.format_document(record)
+        assert len(text) <= self.formatter.MAX_MESSAGE_SIZE
+        tag = self.formatter.get_hashtag_for_record(record)
+        assert count_trailing_backslashes(text[:-len(tag)]) % 2 == 0
+        assert record.getMessage() in document
+
+
+def raise_error(message, exc_type=ValueError):
+    raise exc_type(message)
+
+
+def get_error(message, exc_type=ValueError):
+    try:
+        raise_error(message, exc_type)
+    except exc_type:
+        return sys.exc_info()
+
+
+def get_error_in_file(filename):
+    namespace = {}
+    exec(compile('def fail():\n    raise ValueError(\'error\')\n', filename, 'exec'), namespace)
+    try:
+        namespace['fail']()
+    except ValueError:
+        return sys.exc_info()
+
+
+def get_chained_error(message):
+    try:
+        raise_error(message)
+    except ValueError:
+        try:
+            raise_error(message, KeyError)
+        except KeyError:
+            return sys.exc_info()
+
+
+class TestExceptionFingerprint(BaseTest):
+
+    def setup_method(self, method):
+        super().setup()
+        self.formatter = TelegramHtmlFormatter()
+
+    def test_fingerprint_is_stable(self):
+        fingerprint = get_exception_fingerprint(get_error('first'))
+        assert get_exception_fingerprint(get_error('second')) == fingerprint
+
+    def test_fingerprint_depends_on_type_and_frames(self):
+        fingerprint = get_exception_fingerprint(get_error('first'))
+        assert get_exception_fingerprint(get_error('first', KeyError)) != fingerprint
+        assert get_exception_fingerprint(self.get_exc_info(ValueError)) != fingerprint
+        assert get_exception_fingerprint(get_chained_error('first')) != \
+            get_exception_fingerprint(get_error('first', KeyError))
+
+    def test_fingerprint_in_hashtag(self):
+        record = self.create_record({'exc_info': get_error('first')})
+        fingerprint = get_exception_fingerprint(record.exc_info)
+        assert self.formatter.get_hashtag_for_record(record).endswith(f' #e{fingerprint}')
+        assert self.formatter.format_document(record)[0].endswith(f' #e{fingerprint}')
+        assert '#e' not in self.formatter.get_hashtag_for_record(self.create_record({'exc_info': None}))
+
+    def test_traceback_is_rendered_once(self):
+        with patch.object(logging.Formatter, 'formatException', autospec=True,
+                          side_effect=logging.Formatter.formatException) as mock_format:
+            # Time of record is fixed, so records differ only by exception
+            records = [self.create_record({'exc_info': get_error('first'), 'msecs': 0})
+                       for _ in range(2)]
+            first, second = [self.formatter.format(record) for record in records]
+            assert mock_format.call_count == 1
+            assert first == second
+            other = self.formatter.format(self.create_record({'exc_info': get_error('other')}))
+            assert mock_format.call_count == 2
+        assert 'ValueError: other' in other
+
+    def test_files_with_the_same_name(self):
+        errors = [get_error_in_file(os.path.join(path, 'tasks.py')) for path in ('first', 'second')]
+        assert get_exception_fingerprint(errors[0]) == get_exception_fingerprint(errors[1])
+        assert os.path.join('first', 'tasks.py') in self.formatter.formatException(errors[0])
+        assert os.path.join('second', 'tasks.py') in self.formatter.formatException(errors[1])
+
+    def test_chained_traceback(self):
+        exc_info = get_chained_error('first')
+        assert self.formatter.formatException(exc_info) == logging.Formatter().formatException(exc_info)
+
+    def test_cache_is_bounded(self):
+        formatter = TelegramHtmlFormatter(traceback_cache_size=2)
+        for message in ('first', 'second', 'third'):
+            formatter.format(self.create_record({'exc_info': get_error(message)}))
+        assert len(formatter._traceback_cache) == 2
+        assert len(formatter._code_cache) == 2
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.put('first', 1)
+        cache.put('second', 2)
+        assert cache.get('first') == 1
+        cache.put('third', 3)
+        assert cache.get('second') is None
+        assert cache.get('first') == 1
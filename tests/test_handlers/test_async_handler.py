@@ -0,0 +1,232 @@
+from telegram_logger.async_handlers import AsyncTelegramHandler
+from telegram_logger.formatters import TelegramHtmlFormatter
+from tests.helpers import RecordingHandler
+
+import aiohttp
+import asyncio
+import json
+import logging
+import threading
+from unittest.mock import patch
+
+
+TOKEN = 'test-token'
+chat_ids = [1, 2, 3]
+
+
+class FakeResponse(object):
+    """
+    Fake response of aiohttp.
+    """
+    def __init__(self, json, status=200, text=''):
+        self.json_ = json
+        self.status = status
+        self.text_ = text
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def json(self):
+        return self.json_
+
+    async def text(self):
+        return self.text_
+
+
+class FakeSession(object):
+    """
+    Fake session of aiohttp which keeps posted data.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.posted = []
+        self.closed = False
+
+    def post(self, url, data=None, headers=None, proxy=None):
+        self.posted.append({'url': url, 'json': json.loads(data), 'headers': headers, 'proxy': proxy})
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+    async def close(self):
+        self.closed = True
+
+
+def test_default_formatter():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    assert isinstance(handler.formatter, TelegramHtmlFormatter)
+
+
+def test_emit_without_loop():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    record = logging.makeLogRecord({})
+    handler.emit(record)
+    sent = []
+
+    async def send_record(record):
+        sent.append(record)
+
+    async def main():
+        with patch.object(handler, 'send_record', side_effect=send_record):
+            handler.start(asyncio.get_running_loop())
+            await handler.aclose()
+
+    asyncio.run(main())
+    assert sent == [record]
+
+
+def test_emit_without_loop_on_root_logger():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    try:
+        logging.error('Error')
+    finally:
+        root_logger.removeHandler(handler)
+    assert [record.msg for record in handler._pending] == ['Error']
+
+
+def test_emit_error_is_handled():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    record = logging.makeLogRecord({})
+    with patch.object(handler, 'start', side_effect=RuntimeError):
+        with patch.object(handler, 'handleError') as mock_handle_error:
+
+            async def main():
+                handler.emit(record)
+
+            asyncio.run(main())
+    mock_handle_error.assert_called_once_with(record)
+
+
+def test_send_records_in_background(message_splits_on_3_fragments):
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    record = logging.makeLogRecord({})
+    sent = []
+
+    async def send_message(chat_id, text):
+        await asyncio.sleep(0)
+        sent.append((chat_id, text))
+
+    async def main():
+        with patch.object(handler, 'send_message', side_effect=send_message):
+            handler.handle(record)
+            assert sent == []
+            await handler.aclose()
+
+    with patch('telegram_logger.formatters.TelegramHtmlFormatter.format') as mock_format:
+        mock_format.return_value = message_splits_on_3_fragments
+        expected_fragments = handler.formatter.format_by_fragments(record)
+        asyncio.run(main())
+    for chat_id in chat_ids:
+        assert [text for chat, text in sent if chat == chat_id] == expected_fragments
+
+
+def test_emit_from_other_thread():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    sent = []
+
+    async def send_record(record):
+        sent.append(record)
+
+    async def main():
+        with patch.object(handler, 'send_record', side_effect=send_record):
+            handler.handle(logging.makeLogRecord({}))
+            thread = threading.Thread(target=handler.handle, args=(logging.makeLogRecord({}),))
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0)
+            await handler.flush()
+
+    asyncio.run(main())
+    assert len(sent) == 2
+
+
+def test_send_message():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN, proxies={'https': 'http://proxy:1080'})
+    session = FakeSession(FakeResponse({'ok': True}))
+
+    async def main():
+        with patch.object(handler, 'get_session', return_value=session):
+            await handler.send_message(chat_ids[0], 'lorem')
+
+    asyncio.run(main())
+    assert session.posted[0]['url'] == handler.url
+    assert session.posted[0]['proxy'] == 'http://proxy:1080'
+    assert session.posted[0]['json']['text'] == 'lorem'
+    assert session.posted[0]['json']['chat_id'] == chat_ids[0]
+    assert session.posted[0]['json']['parse_mode'] == handler.parse_mode
+    assert session.posted[0]['headers'] == handler.JSON_HEADERS
+
+
+def test_send_message_got_error(caplog):
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    session = FakeSession(FakeResponse(None, status=404, text='Not Found'))
+
+    async def main():
+        with patch.object(handler, 'get_session', return_value=session):
+            await handler.send_message(chat_ids[0], 'lorem')
+
+    asyncio.run(main())
+    assert '404' in caplog.text
+    assert 'Not Found' in caplog.text
+
+
+def test_aclose_closes_session():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    session = FakeSession(FakeResponse({'ok': True}))
+
+    async def main():
+        handler._session = session
+        handler.handle(logging.makeLogRecord({}))
+        with patch.object(handler, 'send_record'):
+            await handler.aclose()
+
+    asyncio.run(main())
+    assert session.closed
+    assert handler._worker is None
+
+
+def test_flush_without_awaiting():
+    handler = AsyncTelegramHandler(chat_ids, TOKEN)
+    handler.flush()
+    handler.close()
+
+
+def test_breaker_passes_records_to_fallback_handler():
+    fallback = RecordingHandler()
+    handler = AsyncTelegramHandler([1], TOKEN, breaker_failures=2, fallback_handler=fallback)
+    handler.setFormatter(logging.Formatter())
+    session = FakeSession(FakeResponse(None, status=502, text='Bad Gateway'))
+    records = [logging.makeLogRecord({'msg': str(number)}) for number in range(3)]
+
+    async def main():
+        with patch.object(handler, 'get_session', return_value=session):
+            for record in records:
+                await handler.send_record(record)
+
+    asyncio.run(main())
+    assert len(session.posted) == 2
+    assert handler.breaker.is_open
+    assert fallback.records == records[2:]
+
+
+def test_breaker_counts_network_errors():
+    handler = AsyncTelegramHandler([1], TOKEN, breaker_failures=1)
+    session = FakeSession(aiohttp.ClientConnectionError())
+
+    async def main():
+        with patch.object(handler, 'get_session', return_value=session):
+            try:
+                await handler.send_message(1, 'lorem')
+            except aiohttp.ClientError:
+                pass
+            # Request is not sent while breaker is open
+            await handler.send_message(1, 'lorem')
+
+    asyncio.run(main())
+    assert handler.breaker.is_open
+    assert len(session.posted) == 1
@@ -1,6 +1,7 @@
 from telegram_logger.handlers import MessageParamsMixin
 from telegram_logger.formatters import TelegramHtmlFormatter
 
+import json
 import logging
 from unittest.mock import patch
 
@@ -77,4 +78,67 @@ def test_parse_mode_success():
     formatter = TelegramHtmlFormatter()
     handler.setFormatter(formatter)
     parse_mode = handler.parse_mode
-    assert parse_mode == formatter.PARSE_MODE
\ No newline at end of file
+    assert parse_mode == formatter.PARSE_MODE
+
+
+def test_get_payload():
+    handler = SampleHandler(chat_ids, TOKEN, disable_notification=True, reply_markup={'keyboard': []})
+    handler.setFormatter(TelegramHtmlFormatter())
+    payload = json.loads(handler.get_payload(1, 'Ошибка "<b>"'))
+    assert payload == {
+        'chat_id': 1,
+        'text': 'Ошибка "<b>"',
+        'parse_mode': 'html',
+        'disable_notification': True,
+        'reply_markup': {'keyboard': []},
+    }
+
+
+def test_payload_prefix_is_computed_once():
+    handler = SampleHandler(chat_ids, TOKEN)
+    handler.setFormatter(TelegramHtmlFormatter())
+    with patch.object(handler, '_get_message_params', return_value={}) as mock_params:
+        handler.get_payload(1, 'first')
+        handler.get_payload(1, 'second')
+        handler.get_payload(2, 'first')
+    assert mock_params.call_count == 2
+
+
+def test_payload_is_reset_when_options_change():
+    handler = SampleHandler(chat_ids, TOKEN)
+    handler.get_payload(1, 'lorem')
+    handler.setFormatter(TelegramHtmlFormatter())
+    handler.disable_notification = True
+    payload = json.loads(handler.get_payload(1, 'lorem'))
+    assert payload['parse_mode'] == 'html'
+    assert payload['disable_notification'] is True
+    handler.token = 'new-token'
+    assert handler.url == 'https://api.telegram.org/botnew-token/sendMessage'
+
+
+def test_overridden_reply_markup_is_called_for_each_message():
+    markups = iter([{'keyboard': [1]}, {'keyboard': [2]}])
+
+    class MarkupHandler(SampleHandler):
+        def get_reply_markup(self):
+            return next(markups)
+
+    handler = MarkupHandler(chat_ids, TOKEN)
+    assert json.loads(handler.get_payload(1, 'lorem'))['reply_markup'] == {'keyboard': [1]}
+    assert json.loads(handler.get_payload(1, 'lorem'))['reply_markup'] == {'keyboard': [2]}
+
+
+def test_json_encoder_path():
+    handler = SampleHandler(chat_ids, TOKEN, json_encoder='json.dumps')
+    assert handler.json_encoder is json.dumps
+    assert json.loads(handler.get_payload(1, 'Ошибка'))['text'] == 'Ошибка'
+
+
+def test_json_encoder_returns_bytes():
+    handler = SampleHandler(chat_ids, TOKEN, json_encoder=lambda obj: json.dumps(obj).encode())
+    assert json.loads(handler.get_payload(1, 'lorem'))['text'] == 'lorem'
+
+
+def test_api_url():
+    handler = SampleHandler(chat_ids, TOKEN, api_url='http://127.0.0.1:8081/')
+    assert handler.url == f'http://127.0.0.1:8081/bot{TOKEN}/sendMessage'
@@ -1,7 +1,12 @@
 from telegram_logger.handlers import TelegramHandler
+from telegram_logger.snapshot import RecordSnapshot
+from tests.helpers import RecordingHandler
 
 import logging
-from threading import active_count
+import pytest
+import sys
+from threading import active_count, Event, Thread
+import time
 from unittest.mock import patch
 
 
@@ -28,3 +33,227 @@ def test_stop_listener():
     with patch.object(handler.listener, 'stop') as mock_stop:
         handler.close()
         assert mock_stop.call_count == 1
+
+
+def test_drop_records_when_queue_is_full(caplog):
+    handler = TelegramHandler(chat_ids, TOKEN, max_queue_size=2)
+    handler.listener.stop()
+    record = logging.makeLogRecord({})
+    for _ in range(3):
+        handler.handle(record)
+    assert handler.dropped == 1
+    assert 'Traceback' not in caplog.text
+    handler.queue.get_nowait()
+    handler.queue.get_nowait()
+    # Notice is put as soon as taken record frees place
+    notice = handler.queue.get_nowait()
+    assert notice.getMessage() == handler.DROPPED_MESSAGE % 1
+    handler.listener.start()
+    handler.close()
+
+
+def test_close_when_queue_is_full():
+    handler = TelegramHandler(
+        chat_ids, TOKEN, max_queue_size=2, overflow_policy='drop_lowest_level', exit_timeout=None
+    )
+    release = Event()
+    with patch.object(handler.handler, 'send_messages', side_effect=lambda messages: release.wait(5)):
+        handler.handle(logging.makeLogRecord({'msg': 'first', 'levelno': logging.INFO}))
+        handler.handle(logging.makeLogRecord({'msg': 'second', 'levelno': logging.INFO}))
+        closing = Thread(target=handler.close, daemon=True)
+        closing.start()
+        deadline = time.monotonic() + 5
+        while handler.queue.qsize() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Sentinel of listener is not dropped for record with higher level
+        handler.handle(logging.makeLogRecord({'msg': 'error', 'levelno': logging.ERROR}))
+        release.set()
+        closing.join(5)
+    assert not closing.is_alive()
+    assert not handler.is_listening
+
+
+def test_suppress_duplicates():
+    handler = TelegramHandler(chat_ids, TOKEN, dedup_window=60)
+    record = logging.makeLogRecord({'msg': 'Error'})
+    with patch.object(handler, 'enqueue') as mock_enqueue:
+        handler.handle(record)
+        handler.handle(logging.makeLogRecord({'msg': 'Error'}))
+        assert mock_enqueue.call_count == 1
+        handler.dedup_filter.flush()
+        assert mock_enqueue.call_count == 2
+    handler.close()
+
+
+def test_spool(tmp_path):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+    record = logging.makeLogRecord({'msg': 'Error'})
+    expected_fragments = handler.handler.get_fragments(record)
+    with patch.object(handler.handler, 'send_messages') as mock_send:
+        handler.handle(record)
+        handler.close()
+    mock_send.assert_called_once_with(expected_fragments)
+    assert not hasattr(record, 'telegram_fragments')
+
+
+@pytest.mark.parametrize('sent', [True, False])
+def test_spool_keeps_batched_records_till_batch_is_sent(tmp_path, sent):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path, batch_size=10, batch_linger=60)
+    with patch.object(handler.handler, 'send_messages', return_value=sent) as mock_send:
+        handler.handle(logging.makeLogRecord({'msg': 'first'}))
+        handler.handle(logging.makeLogRecord({'msg': 'second'}))
+        handler._wait_queue(None)
+        # Records are in batch, they are not sent yet
+        assert mock_send.call_count == 0
+        assert handler.queue.bytes > 0
+        handler.close()
+    assert mock_send.call_count == 1
+    assert handler.queue.kept == (0 if sent else 2)
+    assert (handler.queue.bytes == 0) is sent
+
+
+def test_spool_is_sent_on_start(tmp_path):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+    handler.listener.stop()
+    handler.handle(logging.makeLogRecord({'msg': 'Error'}))
+    handler.queue.close()
+
+    with patch('telegram_logger.handlers.TelegramMessageHandler.send_messages') as mock_send:
+        handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+        handler.close()
+        assert mock_send.call_count == 1
+
+
+def test_spool_keeps_not_sent_records(tmp_path):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+    with patch.object(handler.handler, 'send_messages', return_value=False):
+        handler.handle(logging.makeLogRecord({'msg': 'Error'}))
+        handler.close()
+
+    send_messages = 'telegram_logger.handlers.TelegramMessageHandler.send_messages'
+    with patch(send_messages, return_value=True) as mock_send:
+        handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+        handler.close()
+    assert mock_send.call_count == 1
+    assert handler.queue.bytes == 0
+
+
+def test_close_twice():
+    handler = TelegramHandler(chat_ids, TOKEN)
+    handler.close()
+    handler.close()
+
+
+def test_flush_with_timeout():
+    handler = TelegramHandler(chat_ids, TOKEN)
+    release = Event()
+    with patch.object(handler.handler, 'send_messages', side_effect=lambda messages: release.wait(5)):
+        handler.handle(logging.makeLogRecord({'msg': 'Error'}))
+        assert handler.flush(timeout=0.05) is False
+        release.set()
+        assert handler.flush(timeout=5) is True
+    handler.close()
+
+
+def test_close_with_timeout_hands_over_records():
+    fallback = RecordingHandler()
+    handler = TelegramHandler(chat_ids, TOKEN, fallback_handler=fallback)
+    release = Event()
+    with patch.object(handler.handler, 'send_messages', side_effect=lambda messages: release.wait(5)):
+        for msg in ['first', 'second', 'third']:
+            handler.handle(logging.makeLogRecord({'msg': msg}))
+        start = time.monotonic()
+        handler.close(timeout=0.1)
+        assert time.monotonic() - start < 1
+        release.set()
+    # The first record is being sent when deadline comes
+    assert [record.msg for record in fallback.records] == ['second', 'third']
+    assert not handler.is_listening
+
+
+def test_flush_and_close_after_close_with_timeout(tmp_path):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+    release = Event()
+    with patch.object(handler.handler, 'send_messages', side_effect=lambda messages: release.wait(5)):
+        handler.handle(logging.makeLogRecord({'msg': 'first'}))
+        handler.close(timeout=0.1)
+        # logging.shutdown flushes and closes handler again at exit
+        with patch.object(handler.handler, 'close') as mock_close:
+            with patch.object(handler.queue, 'close') as mock_queue_close:
+                start = time.monotonic()
+                assert handler.flush() is False
+                handler.close()
+                assert time.monotonic() - start < 1
+        release.set()
+    assert mock_close.call_count == 0
+    assert mock_queue_close.call_count == 0
+
+
+def test_close_with_timeout_leaves_records_in_spool(tmp_path):
+    spool_path = str(tmp_path / 'spool.sqlite')
+    handler = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+    release = Event()
+    with patch.object(handler.handler, 'send_messages', side_effect=lambda messages: release.wait(5)):
+        handler.handle(logging.makeLogRecord({'msg': 'first'}))
+        handler.handle(logging.makeLogRecord({'msg': 'second'}))
+        handler.close(timeout=0.1)
+        # Both records are sent after restart, the first one was not finished
+        with patch('telegram_logger.handlers.TelegramMessageHandler.send_messages') as mock_send:
+            restarted = TelegramHandler(chat_ids, TOKEN, spool_path=spool_path)
+            restarted.close()
+        release.set()
+    assert mock_send.call_count == 2
+
+
+def test_close_at_exit():
+    with patch('atexit.register') as mock_register:
+        handler = TelegramHandler(chat_ids, TOKEN, exit_timeout=3)
+    mock_register.assert_called_once_with(handler.close_at_exit)
+    with patch.object(handler, 'close') as mock_close:
+        handler.close_at_exit()
+    mock_close.assert_called_once_with(3)
+    handler.close()
+    with patch('atexit.register') as mock_register:
+        handler = TelegramHandler(chat_ids, TOKEN, exit_timeout=None)
+    assert mock_register.call_count == 0
+    handler.close()
+
+
+def test_priority_queue():
+    handler = TelegramHandler(chat_ids, TOKEN, priority=True)
+    handler.listener.stop()
+    records = [('first', logging.WARNING), ('second', logging.WARNING), ('alert', logging.CRITICAL)]
+    for msg, levelno in records:
+        handler.handle(logging.makeLogRecord({'msg': msg, 'levelno': levelno}))
+    with patch.object(handler.handler, 'send_record') as mock_send:
+        handler.listener.start()
+        handler.close()
+    assert [call[0][0].msg for call in mock_send.call_args_list] == ['alert', 'first', 'second']
+
+
+def test_snapshot_prepare_mode():
+    handler = TelegramHandler(chat_ids, TOKEN, prepare_mode='snapshot')
+    handler.listener.stop()
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.LogRecord(
+            'test', logging.ERROR, __file__, 1, 'Error %s', ('arg',), sys.exc_info()
+        )
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert isinstance(queued, RecordSnapshot)
+    assert queued.getMessage() == 'Error arg'
+    assert 'ZeroDivisionError' in queued.exc_text
+    handler.queue.task_done()
+    handler.close()
+
+
+def test_unknown_prepare_mode():
+    with pytest.raises(ValueError):
+        TelegramHandler(chat_ids, TOKEN, prepare_mode='unknown', exit_timeout=None)
@@ -4,8 +4,15 @@ from telegram_logger.formatters import TelegramHtmlFormatter
 from tests.helpers import MockResponse
 
 from faker import Faker
+import gzip
+import json
 import logging
-from unittest.mock import patch
+import pytest
+import requests
+import sys
+from threading import Barrier
+import time
+from unittest.mock import patch, Mock
 
 
 fake = Faker()
@@ -24,7 +31,7 @@ def test_default_formatter():
 def test_send_message_got_error(caplog):
     response_text = 'Not Found'
     response_code = 404
-    with patch('telegram_logger.handlers.requests.post') as mock_post:
+    with patch.object(tg_handler.session, 'post') as mock_post:
         mock_post.return_value = MockResponse(status_code=response_code, text=response_text)
         tg_handler.send_message(1, 'lorem')
         assert str(response_code) in caplog.text
@@ -32,17 +39,58 @@ def test_send_message_got_error(caplog):
 
 
 @patch('telegram_logger.handlers.TelegramMessageHandler._process_response')
-@patch('telegram_logger.handlers.requests.post')
-def test_send_message_success(mock_post, mock_process):
+def test_send_message_success(mock_process):
     response_data = {'ok': True, 'message': fake.sentence()}
-    mock_post.return_value = MockResponse(status_code=200, json=response_data)
     chat_id = '1'
-    tg_handler.send_message(chat_id, 'lorem')
+    with patch.object(tg_handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=200, json=response_data)
+        tg_handler.send_message(chat_id, 'lorem')
     assert mock_process.call_count == 1
     assert response_data in list(mock_process.call_args)[0]
     assert chat_id in list(mock_process.call_args)[0]
 
 
+@pytest.mark.parametrize('status_code, sent', [(200, True), (400, True), (429, False), (500, False)])
+def test_send_message_reports_if_it_should_be_sent_again(status_code, sent):
+    handler = TelegramMessageHandler(chat_ids, TOKEN, retries=0)
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=status_code, json={'ok': status_code == 200})
+        assert handler.send_message(1, 'lorem') is sent
+    with patch.object(handler.session, 'post', side_effect=requests.ConnectionError):
+        assert handler.send_message(1, 'lorem') is False
+
+
+def test_session_keeps_connections_pool():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, pool_size=4, connection_retries=2)
+    adapter = handler.session.get_adapter(handler.url)
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.read == 0
+
+
+def test_session_proxies():
+    proxies = {'https': 'http://10.10.1.10:1080'}
+    handler = TelegramMessageHandler(chat_ids, TOKEN, proxies=proxies)
+    assert handler.session.proxies == proxies
+
+
+def test_request_proxies_override_environment(monkeypatch):
+    monkeypatch.setenv('HTTPS_PROXY', 'http://10.10.1.11:3128')
+    proxies = {'https': 'http://10.10.1.10:1080'}
+    handler = TelegramMessageHandler(chat_ids, TOKEN, proxies=proxies)
+    with patch.object(handler.session, 'send') as mock_send:
+        mock_send.return_value = MockResponse(status_code=200, json={'ok': True})
+        handler.send_message(1, 'lorem')
+    assert mock_send.call_args.kwargs['proxies']['https'] == proxies['https']
+
+
+def test_close_session():
+    handler = TelegramMessageHandler(chat_ids, TOKEN)
+    with patch.object(handler.session, 'close') as mock_close:
+        handler.close()
+        assert mock_close.call_count == 1
+
+
 def test__process_response_fail(caplog):
     chat_id = '1'
     response_data = {'ok': False, 'description': fake.sentence()}
@@ -66,7 +114,7 @@ def test_emit_when_no_formatter(mock_send, mock_format):
     handler = TelegramMessageHandler(chat_ids, TOKEN)
     handler.formatter = None
     handler.emit(record)
-    assert mock_format.call_count == len(chat_ids)
+    assert mock_format.call_count == 1
     assert mock_send.call_count == len(chat_ids)
     for chat_id, call in zip(chat_ids, mock_send.call_args_list):
         assert record in call.args
@@ -82,7 +130,7 @@ def test_emit_when_no_format_by_fragments(mock_send, mock_format):
     formatter = logging.Formatter()
     handler.setFormatter(formatter)
     handler.emit(record)
-    assert mock_format.call_count == len(chat_ids)
+    assert mock_format.call_count == 1
     assert mock_send.call_count == len(chat_ids)
     for chat_id, call in zip(chat_ids, mock_send.call_args_list):
         assert record in call.args
@@ -96,4 +144,258 @@ def test_emit_success(mock_send, mock_format, message_splits_on_3_fragments):
     mock_format.return_value = message_splits_on_3_fragments
     expected_fragments = tg_handler.formatter.format_by_fragments(record)
     tg_handler.handle(record)
-    assert mock_send.call_count == len(chat_ids)*len(expected_fragments)
\ No newline at end of file
+    assert mock_send.call_count == len(chat_ids)*len(expected_fragments)
+
+
+@patch('telegram_logger.handlers.TelegramMessageHandler.send_message')
+def test_emit_formats_record_once(mock_send):
+    record = logging.makeLogRecord({})
+    handler = TelegramMessageHandler(chat_ids, TOKEN)
+    with patch.object(handler.formatter, 'format_by_fragments') as mock_fragments:
+        mock_fragments.return_value = ['lorem']
+        handler.emit(record)
+        assert mock_fragments.call_count == 1
+    assert mock_send.call_count == len(chat_ids)
+
+
+def test_emit_to_chats_concurrently(message_splits_on_3_fragments):
+    record = logging.makeLogRecord({})
+    handler = TelegramMessageHandler(chat_ids, TOKEN, max_workers=len(chat_ids))
+    # Every chat waits others, so emit fails if chats are sent one by one
+    barrier = Barrier(len(chat_ids), timeout=5)
+    sent = {chat_id: [] for chat_id in chat_ids}
+
+    def send_message(chat_id, text):
+        if not sent[chat_id]:
+            barrier.wait()
+        sent[chat_id].append(text)
+
+    with patch('telegram_logger.formatters.TelegramHtmlFormatter.format') as mock_format:
+        mock_format.return_value = message_splits_on_3_fragments
+        expected_fragments = handler.formatter.format_by_fragments(record)
+        with patch.object(handler, 'send_message', side_effect=send_message):
+            handler.emit(record)
+    handler.close()
+    for chat_id in chat_ids:
+        assert sent[chat_id] == expected_fragments
+
+
+def test_emit_concurrently_handles_error():
+    record = logging.makeLogRecord({})
+    handler = TelegramMessageHandler(chat_ids, TOKEN, max_workers=2)
+    with patch.object(handler, 'send_message', side_effect=ConnectionError):
+        with pytest.raises(ConnectionError):
+            handler.send_messages(['lorem'])
+        # Error does not escape emit, so it does not stop listener thread
+        with patch.object(handler, 'handleError') as mock_handle_error:
+            handler.emit(record)
+    mock_handle_error.assert_called_once_with(record)
+    handler.close()
+
+
+def test_emit_message_with_lone_surrogate():
+    handler = TelegramMessageHandler(chat_ids, TOKEN)
+    handler.setFormatter(logging.Formatter())
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=200, json={'ok': True})
+        with patch.object(handler, 'handleError') as mock_handle_error:
+            handler.emit(logging.makeLogRecord({'msg': 'File \udcff.txt'}))
+    assert mock_handle_error.call_count == 0
+    assert json.loads(mock_post.call_args.kwargs['data'])['text'] == 'File ?.txt'
+
+
+def test_close_executor():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, max_workers=2)
+    with patch.object(handler.executor, 'shutdown') as mock_shutdown:
+        handler.close()
+        assert mock_shutdown.call_count == 1
+
+
+def test_emit_batch():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, batch_size=3, batch_linger=60)
+    handler.setFormatter(logging.Formatter())
+    with patch.object(handler, 'send_message') as mock_send:
+        for msg in ['first', 'second', 'third']:
+            handler.emit(logging.makeLogRecord({'msg': msg}))
+        assert mock_send.call_count == len(chat_ids)
+        for chat_id, call in zip(chat_ids, mock_send.call_args_list):
+            assert call.args == (chat_id, 'first\n\nsecond\n\nthird')
+
+
+def test_close_flushes_batch():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, batch_size=3, batch_linger=60)
+    with patch.object(handler, 'send_message') as mock_send:
+        handler.emit(logging.makeLogRecord({'msg': 'first'}))
+        handler.close()
+        assert mock_send.call_count == len(chat_ids)
+
+
+def test_send_message_waits_rate_limiter():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, rate_limit=True)
+    with patch.object(handler.rate_limiter, 'acquire') as mock_acquire:
+        with patch.object(handler.session, 'post') as mock_post:
+            mock_post.return_value = MockResponse(status_code=200, json={'ok': True})
+            handler.send_message(chat_ids[0], 'lorem')
+        mock_acquire.assert_called_once_with(chat_ids[0])
+
+
+def make_retry_handler():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, retries=2)
+    handler.retry_policy.sleep = Mock()
+    return handler
+
+
+def test_retry_too_many_requests():
+    handler = make_retry_handler()
+    too_many = MockResponse(status_code=429, json={'ok': False, 'parameters': {'retry_after': 7}})
+    ok = MockResponse(status_code=200, json={'ok': True})
+    with patch.object(handler.session, 'post', side_effect=[too_many, ok]) as mock_post:
+        handler.send_message(chat_ids[0], 'lorem')
+        assert mock_post.call_count == 2
+    handler.retry_policy.sleep.assert_called_once_with(7)
+    assert handler.retried == 1
+    assert handler.failed == 0
+
+
+def test_retry_server_error_till_max_retries(caplog):
+    handler = make_retry_handler()
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=502, text='Bad Gateway')
+        handler.send_message(chat_ids[0], 'lorem')
+        assert mock_post.call_count == 3
+    assert handler.retried == 2
+    assert handler.failed == 1
+    assert 'Bad Gateway' in caplog.text
+
+
+def test_not_retry_client_error():
+    handler = make_retry_handler()
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=403, text='Forbidden')
+        handler.send_message(chat_ids[0], 'lorem')
+        assert mock_post.call_count == 1
+    assert handler.retried == 0
+    assert handler.failed == 1
+
+
+def test_retry_connection_error(caplog):
+    handler = make_retry_handler()
+    with patch.object(handler.session, 'post', side_effect=requests.ConnectionError('refused')):
+        handler.send_message(chat_ids[0], 'lorem')
+    assert handler.retried == 2
+    assert handler.failed == 1
+    assert 'refused' in caplog.text
+
+
+def test_retry_does_not_delay_other_chats():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, retries=1)
+    too_many = MockResponse(status_code=429, json={'ok': False, 'parameters': {'retry_after': 0.2}})
+    responses = {chat_ids[0]: [too_many]}
+    posted = []
+
+    def post(url, data=None, **kwargs):
+        params = json.loads(data)
+        posted.append((params['chat_id'], params['text']))
+        chat_responses = responses.get(params['chat_id'])
+        return chat_responses.pop(0) if chat_responses else MockResponse(json={'ok': True})
+
+    with patch.object(handler.session, 'post', side_effect=post):
+        start = time.monotonic()
+        handler.emit(logging.makeLogRecord({'msg': 'first'}))
+        handler.emit(logging.makeLogRecord({'msg': 'second'}))
+        assert time.monotonic() - start < 0.2
+        # Other chats got both records, the first chat waits retry
+        for chat_id in chat_ids[1:]:
+            assert len([text for chat, text in posted if chat == chat_id]) == 2
+        assert handler.retry_scheduler.is_waiting(chat_ids[0])
+        assert handler.flush(5)
+    texts = [text for chat, text in posted if chat == chat_ids[0]]
+    assert len(texts) == 3
+    # Retry is sent before the next record
+    assert texts[0] == texts[1]
+    assert 'second' in texts[2]
+    assert handler.retried == 1
+    handler.close()
+
+
+@pytest.mark.parametrize('status_code, sent', [(200, True), (500, False)])
+def test_record_is_settled_after_retry(status_code, sent):
+    handler = TelegramMessageHandler([1], TOKEN, retries=1, retry_backoff=0.01)
+    record = logging.makeLogRecord({'msg': 'Error'})
+    record.telegram_settle = Mock()
+    responses = [MockResponse(status_code=500, text='Error'),
+                 MockResponse(status_code=status_code, json={'ok': True})]
+    with patch.object(handler.session, 'post', side_effect=responses):
+        handler.emit(record)
+        assert record.telegram_pending
+        assert handler.flush(5)
+    record.telegram_settle.assert_called_once_with(sent)
+    handler.close()
+
+
+def make_exc_record():
+    try:
+        raise ValueError('test')
+    except ValueError:
+        return logging.makeLogRecord({'msg': 'Error', 'exc_info': sys.exc_info()})
+
+
+def test_send_document_instead_of_fragments():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, document_threshold_fragments=1)
+    record = make_exc_record()
+    documents = []
+    with patch.object(handler.formatter, 'format_by_fragments', return_value=['1', '2']):
+        with patch.object(handler, 'send_message') as mock_send:
+            with patch.object(handler, 'send_document', side_effect=lambda *args: documents.append(
+                    (args[0], bytes(args[1]), args[2]))):
+                handler.emit(record)
+    text, document = handler.formatter.format_document(record)
+    assert mock_send.call_count == len(chat_ids)
+    for chat_id, call in zip(chat_ids, mock_send.call_args_list):
+        assert call.args == (chat_id, text)
+    filename = handler.get_document_filename(record)
+    assert documents == [(chat_id, document.encode('utf-8'), filename) for chat_id in chat_ids]
+
+
+def test_send_compressed_document():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, document_threshold_fragments=1,
+                                     document_compress=True)
+    record = make_exc_record()
+    documents = []
+    with patch.object(handler.formatter, 'format_by_fragments', return_value=['1', '2']):
+        with patch.object(handler, 'send_message'):
+            with patch.object(handler, 'send_document', side_effect=lambda chat_id, content, filename:
+                              documents.append(bytes(content))):
+                handler.emit(record)
+    assert handler.get_document_filename(record).endswith('.txt.gz')
+    assert gzip.decompress(documents[0]) == handler.formatter.format_document(record)[1].encode('utf-8')
+
+
+def test_send_fragments_below_threshold():
+    handler = TelegramMessageHandler(chat_ids, TOKEN, document_threshold_fragments=2)
+    with patch.object(handler.formatter, 'format_by_fragments', return_value=['1', '2']):
+        with patch.object(handler, 'send_message') as mock_send:
+            with patch.object(handler, 'send_document') as mock_document:
+                handler.emit(make_exc_record())
+    assert mock_send.call_count == 2 * len(chat_ids)
+    assert mock_document.call_count == 0
+
+
+def test_send_document_request():
+    handler = TelegramMessageHandler(chat_ids, TOKEN)
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=200, json={'ok': True})
+        handler.send_document(chat_ids[0], b'traceback', 'test.txt')
+    assert mock_post.call_args.args[0] == handler.get_url('sendDocument')
+    assert mock_post.call_args.kwargs['data'] == {'chat_id': chat_ids[0]}
+    assert mock_post.call_args.kwargs['files'] == {'document': ('test.txt', b'traceback')}
+
+
+def test_send_message_posts_precomputed_payload():
+    handler = TelegramMessageHandler(chat_ids, TOKEN)
+    with patch.object(handler.session, 'post') as mock_post:
+        mock_post.return_value = MockResponse(status_code=200, json={'ok': True})
+        handler.send_message(1, 'lorem')
+    kwargs = mock_post.call_args[1]
+    assert kwargs['headers'] == handler.JSON_HEADERS
+    assert json.loads(kwargs['data']) == {'chat_id': 1, 'text': 'lorem', 'parse_mode': 'html'}
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    ).stdout.decode().strip()
+
+
+def test_import_does_not_load_heavy_modules():
+    code = (
+        'import sys, telegram_logger\n'
+        'print(sorted(m for m in ("requests", "urllib3", "asyncio", "sqlite3", "socketserver") '
+        'if m in sys.modules))'
+    )
+    assert run_python(code) == '[]'
+
+
+def test_import_does_not_configure_root_logger():
+    code = 'import logging, telegram_logger\nprint(len(logging.getLogger().handlers))'
+    assert run_python(code) == '0'
+
+
+def test_lazy_handlers():
+    code = 'import telegram_logger\nprint(telegram_logger.AsyncTelegramHandler.__name__)'
+    assert run_python(code) == 'AsyncTelegramHandler'
+
+
+def test_configure_root_logger():
+    code = (
+        'import logging, telegram_logger\n'
+        'handler = telegram_logger.configure_root_logger()\n'
+        'print(logging.getLogger().handlers == [handler], logging.getLogger().level == logging.INFO)'
+    )
+    assert run_python(code) == 'True True'
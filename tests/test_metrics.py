@@ -0,0 +1,97 @@
+from telegram_logger.exporter import MetricsExporter
+from telegram_logger.handlers import TelegramHandler
+from telegram_logger.metrics import Histogram, Metrics, format_prometheus
+
+import logging
+import requests
+from unittest.mock import patch
+
+
+TOKEN = 'test-token'
+
+
+def test_histogram():
+    histogram = Histogram([1, 5])
+    for value in [0.5, 1, 3, 10]:
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'1': 2, '5': 3, '+Inf': 4}
+    assert snapshot['sum'] == 14.5
+    assert snapshot['count'] == 4
+
+
+def test_snapshot():
+    metrics = Metrics()
+    metrics.inc('sent', 2)
+    metrics.set_counter_function('dropped', lambda: 7)
+    metrics.set_gauge('queue_depth', lambda: 3)
+    metrics.observe('http_seconds', 0.02)
+    snapshot = metrics.snapshot()
+    assert snapshot['counters']['sent'] == 2
+    assert snapshot['counters']['dropped'] == 7
+    assert metrics.get('dropped') == 7
+    assert snapshot['gauges'] == {'queue_depth': 3}
+    assert snapshot['histograms']['http_seconds']['count'] == 1
+
+
+def test_format_prometheus():
+    first = Metrics({'handler': 'first'})
+    second = Metrics({'handler': 'se"cond'})
+    first.inc('sent')
+    first.set_gauge('queue_depth', lambda: 5)
+    first.observe('fragments_per_record', 2)
+    text = format_prometheus([first, second])
+    assert '# TYPE telegram_logger_sent_total counter' in text
+    assert 'telegram_logger_sent_total{handler="first"} 1' in text
+    assert 'telegram_logger_sent_total{handler="se\\"cond"} 0' in text
+    assert 'telegram_logger_queue_depth{handler="first"} 5' in text
+    assert 'telegram_logger_fragments_per_record_bucket{handler="first",le="1"} 0' in text
+    assert 'telegram_logger_fragments_per_record_bucket{handler="first",le="2"} 1' in text
+    assert 'telegram_logger_fragments_per_record_count{handler="first"} 1' in text
+    assert text.endswith('\n')
+
+
+def test_handler_metrics(fake_api):
+    handler = TelegramHandler([1, 2], TOKEN, api_url=fake_api.api_url, max_queue_size=1)
+    handler.listener.stop()
+    handler.handle(logging.makeLogRecord({'msg': 'first'}))
+    handler.handle(logging.makeLogRecord({'msg': 'second'}))
+    assert handler.metrics.snapshot()['gauges']['queue_depth'] == 1
+    handler.listener.start()
+    handler.close()
+    snapshot = handler.metrics.snapshot()
+    assert snapshot['counters']['enqueued'] == 1
+    assert snapshot['counters']['dropped'] == 1
+    # The first record and notice about dropped record are sent to two chats
+    assert snapshot['counters']['sent'] == 4
+    assert snapshot['counters']['failed'] == 0
+    assert snapshot['histograms']['fragments_per_record']['count'] == 2
+    assert snapshot['histograms']['enqueue_to_send_seconds']['count'] == 2
+    assert snapshot['histograms']['http_seconds']['count'] == 4
+    assert snapshot['gauges']['queue_depth'] == 0
+
+
+def test_exporter():
+    metrics = Metrics()
+    metrics.inc('sent')
+    exporter = MetricsExporter([metrics], port=0)
+    try:
+        url = 'http://{}:{}'.format(*exporter.server_address[:2])
+        response = requests.get(f'{url}/metrics')
+        assert response.status_code == 200
+        assert 'telegram_logger_sent_total 1' in response.text
+        assert response.headers['Content-Type'].startswith('text/plain')
+        assert requests.get(f'{url}/other').status_code == 404
+    finally:
+        exporter.stop()
+
+
+def test_priority_queue_wait():
+    handler = TelegramHandler([1], TOKEN, priority=True, metrics_labels={'handler': 'alerts'})
+    with patch.object(handler.handler, 'send_messages'):
+        handler.handle(logging.makeLogRecord({'msg': 'Error', 'levelno': logging.ERROR}))
+        handler.close()
+    snapshot = handler.metrics.snapshot()
+    assert snapshot['queue_wait_seconds']['ERROR']['count'] == 1
+    text = format_prometheus([handler.metrics])
+    assert 'telegram_logger_queue_wait_seconds_count{handler="alerts",level="ERROR"} 1' in text
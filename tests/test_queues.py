@@ -0,0 +1,251 @@
+from telegram_logger.queues import (
+    TelegramQueue, PriorityTelegramQueue, get_record_size,
+    DROP_NEWEST, DROP_OLDEST, DROP_LOWEST_LEVEL, BLOCK,
+)
+
+from tests.helpers import BaseTest
+
+import logging
+from queue import Full
+import pytest
+import threading
+
+
+def make_record(msg, levelno=logging.INFO):
+    return logging.makeLogRecord({'msg': msg, 'levelno': levelno})
+
+
+def get_all(queue):
+    records = []
+    while not queue.empty():
+        records.append(queue.get_nowait())
+        queue.task_done()
+    return records
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        TelegramQueue(1, overflow_policy='unknown')
+
+
+def test_drop_newest():
+    queue = TelegramQueue(2, overflow_policy=DROP_NEWEST)
+    first, second, third = make_record('1'), make_record('2'), make_record('3')
+    queue.put(first)
+    queue.put(second)
+    with pytest.raises(Full):
+        queue.put(third)
+    assert queue.dropped == 1
+    assert get_all(queue) == [first, second]
+
+
+def test_drop_oldest():
+    queue = TelegramQueue(2, overflow_policy=DROP_OLDEST)
+    first, second, third = make_record('1'), make_record('2'), make_record('3')
+    queue.put(first)
+    queue.put(second)
+    queue.put(third)
+    assert queue.dropped == 1
+    assert get_all(queue) == [second, third]
+
+
+def test_drop_lowest_level():
+    queue = TelegramQueue(2, overflow_policy=DROP_LOWEST_LEVEL)
+    error = make_record('error', logging.ERROR)
+    info = make_record('info', logging.INFO)
+    warning = make_record('warning', logging.WARNING)
+    debug = make_record('debug', logging.DEBUG)
+    queue.put(error)
+    queue.put(info)
+    queue.put(warning)
+    with pytest.raises(Full):
+        queue.put(debug)
+    assert queue.dropped == 2
+    assert get_all(queue) == [error, warning]
+
+
+def test_block_till_timeout():
+    queue = TelegramQueue(1, overflow_policy=BLOCK, block_timeout=0.01)
+    queue.put(make_record('1'))
+    with pytest.raises(Full):
+        queue.put(make_record('2'))
+    assert queue.dropped == 1
+
+
+def test_block_till_free_place():
+    queue = TelegramQueue(1, overflow_policy=BLOCK, block_timeout=5)
+    first, second = make_record('1'), make_record('2')
+    queue.put(first)
+    timer = threading.Timer(0.01, queue.get)
+    timer.start()
+    queue.put(second)
+    timer.join()
+    assert queue.dropped == 0
+    assert queue.get_nowait() == second
+
+
+def test_max_bytes():
+    record = make_record('1')
+    size = get_record_size(record)
+    queue = TelegramQueue(max_bytes=size * 2, overflow_policy=DROP_NEWEST)
+    queue.put(record)
+    queue.put(make_record('2'))
+    with pytest.raises(Full):
+        queue.put(make_record('3'))
+    assert queue.bytes <= size * 2
+    queue.get_nowait()
+    assert queue.bytes < size * 2
+
+
+def test_empty_queue_takes_big_record():
+    queue = TelegramQueue(max_bytes=1)
+    queue.put(make_record('1'))
+    assert queue.qsize() == 1
+
+
+def test_record_size_counts_traceback():
+    test = BaseTest()
+    test.setup()
+    record = test.create_record()
+    assert get_record_size(record) > get_record_size(test.create_record({'exc_info': None}))
+
+
+def test_sentinel_is_not_dropped():
+    queue = TelegramQueue(1)
+    queue.put(make_record('1'))
+    queue.put(None)
+    assert queue.qsize() == 2
+
+
+@pytest.mark.parametrize('overflow_policy', [DROP_OLDEST, DROP_LOWEST_LEVEL])
+def test_sentinel_is_not_dropped_by_policy(overflow_policy):
+    queue = TelegramQueue(2, overflow_policy=overflow_policy)
+    info = make_record('info')
+    queue.put(info)
+    queue.put(None)
+    error = make_record('error', logging.ERROR)
+    # Sentinel takes no place, so there is place for error
+    queue.put(error)
+    assert queue.dropped == 0
+    critical = make_record('critical', logging.CRITICAL)
+    queue.put(critical)
+    assert queue.dropped == 1
+    assert get_all(queue) == [error, critical, None]
+
+
+def test_dropped_records_do_not_block_join():
+    queue = TelegramQueue(1, overflow_policy=DROP_OLDEST)
+    queue.put(make_record('1'))
+    queue.put(make_record('2'))
+    queue.get_nowait()
+    queue.task_done()
+    queue.join()
+
+
+def test_notice_when_queue_has_place():
+    queue = TelegramQueue(2, overflow_policy=DROP_NEWEST, notice_factory=lambda count: count)
+    for msg in range(4):
+        try:
+            queue.put(make_record(str(msg)))
+        except Full:
+            pass
+    queue.get_nowait()
+    queue.get_nowait()
+    record = make_record('after')
+    queue.put(record)
+    assert get_all(queue) == [2, record]
+    queue.put(make_record('next'))
+    assert queue.qsize() == 1
+
+
+def test_notice_when_record_is_taken():
+    queue = TelegramQueue(2, overflow_policy=DROP_NEWEST, notice_factory=lambda count: count)
+    records = [make_record(str(msg)) for msg in range(4)]
+    for record in records:
+        try:
+            queue.put(record)
+        except Full:
+            pass
+    # Nothing is logged after drops, notice is put when listener frees place
+    assert get_all(queue) == [records[0], records[1], 2]
+    assert queue.dropped == 2
+
+
+def test_notice_before_sentinel():
+    queue = TelegramQueue(1, overflow_policy=DROP_NEWEST, notice_factory=lambda count: count)
+    record = make_record('1')
+    queue.put(record)
+    with pytest.raises(Full):
+        queue.put(make_record('2'))
+    queue.put(None)
+    assert get_all(queue) == [record, 1, None]
+    queue.join()
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_priority_queue_order():
+    queue = PriorityTelegramQueue()
+    records = [
+        make_record('info 1'), make_record('error 1', logging.ERROR), make_record('info 2'),
+        make_record('critical', logging.CRITICAL), make_record('error 2', logging.ERROR),
+    ]
+    for record in records:
+        queue.put(record)
+    expected = ['critical', 'error 1', 'error 2', 'info 1', 'info 2']
+    assert [record.msg for record in get_all(queue)] == expected
+
+
+def test_priority_queue_sentinel_is_last():
+    queue = PriorityTelegramQueue()
+    queue.put(make_record('info'))
+    queue.put(None)
+    queue.put(make_record('error', logging.ERROR))
+    assert queue.qsize() == 3
+    assert [getattr(record, 'msg', None) for record in get_all(queue)] == ['error', 'info', None]
+
+
+def test_priority_queue_max_delay():
+    clock = FakeClock()
+    waits = []
+    queue = PriorityTelegramQueue(
+        max_delay=10, clock=clock, wait_observer=lambda levelno, wait: waits.append((levelno, wait))
+    )
+    queue.put(make_record('info'))
+    clock.now = 5
+    queue.put(make_record('error 1', logging.ERROR))
+    queue.put(make_record('error 2', logging.ERROR))
+    assert queue.get_nowait().msg == 'error 1'
+    clock.now = 11
+    # Info waits longer than max_delay, so it overtakes errors
+    assert queue.get_nowait().msg == 'info'
+    assert queue.get_nowait().msg == 'error 2'
+    assert waits == [(logging.ERROR, 0), (logging.INFO, 11), (logging.ERROR, 6)]
+
+
+def test_priority_queue_drop_oldest():
+    queue = PriorityTelegramQueue(2, overflow_policy=DROP_OLDEST)
+    queue.put(make_record('error', logging.ERROR))
+    queue.put(make_record('info'))
+    queue.put(make_record('warning', logging.WARNING))
+    assert queue.dropped == 1
+    assert [record.msg for record in get_all(queue)] == ['warning', 'info']
+
+
+def test_priority_queue_drop_lowest_level():
+    queue = PriorityTelegramQueue(2, overflow_policy=DROP_LOWEST_LEVEL)
+    queue.put(make_record('info'))
+    queue.put(make_record('error 1', logging.ERROR))
+    queue.put(make_record('error 2', logging.ERROR))
+    with pytest.raises(Full):
+        queue.put(make_record('warning', logging.WARNING))
+    assert queue.dropped == 2
+    assert queue.unfinished_tasks == 2
+    assert [record.msg for record in get_all(queue)] == ['error 1', 'error 2']
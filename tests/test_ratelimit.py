@@ -0,0 +1,84 @@
+from telegram_logger.ratelimit import TokenBucket, RateLimiter
+
+
+class FakeClock(object):
+    """
+    Clock which moves forward only when sleep is called.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_bucket_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_bucket_waits_token():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_bucket_refills_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 100
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 1
+
+
+def test_reservations_are_queued():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 1
+    assert bucket.reserve() == 2
+
+
+def test_limiter_chat_limit():
+    clock = FakeClock()
+    limiter = RateLimiter(global_rate=100, global_burst=100, chat_rate=1, chat_burst=1,
+                          clock=clock, sleep=clock.sleep)
+    limiter.acquire(1)
+    limiter.acquire(2)
+    assert clock.sleeps == []
+    limiter.acquire(1)
+    assert clock.sleeps == [1]
+
+
+def test_limiter_global_limit():
+    clock = FakeClock()
+    limiter = RateLimiter(global_rate=1, global_burst=2, chat_rate=100, chat_burst=100,
+                          clock=clock, sleep=clock.sleep)
+    for chat_id in range(3):
+        limiter.acquire(chat_id)
+    assert clock.sleeps == [1]
+
+
+def test_bucket_try_take():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0.5
+    # Token is not taken, so waiting time doesn't grow
+    assert bucket.try_take() == 0.5
+    clock.sleep(0.5)
+    assert bucket.try_take() == 0
@@ -0,0 +1,72 @@
+from telegram_logger.retry import Delivery, RetryPolicy, RetryScheduler
+
+import pytest
+import threading
+
+
+@pytest.mark.parametrize('status_code', [429, 500, 502, 503, 504])
+def test_should_retry(status_code):
+    assert RetryPolicy().should_retry(status_code)
+
+
+@pytest.mark.parametrize('status_code', [400, 401, 403, 404])
+def test_should_not_retry(status_code):
+    assert not RetryPolicy().should_retry(status_code)
+
+
+def test_exponential_delay():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+    assert [policy.get_delay(attempt) for attempt in range(4)] == [1, 2, 4, 5]
+
+
+def test_jitter():
+    policy = RetryPolicy(backoff_factor=1, random=lambda: 0)
+    assert policy.get_delay(1) == 1
+    policy = RetryPolicy(backoff_factor=1, random=lambda: 0.999)
+    assert 1 < policy.get_delay(1) < 2
+
+
+def test_retry_after():
+    policy = RetryPolicy(backoff_factor=1)
+    assert policy.get_delay(0, retry_after=17) == 17
+
+
+def test_delivery_reports_when_deferred_requests_are_finished():
+    results = []
+    delivery = Delivery(results.append)
+    delivery.defer()
+    delivery.finish(True)
+    assert results == []
+    delivery.finish(False)
+    assert results == [False]
+
+
+def test_scheduler_keeps_order_in_chat():
+    scheduler = RetryScheduler()
+    attempts = []
+
+    def make_attempt(name, delays):
+        def attempt(number):
+            attempts.append((name, number))
+            return delays.pop(0) if delays else None
+        return attempt
+
+    scheduler.schedule(1, make_attempt('first', [0.01]), 1, 0.01)
+    scheduler.schedule(1, make_attempt('second', []))
+    assert scheduler.is_waiting(1)
+    assert scheduler.join(5)
+    assert attempts == [('first', 1), ('first', 2), ('second', 0)]
+    assert not scheduler.is_waiting(1)
+    scheduler.stop()
+
+
+def test_scheduler_does_not_delay_other_chats():
+    scheduler = RetryScheduler()
+    sent = threading.Event()
+    scheduler.schedule(1, lambda number: None, 1, 60)
+    scheduler.schedule(2, lambda number: sent.set())
+    assert sent.wait(5)
+    assert scheduler.is_waiting(1)
+    assert scheduler.qsize() == 1
+    assert scheduler.join(0.01) is False
+    scheduler.stop()
@@ -0,0 +1,71 @@
+from telegram_logger.formatters import TelegramHtmlFormatter, get_exception_fingerprint
+from telegram_logger.queues import get_record_size
+from telegram_logger.snapshot import RecordSnapshot
+from tests.helpers import BaseTest
+
+import gc
+import logging
+import sys
+import weakref
+
+
+class Payload(object):
+    pass
+
+
+class TestRecordSnapshot(BaseTest):
+
+    def setup_method(self):
+        self.setup()
+
+    def test_snapshot_keeps_rendered_message(self):
+        record = self.create_record({'msg': 'Error %s', 'args': ('value',), 'exc_info': None})
+        snapshot = RecordSnapshot(record)
+        assert snapshot.getMessage() == 'Error value'
+        assert snapshot.args is None
+        assert snapshot.exc_text is None
+        assert (snapshot.name, snapshot.funcName, snapshot.created) == (
+            record.name, record.funcName, record.created
+        )
+
+    def test_snapshot_renders_exception(self):
+        record = self.create_record()
+        snapshot = RecordSnapshot(record)
+        assert snapshot.exc_info is None
+        assert snapshot.exc_text == logging.Formatter().formatException(record.exc_info)
+        assert snapshot.exc_fingerprint == get_exception_fingerprint(record.exc_info)
+
+    def test_snapshot_releases_frames_and_extras(self):
+        payload = Payload()
+        ref = weakref.ref(payload)
+
+        def fail(payload):
+            raise ValueError('fail')
+
+        try:
+            fail(payload)
+        except ValueError:
+            record = logging.LogRecord('test', logging.ERROR, __file__, 1, 'msg', None, sys.exc_info())
+        record.payload = payload
+        snapshot = RecordSnapshot(record)
+        del record, payload
+        gc.collect()
+        assert ref() is None
+        assert 'ValueError: fail' in snapshot.exc_text
+        assert not hasattr(snapshot, 'payload')
+
+    def test_format_snapshot_like_record(self):
+        record = self.create_record()
+        formatter = TelegramHtmlFormatter()
+        expected = formatter.format_by_fragments(record)
+        assert TelegramHtmlFormatter().format_by_fragments(RecordSnapshot(record)) == expected
+
+    def test_format_snapshot_by_format_string(self):
+        record = self.create_record({'msg': 'Error %s', 'args': (1,)})
+        formatter = logging.Formatter('%(name)s %(funcName)s %(message)s')
+        assert formatter.format(RecordSnapshot(record)) == formatter.format(record)
+
+    def test_snapshot_is_smaller(self):
+        record = self.create_record({'msg': 'Error %s', 'args': ('x' * 1000,)})
+        record.extra = 'y' * 10000
+        assert get_record_size(RecordSnapshot(record)) < get_record_size(record)
@@ -0,0 +1,170 @@
+from telegram_logger.spool import SpoolQueue, serialize_record, deserialize_record
+
+import logging
+import pytest
+
+
+def make_record(msg, fragments=None):
+    record = logging.makeLogRecord({'msg': msg, 'levelno': logging.ERROR, 'levelname': 'ERROR'})
+    record.telegram_fragments = fragments or [msg]
+    return record
+
+
+@pytest.fixture()
+def spool_path(tmp_path):
+    return str(tmp_path / 'spool.sqlite')
+
+
+def test_serialize_record():
+    record = make_record('Error %s', ['first', 'second'])
+    record.args = (1,)
+    restored = deserialize_record(serialize_record(record))
+    assert restored.getMessage() == 'Error 1'
+    assert restored.telegram_fragments == ['first', 'second']
+    assert restored.levelno == logging.ERROR
+    assert restored.name == record.name
+
+
+def test_serialize_lone_surrogate():
+    restored = deserialize_record(serialize_record(make_record('File \udcff.txt')))
+    assert restored.telegram_fragments == ['File ?.txt']
+
+
+def test_put_and_get(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.put(make_record('second'))
+    assert spool.qsize() == 2
+    assert spool.get_nowait().telegram_fragments == ['first']
+    assert spool.get_nowait().telegram_fragments == ['second']
+    assert spool.empty()
+    spool.close()
+
+
+def test_records_survive_restart(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.put(make_record('second'))
+    spool.close()
+
+    spool = SpoolQueue(spool_path)
+    assert spool.qsize() == 2
+    assert spool.unfinished_tasks == 2
+    assert spool.get_nowait().telegram_fragments == ['first']
+    spool.close()
+
+
+def test_processed_records_are_removed(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.put(make_record('second'))
+    spool.get_nowait()
+    spool.task_done()
+    spool.get_nowait()
+    spool.close()
+
+    # The second record was taken but not processed, so it is sent again
+    spool = SpoolQueue(spool_path)
+    assert spool.qsize() == 1
+    assert spool.get_nowait().telegram_fragments == ['second']
+    spool.task_done()
+    spool.join()
+    assert spool.bytes == 0
+    spool.close()
+
+
+def test_max_bytes(spool_path):
+    size = len(serialize_record(make_record('first')))
+    spool = SpoolQueue(spool_path, max_bytes=size + 1)
+    for msg in ['first', 'second', 'third']:
+        spool.put(make_record(msg))
+    # Only the last record fits, the oldest ones are dropped
+    assert spool.dropped == 2
+    assert spool.qsize() == 1
+    assert spool.unfinished_tasks == 1
+    assert spool.get_nowait().telegram_fragments == ['third']
+    spool.close()
+
+
+def test_sentinel_after_records(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.put(None)
+    assert spool.get_nowait().telegram_fragments == ['first']
+    spool.task_done()
+    assert spool.get_nowait() is None
+    spool.task_done()
+    spool.join()
+    spool.close()
+
+
+def test_failed_record_is_kept(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.get_nowait().telegram_failed = True
+    spool.task_done()
+    spool.join()
+    assert spool.kept == 1
+    spool.close()
+
+    # Record which was not sent is left for the next run
+    spool = SpoolQueue(spool_path)
+    assert spool.qsize() == 1
+    assert spool.get_nowait().telegram_fragments == ['first']
+    spool.task_done()
+    assert spool.bytes == 0
+    spool.close()
+
+
+def test_failed_record_is_taken_again_when_record_is_sent(spool_path):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    spool.put(make_record('second'))
+    spool.put(make_record('third'))
+    spool.get_nowait().telegram_failed = True
+    spool.task_done()
+    assert spool.kept == 1
+    assert spool.qsize() == 2
+    # Telegram is available again, failed record is taken before new ones
+    assert spool.get_nowait().telegram_fragments == ['second']
+    spool.task_done()
+    assert spool.kept == 0
+    assert spool.qsize() == 2
+    assert [spool.get_nowait().telegram_fragments for _ in range(2)] == [['first'], ['third']]
+    spool.task_done()
+    spool.task_done()
+    spool.join()
+    assert spool.bytes == 0
+    spool.close()
+
+
+@pytest.mark.parametrize('sent', [True, False])
+def test_pending_record_is_settled(spool_path, sent):
+    spool = SpoolQueue(spool_path)
+    spool.put(make_record('first'))
+    record = spool.get_nowait()
+    record.telegram_pending = True
+    spool.task_done()
+    # Record is not removed till handler reports result of sending
+    assert spool.bytes > 0
+    assert spool.kept == 0
+    record.telegram_settle(sent)
+    assert spool.kept == (0 if sent else 1)
+    assert (spool.bytes == 0) is sent
+    spool.close()
+
+
+def test_max_bytes_drops_kept_records_first(spool_path):
+    records = [make_record(msg) for msg in ['first', 'second', 'third']]
+    max_bytes = sum(len(serialize_record(record)) for record in records[1:])
+    spool = SpoolQueue(spool_path, max_bytes=max_bytes)
+    spool.put(records[0])
+    spool.get_nowait().telegram_failed = True
+    spool.task_done()
+    spool.put(records[1])
+    spool.put(records[2])
+    # Record left for the next run is dropped instead of new ones
+    assert spool.dropped == 1
+    assert spool.kept == 0
+    assert spool.qsize() == 2
+    spool.close()